@@ -11,14 +11,12 @@ import subprocess
             'pandas<=1.1.5',
             'matplotlib<=3.7.1',
             'adjusttext==0.7.3',
-            'requests<=2.28.2',
-            'sklearn==0.0']'''
+            'requests<=2.28.2']'''
 packages = ['numpy',
             'scipy',
             'astropy',
             'matplotlib',
             'requests',
-            'sklearn==0.0',
             'pandas<=1.1.5',
             'adjusttext==0.7.3',
             ]
@@ -29,6 +29,8 @@ configStartSettings['Judgement - Extinction Map'] = {
     'Interpolate Area': 'Local',
     '# = Interpolation Method: How the interpolation should be done. Valid values include nearest, linear, cubic': '',
     'Interpolation Method': 'linear',
+    '# = Interpolation Border Width: How many pixels of valid data around each interpolated region are used as the interpolation input. 0 uses every valid pixel in the interpolated area. A border (such as 2) is much faster on large maps, but on a regular pixel grid the triangulation can break ties differently, moving some interpolated values slightly.': '',
+    'Interpolation Border Width': 0,
 }
 configStartSettings['Judgement - Off Points Av Threshold'] = {
     'Off-Disk Latitude': 15.,
@@ -53,6 +55,11 @@ configStartSettings['Judgement - Optimal Reference Points'] = {
     'Find Optimal Reference Points': True,
     'Minimum Reference Points to be Selected': 5,
     'Max Fraction Reference Points': 1,
+    '# = Stability Threshold Mode: How the thresholds of the stability trend algorithm are chosen. Sampled evaluates Number of Stability Thresholds evenly spaced thresholds and takes the most common result. Exact evaluates every threshold at which the result changes and takes the result given by the widest range of thresholds. Valid values include Sampled, Exact': '',
+    'Stability Threshold Mode': 'Sampled',
+    'Number of Stability Thresholds': 500,
+    '# = Reference Point Search: How the reference points are chosen from the filtered points. Prefix takes the optimal number of points in order of extinction, then more points until the quadrants are sampled. Standard Error searches for the points, meeting the minimum number of reference points and of points per quadrant, with the smallest reference RM standard error. Valid values include Prefix, Standard Error': '',
+    'Reference Point Search': 'Prefix',
 }
 configStartSettings['Judgement - Cloud Quadrant Sampling'] = {
     'Use Minimum Quadrant Sampling': False,
@@ -68,13 +75,25 @@ configStartSettings['Judgement - Magnetic Field Calculations'] = {
     'Negative Scaled Extinction Data': 'Delete'
 }
 configStartSettings['Judgement - Uncertainty Calculations'] = {
-    'Use Nans in Uncertainty Calculations': False
+    'Use Nans in Uncertainty Calculations': False,
+    '# = Use Bootstrap Reference Point Uncertainty: Whether 04 also finds the uncertainty of each BLOS value due to the choice of reference points, by resampling the chosen reference points with replacement.': '',
+    'Use Bootstrap Reference Point Uncertainty': True,
+    'Number of Bootstrap Samples': 2000,
+    '# = Bootstrap Confidence Interval: The width of the bootstrap percentile intervals, in percent.': '',
+    'Bootstrap Confidence Interval': 95,
+    '# = Bootstrap Seed: The seed of the random number generator, so that reruns draw the same samples.': '',
+    'Bootstrap Seed': 0
 }
 
 configStartSettings['Judgement - User Judgement'] = {
     'Use Manual User Selection of Reference Points': False
 }
 
+configStartSettings['Judgement - Threshold Sweep'] = {
+    '# = Extinction Thresholds: The comma separated extinction thresholds that 03d evaluates the reference points for. Multiples of the average extinction if Multiply with Average Extinction is True.': '',
+    'Extinction Thresholds': '0.5, 0.75, 1.0, 1.25, 1.5, 1.75, 2.0, 2.5, 3.0'
+}
+
 configStartSettings['Plotting Options'] = {
     'Adjust Text Positions': True,
 
@@ -91,6 +110,14 @@ configStartSettings['Plotting Options'] = {
     'Bar Plot Single Bar Width Multiplier (>1.0 allows bars to overlap)': 4.0,
 
 }
+configStartSettings['Performance Options'] = {
+    '# = Number of Worker Processes: How many processes to spread the costly steps over. 0 uses one per available core.': '',
+    'Number of Worker Processes': 0,
+    '# = RM Matching Chunk Size: How many rows of the catalogue are read, matched and stored as one unit of work. Rotation measures already stored are not matched again.': '',
+    'RM Matching Chunk Size': 10000,
+    '# = Stability Trend Cache Size (MB): How much disk space the stability trend data of earlier runs may take. It is reused when 03b is rerun with the same points, abundance data and negative scaled extinction option. 0 disables the cache.': '',
+    'Stability Trend Cache Size (MB)': 256,
+}
 configStartSettings['Data Presentation'] = {
     '# = What to separate data with. In a csv this is usually \',\'.': '',
     'Separator': '\\t',
@@ -122,25 +149,26 @@ configDirectoryAndNames['Output Directories'] = {
 }
 configDirectoryAndNames['Output Files - Point Matching'] = {
     'RM Map': 'RMMap.png',
-    'Matched RM-Extinction': 'MatchedRMExtinction.csv'
+    'Matched RM-Extinction': 'MatchedRMExtinction.csv',
+    'Matched RM-Extinction Store': 'MatchedRMExtinctionStore',
+    '# = Matched RM-Extinction Changes: A report of the ID#s added, updated and removed by the latest matching run, for the user to review. No later stage reads it; they all read the full matched table.': '',
+    'Matched RM-Extinction Changes': 'MatchedRMExtinctionChanges.csv'
 }
 configDirectoryAndNames['Output Files - Point Filtering'] = {
     'Region Threshold Data': 'RegionThresholdData.csv',
-    'Rejected Near High-Extinction RM-Extinction': 'NearHighExtRej.csv',
-    'Rejected Far High-Extinction RM-Extinction': 'FarHighExtRej.csv',
-    'Rejected Anomalous RM-Extinction': 'AnomRej.csv',
-    'Rejected RM-Extinction': 'Rejected.csv',
-    'Filtered RM-Extinction': 'FilteredPotRefPoints.csv',
 }
 configDirectoryAndNames['Output Files - Reference Points'] = {
     'All Potential Reference Points': 'AllPotentialRefPoints.csv',
     'Selected Reference Points': 'SelectedRefPoints.csv',
     'Quadrant Division Data': 'QuadrantDivisionData.csv',
     'Stability Trend Reference Points': 'TrendDataTable.csv',
+    'Stability Trend Cache': 'StabilityTrendCache',
     'Optimal Reference Points Stability Plot': 'BLOS_vs_NRef_AllPotentialRefPoints.png',
     'Chosen Reference Points Stability Plot': 'BLOS_vs_NRef_ChosenRefPoints.png',
     'Potential Reference Points Quadrant Plot': 'QuadrantDivisionPlot.png',
-    'Reference Data': 'ReferenceData.csv'
+    'Reference Data': 'ReferenceData.csv',
+    'Reference Point Influence': 'ReferencePointInfluence.csv',
+    'Threshold Sweep Data': 'ThresholdSweepData.csv'
 }
 configDirectoryAndNames['Output Files - Reference Point Plot Titles'] = {
     'All Matched RM-Extinction Points': 'All RM Points in the Region with ID',
@@ -178,6 +206,7 @@ configDirectoryAndNames['Output Files - BLOS Final'] = {
     'BLOS Point Data': 'BLOSPoints.csv',
     'BLOS Point Figure': 'BLOSPointMap.png',
     'BLOS Uncertainties': 'FinalBLOSResults.csv',
+    'BLOS Bootstrap Intervals': 'BLOSBootstrapIntervals.csv',
 }
 configDirectoryAndNames['Output Files - Logs'] = {
     '01': '01.txt',
@@ -186,6 +215,7 @@ configDirectoryAndNames['Output Files - Logs'] = {
     '03a': '03a.txt',
     '03b': '03b.txt',
     '03c': '03c.txt',
+    '03d': '03d.txt',
     '04': '04.txt',
     '05a': '05a.txt',
     '05b': '05b.txt',
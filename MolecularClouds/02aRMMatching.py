@@ -4,7 +4,7 @@ an extinction value from the fits file. Matching is based on physical proximity.
 
 The matched rotation measure data and extinction information are saved in a file.
 """
-from itertools import zip_longest
+import collections
 
 import numpy as np
 import pandas as pd
@@ -14,11 +14,13 @@ from matplotlib import pyplot as plt
 
 import LocalLibraries.BoxBounds as bb
 import LocalLibraries.InterpLibrary as IL
-from LocalLibraries.RMCatalog import RMCatalog
+import LocalLibraries.MatchStoreLib as MSL
+import LocalLibraries.ParallelLib as PL
+import LocalLibraries.RMMatchingLib as RML
+from LocalLibraries.RMCatalog import readRMCatalogChunks
 from LocalLibraries.RegionOfInterest import Region
 import LocalLibraries.config as config
 
-import LocalLibraries.ConversionLibrary as cl
 import LocalLibraries.RefJudgeLib as rjl
 
 import logging
@@ -31,6 +33,9 @@ regionOfInterest = Region(cloudName)
 # -------- DEFINE FILES AND PATHS --------
 RMCatalogFile = config.DataRMCatalogFile
 MatchedRMExtinctFile = config.MatchedRMExtinctionFile
+MatchedRMExtinctStoreDir = config.MatchedRMExtinctionStoreDir
+MatchedRMExtinctChangesFile = config.MatchedRMExtinctionChangesFile
+QuadDivDataFile = config.QuadDivDataFile
 scriptLogFile = config.Script02aFile
 # -------- DEFINE FILES AND PATHS. --------
 
@@ -50,7 +55,7 @@ xmin, xmax, ymin, ymax = regionOfInterest.xmin, regionOfInterest.xmax, regionOfI
 nodata = np.isnan(data)
 
 # Set default data values for missing data within the bounds.
-data[ymin:ymax, xmin:xmax] = IL.fillMissing(data[ymin:ymax, xmin:xmax], config.fillMissingExtinct, config.interpMethod)
+data[ymin:ymax, xmin:xmax] = IL.fillMissing(data[ymin:ymax, xmin:xmax], config.fillMissingExtinct, config.interpMethod, config.interpBorderWidth)
 
 #Refresh the nodata situation depending on config decision on whether or not filled values can be used for matching.
 if config.useFillExtinct:
@@ -65,7 +70,7 @@ data[baddata] = math.nan
 
 # Handle bad data (negative/no values) by full fits-file interpolation, if turned on.
 if config.doInterpExtinct and config.interpRegion == 'All':
-    data[ymin:ymax, xmin:xmax] = IL.interpMask(data[ymin:ymax, xmin:xmax], baddata[ymin:ymax, xmin:xmax], config.interpMethod) #This step is computationally costly. It may be omitted if it is taking too long.
+    data[ymin:ymax, xmin:xmax] = IL.interpMask(data[ymin:ymax, xmin:xmax], baddata[ymin:ymax, xmin:xmax], config.interpMethod, borderWidth=config.interpBorderWidth) #This step is computationally costly. It may be omitted if it is taking too long.
     baddata[ymin:ymax, xmin:xmax] = False
 
 messages = ["The Region Fits File Data Type is: {}".format(regionOfInterest.fitsDataType),
@@ -77,22 +82,162 @@ messages = ["The Region Fits File Data Type is: {}".format(regionOfInterest.fits
             "Missing (Nan) data is set to (according to the config): {}".format(config.fillMissingExtinct),
             "Missing (Nan) data is used for matching RM Extinctions (according to the config): {}".format(config.useFillExtinct),
             "Non-Physical (Negative) data is to be interpolated (according to the config): {}".format(config.doInterpExtinct),
-            "Non-Physical (Negative) data is to be interpolated (according to the config): {}".format(config.interpMethod)]
+            "Non-Physical (Negative) data is to be interpolated (according to the config): {}".format(config.interpMethod),
+            "Interpolation uses a border of this many valid pixels around the interpolated data (according to the config): {}".format(config.interpBorderWidth)]
 
 logging.info(loggingDivider)
 for message in messages:
     logging.info(message)
 # -------- PREPROCESS FITS DATA TYPE. --------
 
-# -------- READ ROTATION MEASURE FILE --------
-# Get all the rm points within the region of interest
-rmData = RMCatalog(RMCatalogFile, regionOfInterest.raHoursMax, regionOfInterest.raMinsMax, regionOfInterest.raSecMax,
-                   regionOfInterest.raHoursMin, regionOfInterest.raMinsMin, regionOfInterest.raSecMin,
-                   regionOfInterest.decDegMax, regionOfInterest.decDegMin)
-# -------- READ ROTATION MEASURE FILE. --------
+# -------- DEFINE THE ERROR RANGE --------
+# The physical limit on how far an extinction value can be from the rm and still be considered valid/applicable
+# Uncertainty based, for each rotation measure from its own positional uncertainty (see RML.getSearchBoxSizes).
+ExtinctionResolutionDegs = min(abs(regionOfInterest.hdu.header['CDELT1']), abs(regionOfInterest.hdu.header['CDELT2'])) #deg
+# -------- DEFINE THE ERROR RANGE. --------
+
+# -------- OPEN THE MATCHED DATA STORE --------
+# Matched data is kept in a persistent store for the cloud, and only new or changed rotation measures are matched.
+# The store starts afresh if the extinction map or the matching settings change.
+interpByPoint = bool(config.doInterpExtinct and config.interpRegion == 'Local')
+interpLocal = config.interpRegion == 'Local'
+regionBounds = (regionOfInterest.raHoursMax, regionOfInterest.raMinsMax, regionOfInterest.raSecMax,
+                regionOfInterest.raHoursMin, regionOfInterest.raMinsMin, regionOfInterest.raSecMin,
+                regionOfInterest.decDegMax, regionOfInterest.decDegMin)
+storeKey = MSL.hashValues(data, nodata, baddata, regionOfInterest.wcs.to_header_string(), regionBounds, ExtinctionResolutionDegs,
+                          interpByPoint, interpLocal, config.interpMethod, config.interpBorderWidth)
+# Columns which only describe the rotation measure, and can be updated without matching it again.
+rmColumns = ['Rotation_Measure(rad/m2)', 'RM_Err(rad/m2)']
+# The index of the store holds what is needed to decide which rotation measures to match again.
+matchStore = MSL.MatchStore(MatchedRMExtinctStoreDir, storeKey, indexColumns=['Error_Range(pix)'] + rmColumns)
+
+# Non-physical data which may be interpolated, as it was before any rotation measure was matched.
+touchableTable = bb.summedAreaTable(baddata & ~nodata)
+
+# Redo the interpolation of the stored chunks, so new rotation measures are matched on the same map.
+for chunkNumber in range(matchStore.numCompleted):
+    changes = matchStore.loadChanges(chunkNumber)
+    data[changes['y'], changes['x']] = changes['value']
+    baddata[changes['y'], changes['x']] = False
+
+# The index of the latest stored row of each rotation measure source.
+storedRows = matchStore.index
+nextID = matchStore.nextID()
+positionSources = RML.storedPositionSources(storedRows.index, storedRows[rmColumns[0]], storedRows[rmColumns[1]])
+
+messages = ["Matched data is stored in: {}".format(MatchedRMExtinctStoreDir),
+            "{} rotation measure sources are already stored from previous runs with the same extinction map and settings.".format(len(storedRows))]
+logging.info(loggingDivider)
+for message in messages:
+    logging.info(message)
+# -------- OPEN THE MATCHED DATA STORE. --------
+
+# -------- MATCH ROTATION MEASURES AND EXTINCTION VALUES --------
+
+def prepareChunks():
+    '''
+    Reads the rotation measure catalogue one chunk at a time, finds which rotation measures are new or changed since they
+    were stored, and which of those only read the map.
+    :return: A generator of (chunk, batch points) for PL.imapWithSharedArrays.
+    '''
+    for rmChunk in readRMCatalogChunks(RMCatalogFile, config.matchChunkSize, *regionBounds):
+        keys = RML.sourceKeys(rmChunk, positionSources)
+        pxs, pys = RML.findPointPixels(regionOfInterest.wcs, np.array(rmChunk.targetRaHourMinSecToDeg, dtype=float),
+                                       np.array(rmChunk.targetDecDegArcMinSecs, dtype=float))
+        RMResolutionDegs, NDelts = RML.getSearchBoxSizes(rmChunk.targetRAErrSecs, rmChunk.targetDecErrArcSecs, ExtinctionResolutionDegs)
+
+        # ---- Compare with the stored rows. The position is part of the key, so only the search box can change the match.
+        isStored = np.asarray(pd.Index(keys).isin(storedRows.index))
+        sameMatch = isStored.copy()
+        sameRM = isStored.copy()
+        if np.any(isStored):
+            previous = storedRows.reindex(keys)
+            sameMatch &= previous['Error_Range(pix)'].to_numpy() == NDelts
+            for column, values in zip(rmColumns, (rmChunk.targetRotationMeasures, rmChunk.targetRMErrs)):
+                sameRM &= previous[column].to_numpy() == np.array(values)
+        sameRM &= sameMatch
+        toMatch = ~sameMatch
+        toUpdate = sameMatch & ~sameRM
+        # ---- Compare with the stored rows.
+
+        touched, readOnlyMatched = RML.findTouchedPoints(pxs, pys, NDelts, nodata, baddata, touchableTable,
+                                                         interpByPoint, interpLocal)
+        touched &= toMatch
+        batch = np.flatnonzero(readOnlyMatched & toMatch)
+        chunk = (rmChunk, keys, pxs, pys, NDelts, RMResolutionDegs, touched, batch, toMatch, toUpdate)
+        yield chunk, (pxs[batch], pys[batch], NDelts[batch])
+
+
+numLoaded = 0
+numTouched = 0
+boxSizeCounts = collections.Counter()
+resolutions = []
+# The stored rotation measures which are still in the catalogue.
+isSeen = np.zeros(len(storedRows), dtype=bool)
+# The points which only read the map are matched across worker processes, while the points which touch non-physical
+# data are matched here in catalogue order, interpolating the data they touch.
+chunkResults = PL.imapWithSharedArrays(RML.matchPoints, prepareChunks(),
+                                       {'data': data, 'nodata': nodata, 'baddata': baddata}, config.numWorkers)
+for (rmChunk, keys, pxs, pys, NDelts, RMResolutionDegs, touched, batch, toMatch, toUpdate), batchMatches in chunkResults:
+    numLoaded += len(pxs)
+    numTouched += int(np.sum(touched))
+    boxSizeCounts.update(NDelts.tolist())
+    resolutions += [np.min(RMResolutionDegs), np.max(RMResolutionDegs)] if len(pxs) > 0 else []
+    storedIndices = storedRows.index.get_indexer(keys)
+    isSeen[storedIndices[storedIndices >= 0]] = True
+    if not np.any(toMatch | toUpdate):
+        continue
+
+    # ---- Match the new and changed rotation measures
+    changeLog = []
+    serialMatches = RML.matchTouchedPoints(pxs, pys, NDelts, touched, data, nodata, baddata, interpByPoint, interpLocal,
+                                           config.interpMethod, config.interpBorderWidth, changeLog)
+    matches = RML.mergeMatches(len(pxs), data.dtype, [(batch, batchMatches)], serialMatches)
+    isMatched = np.zeros(len(pxs), dtype=bool)
+    isMatched[batch] = True
+    isMatched[list(serialMatches.keys())] = True
+    # ---- Match the new and changed rotation measures.
+
+    # ---- Make the rows to store, in catalogue order.
+    rows = pd.DataFrame(RML.matchedColumns(rmChunk, pxs, pys, NDelts, toMatch | toUpdate, matches, regionOfInterest.wcs))
+    rows[MSL.SOURCE_KEY] = keys[toMatch | toUpdate]
+    rows[MSL.MATCHED] = isMatched[toMatch | toUpdate]
+    # Rotation measures whose match is unchanged keep their stored match.
+    updateRows = toUpdate[toMatch | toUpdate]
+    if np.any(updateRows):
+        storedMatch = matchStore.loadRows(rows.loc[updateRows, MSL.SOURCE_KEY]).reset_index()
+        for column in storedMatch.columns:
+            if column not in rmColumns:
+                rows.loc[updateRows, column] = storedMatch[column].to_numpy()
+
+    # A rotation measure keeps its ID# as long as it stays matched. Newly matched ones are numbered in catalogue order.
+    ids = []
+    for key, matched in zip(rows[MSL.SOURCE_KEY], rows[MSL.MATCHED]):
+        previousID = int(storedRows.at[key, MSL.ID]) if key in storedRows.index else -1
+        wasMatched = key in storedRows.index and bool(storedRows.at[key, MSL.MATCHED])
+        if matched and wasMatched:
+            ids.append(previousID)
+        elif matched:
+            ids.append(nextID)
+            nextID += 1
+        else:
+            ids.append(previousID)
+    rows[MSL.ID] = np.array(ids, dtype=np.int64)
+    # ---- Make the rows to store.
+
+    # ---- Store the rows, and the interpolation needed to match later rotation measures on the same map.
+    changedY = np.concatenate([np.zeros(0, dtype=int)] + [changedY for changedY, _ in changeLog])
+    changedX = np.concatenate([np.zeros(0, dtype=int)] + [changedX for _, changedX in changeLog])
+    matchStore.appendChunk({column: rows[column].to_numpy() for column in rows.columns},
+                           {'y': changedY, 'x': changedX, 'value': data[changedY, changedX]},
+                           {'matched': int(np.sum(toMatch)), 'updated': int(np.sum(toUpdate))})
+    # ---- Store the rows.
+
+# -------- MATCH ROTATION MEASURES AND EXTINCTION VALUES. --------
 
 # -------- CHECK THAT THERE'S ENOUGH POINTS IN THE FILE. --------
-if len(rmData.targetRotationMeasures) < 2:
+# Checked before the store is finished, so an aborted run removes no stored rotation measures and leaves the index as it was.
+if numLoaded < 2:
     messages = ["Less than 2 Rotation Measures have been LOADED for the given region.",
                 "This technique requires at least one on-position, and at least one off-position.",
                 "As such, there is insufficient data to perform this analysis.",
@@ -104,173 +249,40 @@ if len(rmData.targetRotationMeasures) < 2:
     raise ValueError("\n".join(messages))
 # -------- CHECK THAT THERE'S ENOUGH POINTS IN THE FILE. --------
 
-# -------- DEFINE THE ERROR RANGE --------
-# The physical limit on how far an extinction value can be from the rm and still be considered valid/applicable
-
-# Uncertainty based.
-raErrsSec = np.array(rmData.targetRAErrSecs)
-decErrs = np.array(rmData.targetDecErrArcSecs)
-
-raErrSec = max(abs(raErrsSec)) #s
-raErr = cl.ra_hms2deg(0, 0, raErrSec) #deg
-
-decErrSec = max(abs(decErrs)) #s
-decErr = cl.dec_dms2deg(0, 0, decErrSec) #deg
-
-RMResolutionDegs = max(raErr, decErr)
-
-ExtinctionResolutionDegs = min(abs(regionOfInterest.hdu.header['CDELT1']), abs(regionOfInterest.hdu.header['CDELT2'])) #deg
-# It is 1 pixel at most if the extinction map has a lower resolution than the RM map.
-# #The maximum number of pixels which fit within the RM's resolution otherwise.
-if (ExtinctionResolutionDegs > RMResolutionDegs):
-    NDelt = 1
-else:
-    NDelt = np.ceil(RMResolutionDegs/ExtinctionResolutionDegs)
-
-#Log explanatory results.
-messages = ["The uncertainty/resolution of the RM Catalogue for the given region (in degrees) is: {}".format(RMResolutionDegs),
+# -------- FINISH THE MATCHED DATA STORE --------
+# ---- Rotation measures which are no longer in the catalogue are removed.
+removedKeys = storedRows.index[~isSeen & storedRows[MSL.MATCHED].to_numpy(dtype=bool)]
+if len(removedKeys) > 0:
+    removedRows = matchStore.loadRows(removedKeys).reset_index()
+    removedRows[MSL.MATCHED] = False
+    # No search box has a negative size, so a removed rotation measure is matched again if it comes back.
+    removedRows['Error_Range(pix)'] = -1
+    matchStore.appendChunk({column: removedRows[column].to_numpy() for column in removedRows.columns},
+                           {'y': np.zeros(0, dtype=int), 'x': np.zeros(0, dtype=int), 'value': np.zeros(0, dtype=data.dtype)},
+                           {'removed': len(removedRows)})
+# ---- Rotation measures which are no longer in the catalogue are removed.
+
+# Which ID#s this run changed, before the new rows are added to the index. Then the rows they replace are removed.
+changedIDTable = matchStore.changedIDs()
+matchStore.finish()
+numMatched = int(np.sum(matchStore.index[MSL.MATCHED].to_numpy(dtype=bool)))
+# -------- FINISH THE MATCHED DATA STORE. --------
+
+# -------- LOG THE ERROR RANGE --------
+messages = ["The uncertainty/resolution of the RM Catalogue for the given region (in degrees) ranges from {} to {}".format(min(resolutions), max(resolutions)),
             "The uncertainty/resolution of the Extinction map for the given region (in degrees) is: {}".format(ExtinctionResolutionDegs),
-            "Given this, the number of extinction map pixels needed to cover the uncertainty in rotation measures is: {}".format(NDelt),
-            "This will be used to find the uncertainties later on."]
+            "Given this, the number of extinction map pixels needed to cover the uncertainty of each rotation measure is:"]
+messages += ["\t{} pixel(s): {} rotation measure(s)".format(boxSize, boxSizeCounts[boxSize]) for boxSize in sorted(boxSizeCounts)]
+messages += ["This will be used to find the uncertainties later on.",
+             "New or changed rotation measures were matched using up to {} worker process(es).".format(PL.getWorkerCount(config.numWorkers)),
+             "{} rotation measures touched non-physical extinction data and were matched while interpolating it.".format(numTouched)]
 logging.info(loggingDivider)
 for message in messages:
     logging.info(message)
-# -------- DEFINE THE ERROR RANGE. --------
-
-# -------- DEFINE PARAMETERS --------
-ExtinctionIndex_x = []
-ExtinctionIndex_y = []
-ExtinctionRa = []
-ExtinctionDec = []
-ExtinctionValue = []
-
-Identifier = []
-RMRa = []
-RMDec = []
-RMValue = []
-RMErr = []
-
-ErrRangePix = []
-
-Extinction_MinInRangeRa = []
-Extinction_MinInRangeDec = []
-Extinction_MinInRange = []
-
-Extinction_MaxInRangeRa = []
-Extinction_MaxInRangeDec = []
-Extinction_MaxInRange = []
-
-IsExtinctionObserved = []
-# -------- DEFINE PARAMETERS. --------
-
-# -------- MATCH ROTATION MEASURES AND EXTINCTION VALUES --------
-cntr = 0  # To keep track of how many matches have been made - numbering starts at 0
-# Go through all of the rotation measure values and match them to an extinction value
-for index in range(len(rmData.targetRotationMeasures)):
-    # ---- Location of the rotation measure
-    rmRA = rmData.targetRaHourMinSecToDeg[index]
-    rmDec = rmData.targetDecDegArcMinSecs[index]
-    py, px = regionOfInterest.wcs.world_to_array_index_values(rmRA, rmDec)  # Array indices of the rotation measure
-    # ---- Location of the rotation measure.
-
-    # ---- Skip the point if it violates a condition.
-    #Point is in the file
-    inFitsFile = 0 <= px < data.shape[1] and 0 <= py < data.shape[0]
-    #Point has data
-    hasData = inFitsFile and not nodata[py, px]
-    #Point is either to be interpolated, or does not contain non-physical data
-    physicalData = inFitsFile and not baddata[py, px]
-    interpByPoint = config.doInterpExtinct and config.interpRegion == 'Local'
-    #Check all conditions for validity
-    validPoint = inFitsFile and hasData and (physicalData or interpByPoint)
-    if not validPoint:
-        continue
-    # ---- Skip the point if it violates a condition.
-
-    # ---- Interpolate Missing Data
-    if not physicalData and interpByPoint:
-        ind_xmin, ind_xmax, ind_ymin, ind_ymax = bb.getNullBoxBound(px, py, data)
-        data[ind_ymin:ind_ymax, ind_xmin:ind_xmax] = IL.interpMask(data[ind_ymin:ind_ymax, ind_xmin:ind_xmax],
-                                                                    baddata[ind_ymin:ind_ymax, ind_xmin:ind_xmax],
-                                                                   config.interpMethod)
-        baddata[ind_ymin:ind_ymax, ind_xmin:ind_xmax] = False
-    # ---- Interpolate Missing Data
-
-    # ---- Load the data that is going to be matched from the RM Catalog and the extinction map.
-    extinction = data[py, px]
-    Identifier.append(cntr)
-    RMRa.append(rmRA)
-    RMDec.append(rmDec)
-    RMValue.append(rmData.targetRotationMeasures[index])
-    RMErr.append(rmData.targetRMErrs[index])
-    # ---- Load the data that is going to be matched from the RM Catalog and the extinction map.
-
-    # ---- Match rotation measure to an extinction value
-    ExtinctionIndex_x.append(int(px)) #Round down
-    ExtinctionIndex_y.append(int(py)) #Round down
-    ExtinctionRa.append(regionOfInterest.wcs.wcs_pix2world(px, py, 0)[0])
-    ExtinctionDec.append(regionOfInterest.wcs.wcs_pix2world(px, py, 0)[1])
-    ExtinctionValue.append(extinction)
-    # ---- Match rotation measure to an extinction value.
-
-    # ---- Find the extinction error range for the given rm
-    ErrRangePix.append(NDelt)
-    ind_xmin, ind_xmax, ind_ymin, ind_ymax = bb.getBoxBound(px, py, data, NDelt)
-    # ---- Find the extinction error range for the given rm.
-
-    # ---- Cycle through extinction values within the error range
-    extinction_temp = []
-    ra_temp = []
-    dec_temp = []
-
-    for pxx in range(ind_xmin, ind_xmax):
-        for pyy in range(ind_ymin, ind_ymax):
-            # ---- Skip Missing Data
-            if nodata[pyy, pxx] or (math.isnan(data[pyy, pxx]) and not baddata[pyy, pxx]):
-                continue
-            # ---- Skip Missing Data
-            # ---- Interpolate Bad Data, if interpolation is to be done.
-            if baddata[pyy, pxx] and config.interpRegion == 'Local':
-                xmin, xmax, ymin, ymax = bb.getNullBoxBound(pxx, pyy, data)
-                data[ymin:ymax, xmin:xmax] = IL.interpMask(data[ymin:ymax, xmin:xmax],
-                                                                            baddata[ymin:ymax,
-                                                                            xmin:xmax],
-                                                           config.interpMethod)
-                baddata[ymin:ymax, xmin:xmax] = False
-            # ---- Interpolate Bad Data, if interpolation is to be done.
-            extinction = data[pyy, pxx]
-            extinction_temp.append(extinction)
-            xx, yy = regionOfInterest.wcs.wcs_pix2world(pxx, pyy, 0)
-            ra_temp.append(xx)
-            dec_temp.append(yy)
-    # ---- Cycle through extinction values within the error range.
-
-    # Find minimum extinction value
-    ind_min = np.where(extinction_temp == min(extinction_temp))[0][0]
-    Extinction_MinInRangeRa.append(ra_temp[ind_min])
-    Extinction_MinInRangeDec.append(dec_temp[ind_min])
-    Extinction_MinInRange.append(extinction_temp[ind_min])
-
-    # Find maximum extinction value
-    ind_max = np.where(extinction_temp == max(extinction_temp))[0][0]
-    Extinction_MaxInRangeRa.append(ra_temp[ind_max])
-    Extinction_MaxInRangeDec.append(dec_temp[ind_max])
-    Extinction_MaxInRange.append(extinction_temp[ind_max])
-
-    # ---- Negative extinction (the rm value landed on a negative pixel)
-    # Negative extinction is not physical; in prior step it was interpolated away. Mark these points.
-    if baddata[py, px]:
-        IsExtinctionObserved.append(False)
-    else:
-        IsExtinctionObserved.append(True)
-    # ---- Negative extinction.
-
-    cntr += 1
-
-# -------- MATCH ROTATION MEASURES AND EXTINCTION VALUES. --------
+# -------- LOG THE ERROR RANGE. --------
 
 # -------- CHECK THAT THERE'S ENOUGH POINTS MATCHED. ISSUE WARNINGS IF KEY INDICATORS ARE FAILED. --------
-if len(RMValue) < 2:
+if numMatched < 2:
     messages = ["Less than 2 Rotation Measures have been MATCHED for the given region.",
                "This technique requires at least one on-position, and at least one off-position.",
                "As such, there is insufficient data to perform this analysis.",
@@ -280,8 +292,8 @@ if len(RMValue) < 2:
         logging.critical(message)
         print(message)
 
-elif len(RMValue) < config.minRefPoints:
-    messages = ["Less than {} Rotation Measures have been MATCHED for the given region.".format(len(RMValue)),
+elif numMatched < config.minRefPoints:
+    messages = ["Less than {} Rotation Measures have been MATCHED for the given region.".format(numMatched),
                 "In the config, the minimum number of points selected by the stability trend algorithm is: {}".format(config.minRefPoints),
                 "As such, there is insufficient data to perform this analysis.",
                 "Please select a larger region, obtain a denser RM Catalogue, or adjust your stability trend requirements."]
@@ -290,8 +302,8 @@ elif len(RMValue) < config.minRefPoints:
         logging.critical(message)
         print(message)
 
-elif len(RMValue) < 2*config.minRefPoints:
-    messages = ["Less than {} Rotation Measures have been MATCHED for the given region.".format(len(RMValue)),
+elif numMatched < 2*config.minRefPoints:
+    messages = ["Less than {} Rotation Measures have been MATCHED for the given region.".format(numMatched),
                 "In the config, the minimum number of points selected by the stability trend algorithm is: {}".format(config.minRefPoints),
                 "Since some points will be excluded, there may be insufficient data to perform this analysis.",
                 "Please select a larger region, obtain a denser RM Catalogue, or adjust your stability trend requirements."]
@@ -303,21 +315,23 @@ elif len(RMValue) < 2*config.minRefPoints:
 # -------- CHECK THAT THERE'S ENOUGH POINTS MATCHED. --------
 
 # -------- WRITE TO A FILE --------
-columns = ['Extinction_Index_x','Extinction_Index_y','Ra(deg)','Dec(deg)','Rotation_Measure(rad/m2)',
-           'RM_Err(rad/m2)','RA_inExtincFile(degree)','Dec_inExtincFile(degree)','Extinction_Value','Error_Range(pix)','Min_Extinction_Value',
-           'Min_Extinction_Ra','Min_Extinction_Dec','Max_Extinction_Value','Max_Extinction_RA','Max_Extinction_dec','Extinction_Observed']
-data = list(zip_longest(ExtinctionIndex_x, ExtinctionIndex_y, RMRa, RMDec, RMValue, RMErr,
-                        ExtinctionRa, ExtinctionDec, ExtinctionValue, ErrRangePix,
-                        Extinction_MinInRange, Extinction_MinInRangeRa, Extinction_MinInRangeDec,
-                        Extinction_MaxInRange, Extinction_MaxInRangeRa, Extinction_MaxInRangeDec,
-                        IsExtinctionObserved,
-                        fillvalue=''))
-matchedRMExtinct = pd.DataFrame(data, columns=columns)
-matchedRMExtinct.index.name = 'ID#'
-matchedRMExtinct.to_csv(MatchedRMExtinctFile, sep=config.dataSeparator)
+# ---- Label every matched point with the quadrant of the cloud it is in, so later stages look quadrants up.
+cloudGeometry = rjl.loadCloudGeometry(QuadDivDataFile, regionOfInterest.hdu.data, xmin, xmax, ymin, ymax, sep=config.dataSeparator)
+quadrantLines = [cloudGeometry['Slope of Line Through Cloud'], cloudGeometry['Vertical Offset of Line Through Cloud'],
+                 cloudGeometry['Slope of Perpendicular Line'], cloudGeometry['Vertical Offset of Perpendicular Line']]
+def addQuadrants(table):
+    return {rjl.QUADRANT: rjl.getQuadrantLabels(table['Extinction_Index_x'], table['Extinction_Index_y'], *quadrantLines)}
+# ---- Label every matched point with the quadrant of the cloud it is in.
+
+numMatched = matchStore.writeTable(MatchedRMExtinctFile, RML.MATCHED_COLUMNS, config.dataSeparator, addColumns=addQuadrants)
+
+# Report which ID#s changed in this run. Later stages read the full matched table, not this report.
+changedIDTable.to_csv(MatchedRMExtinctChangesFile, sep=config.dataSeparator, index=False)
 # -------- WRITE TO A FILE. --------
-messages = ['Within the specified region of interest, a total of {} rotation measure points were matched to visual extinction values.'.format(len(Identifier)),
-            'Matched visual extinction and rotation measure data were saved to {}'.format(MatchedRMExtinctFile)]
+messages = ['Within the specified region of interest, a total of {} rotation measure points were matched to visual extinction values.'.format(numMatched),
+            'Compared to the stored matches, {} ID#s were added, {} updated and {} removed.'.format(*[int(np.sum(changedIDTable['Change'] == kind)) for kind in ('Added', 'Updated', 'Removed')]),
+            'Matched visual extinction and rotation measure data were saved to {}'.format(MatchedRMExtinctFile),
+            'The ID#s changed by this run were saved to {}'.format(MatchedRMExtinctChangesFile)]
 logging.info(loggingDivider)
 for message in messages:
     logging.info(message)
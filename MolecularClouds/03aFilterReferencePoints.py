@@ -35,13 +35,6 @@ extinctionCoordinateDataFile = config.ExtinctionCoordDataFile
 AllPotRefPointsPath = config.AllPotRefPointFile
 
 LogFile = config.Script03aFile
-
-NearRejectedRefPointsFile = config.NearExtinctRefPointFile
-FarRejectedRefPointsFile = config.FarExtinctRefPointFile
-AnomRejRefPointFile = config.AnomRefPointFile
-RejRefPointFile = config.RejRefPointFile
-
-FilteredRefPointsPath = config.FilteredRefPointsFile
 # ---- Output Files
 
 # -------- DEFINE FILES AND PATHS. --------
@@ -55,15 +48,6 @@ loggingDivider = config.logSectionDivider
 MatchedRMExtinctionData = pd.read_csv(MatchedRMExtinctFile, sep=config.dataSeparator)
 # ---- LOAD AND UNPACK MATCHED RM AND EXTINCTION DATA
 
-# ---- TRACK INDEXES WHICH ARE ACCEPTED AS REFERENCE VALUES/REJECTED ----
-PotRefPoints = []
-RejectedReferencePoints = []
-# ---- TRACK INDEXES WHICH ARE ACCEPTED AS REFERENCE VALUES/REJECTED ----
-
-# ---- TRACK KEY DATAFRAMES ----
-AllPotentialRefPoints = None
-# ---- TRACK KEY DATAFRAMES ----
-
 # -------- LOAD THE THRESHOLD EXTINCTION --------
 # ---- Find the center of the cloud in equatorial coordinates
 # Determining the center locations to properly identify Av threshold value
@@ -143,6 +127,8 @@ for message in messages:
 We will only consider points with visual extinction less than the specified threshold value as potential 
 reference points
 - Here we extract these points and sort the resulting dataframe from smallest to greatest extinction 
+- Every later criterion is evaluated for all of these points at once, and the reasons a point is rejected are kept as
+flags in one table
 '''
 # All potential reference points are all reference points with extinction less than the threshold
 dataframe = MatchedRMExtinctionData.copy()
@@ -151,25 +137,14 @@ threshold = Av_threshold #TODO: Why multiplying the user defined A_v by the aver
 # Indices where the threshold is met in the given column
 ind = np.where(dataframe[columnName] <= threshold)[0]
 # All rows which exceed the threshold value in the given column
-AllPotentialRefPoints = dataframe.loc[ind].sort_values(columnName, ignore_index=True)
+AllPotentialRefPoints = dataframe.loc[ind].sort_values(columnName, kind='stable', ignore_index=True)
 numAllRefPoints = len(AllPotentialRefPoints)
-listIndRefPoints = [i for i in range(numAllRefPoints)]
 # -------- Criterion: Av < threshold.
-
-# ---- SAVE REFERENCE POINT DATA AS A TABLE
-if AllPotRefPointsPath is not None:
-    AllPotentialRefPoints.to_csv(AllPotRefPointsPath, index=False, sep=config.dataSeparator)
-# ---- SAVE REFERENCE POINT DATA AS A TABLE.
 # -------- FIND ALL POTENTIAL REFERENCE POINTS. --------
 
-# ---- Add those reference points to the data we're keeping track of
-PotRefPoints += listIndRefPoints #Notes on +=: When both inputs are lists, the result is list concatenation. Ex. A = [1], B = [2, 3], then A += B = [1, 2, 3]. Here, both objects are lists.
-RejectedReferencePoints += []
-# ---- Add those reference points to the data we're keeping track of
-
 # ---- Log info
 messages = ['Based on the threshold extinction of {}, a total of {} potential reference points were found.'.format(Av_threshold, numAllRefPoints),
-            "The IDs of the selected points are: {}".format([i+1 for i in PotRefPoints]),
+            "The IDs of the selected points are: {}".format([i+1 for i in range(numAllRefPoints)]),
             "The following are all the potential reference points: \n {}".format(AllPotentialRefPoints)]
 logging.info(loggingDivider)
 for message in messages:
@@ -193,50 +168,27 @@ NDeltFar = config.farExtinctionMultiplier * math.ceil(minDiff_pix)  # Round up
 highExtinctionThreshold = config.highExtinctionThreshMultiplier * Av_threshold
 # -------- Define the range.
 
-# -------- For each potential reference point
-nearHighExtinctionRegion = []
-farHighExtinctionRegion = []
-for i in list(AllPotentialRefPoints.index):
-    idNum = AllPotentialRefPoints['ID#'][i]
-    px = AllPotentialRefPoints['Extinction_Index_x'][i]
-    py = AllPotentialRefPoints['Extinction_Index_y'][i]
-    # ---- Find the extinction range for the given point
-    if rjl.IsNearHighExt(px, py, regionOfInterest.hdu.data, NDeltNear, highExtinctionThreshold):
-        nearHighExtinctionRegion.append(i)
-    if not rjl.IsNearHighExt(px, py, regionOfInterest.hdu.data, NDeltFar, highExtinctionThreshold):
-        farHighExtinctionRegion.append(i)
-    # ---- Find the extinction range for the given point.
-# -------- For each potential reference point.
-
-# ---- Record the points rejected for what reason, and what points remain as potential reference points.
-nearHighExtinctReject = [item for item in PotRefPoints if item in nearHighExtinctionRegion and config.useNearExtinctionRemove]
-farHighExtinctReject = [item for item in PotRefPoints if item in farHighExtinctionRegion and config.useFarExtinctionRemove]
-
-RejectedReferencePoints += nearHighExtinctReject #Notes on +=: When both inputs are lists, the result is list concatenation. Ex. A = [1], B = [2, 3], then A += B = [1, 2, 3]. Here, both objects are lists.
-RejectedReferencePoints += farHighExtinctReject
-
-PotRefPoints = [item for item in PotRefPoints if item not in nearHighExtinctReject]
-PotRefPoints = [item for item in PotRefPoints if item not in farHighExtinctReject]
-
-NearRejectedRefPoints = AllPotentialRefPoints.loc[nearHighExtinctReject].sort_values('Extinction_Value')
-FarRejectedRefPoints = AllPotentialRefPoints.loc[farHighExtinctReject].sort_values('Extinction_Value')
-
-NearRejectedRefPoints.to_csv(NearRejectedRefPointsFile, sep=config.dataSeparator)
-FarRejectedRefPoints.to_csv(FarRejectedRefPointsFile, sep=config.dataSeparator)
-# ---- Record the points rejected for what reason, and what points remain as potential reference points.
+# -------- Find how far every pixel is from high extinction
+# One distance map serves every point and both the near and far ranges.
+highExtDistances = rjl.getHighExtDistances(regionOfInterest.hdu.data, highExtinctionThreshold)
+# -------- Find how far every pixel is from high extinction.
+
+# -------- For all potential reference points
+pxs = AllPotentialRefPoints['Extinction_Index_x'].to_numpy()
+pys = AllPotentialRefPoints['Extinction_Index_y'].to_numpy()
+isNearHighExt = rjl.IsNearHighExtArray(pxs, pys, highExtDistances, NDeltNear)
+isFarHighExt = ~rjl.IsNearHighExtArray(pxs, pys, highExtDistances, NDeltFar)
+# -------- For all potential reference points.
 
 # ---- Log info
 messages = ['We will now check if any of the potential reference points are near a region of high extinction.',
             "\t-A close region around the point has been defined to the configuration-selected {} pixels".format(NDeltNear),
             "\t-A far region around the point has been defined to the configuration-selected {} pixels".format(NDeltFar),
             "\t-A region of high extinction has been defined to the configuration-selected Av={}".format(highExtinctionThreshold),
-            'The potential reference point(s) {} are near a region of high extinction'.format([i+1 for i in nearHighExtinctionRegion]),
-            'The potential reference point(s) {} are far from a region of high extinction'.format([i+1 for i in farHighExtinctionRegion]),
+            'The potential reference point(s) {} are near a region of high extinction'.format((np.flatnonzero(isNearHighExt) + 1).tolist()),
+            'The potential reference point(s) {} are far from a region of high extinction'.format((np.flatnonzero(isFarHighExt) + 1).tolist()),
             'As per configuration settings, near points will be removed: {}'.format(config.useNearExtinctionRemove),
-            'As per configuration settings, far points will be removed: {}'.format(config.useFarExtinctionRemove),
-            'As such, the remaining points by their IDs are: \n {}'.format(PotRefPoints),
-            'Near High Extinction Rejected Points data was saved to {}'.format(NearRejectedRefPointsFile),
-            'Far from High Extinction Rejected Points data was saved to {}'.format(FarRejectedRefPointsFile)]
+            'As per configuration settings, far points will be removed: {}'.format(config.useFarExtinctionRemove)]
 logging.info(loggingDivider)
 for message in messages:
     logging.info(message)
@@ -262,32 +214,16 @@ rmUpperLimit = rmMedian + coeffIQR * rmIQR
 rmLowerLimit = rmMedian - coeffIQR * rmIQR
 # -------- Define "anomalous".
 
-# -------- For each potential reference point
-anomalousRMIndex = []
-for i in list(AllPotentialRefPoints.index):
-    idNum = AllPotentialRefPoints['ID#'][i]
-    if AllPotentialRefPoints['Rotation_Measure(rad/m2)'][i] < rmLowerLimit or \
-            AllPotentialRefPoints['Rotation_Measure(rad/m2)'][i] > rmUpperLimit:
-        anomalousRMIndex.append(i)  # To identify points numbered in order of increasing extinction
-# -------- For each potential reference point.
-
-# ---- Record the points rejected for what reason, and what points remain as potential reference points.
-anomalousReject = [item for item in PotRefPoints if item in anomalousRMIndex and config.useanomalousIQRNumRemove]
-
-RejectedReferencePoints += anomalousReject #Notes on +=: When both inputs are lists, the result is list concatenation. Ex. A = [1], B = [2, 3], then A += B = [1, 2, 3]. Here, both objects are lists.
-PotRefPoints = [item for item in PotRefPoints if item not in anomalousReject]
-
-AnomalousRejectedRefPoints = AllPotentialRefPoints.loc[anomalousReject].sort_values('Extinction_Value')
-AnomalousRejectedRefPoints.to_csv(AnomRejRefPointFile, sep=config.dataSeparator)
-# ---- Record the points rejected for what reason, and what points remain as potential reference points.
+# -------- For all potential reference points
+rmValues = AllPotentialRefPoints['Rotation_Measure(rad/m2)'].to_numpy()
+isAnomalousRM = (rmValues < rmLowerLimit) | (rmValues > rmUpperLimit)
+# -------- For all potential reference points.
 
 # ---- Log info
 messages = ['We will now check if any of the potential reference points have anomalous rotation measure values.',
             "\t-Anomalous rotation measure values have been defined in the starting configuration to be greater or less than {} standard deviations from the mean (rm < {:.2f}rad/m^2 or rm > {:.2f}rad/m^2)".format(coeffIQR, rmLowerLimit, rmUpperLimit),
             'As per configuration settings, anomalous points will be removed: {}'.format(config.useanomalousIQRNumRemove),
-            'The potential reference point(s) {} have anomalous rotation measure values'.format(anomalousRMIndex),
-            'As such, the remaining points by their IDs are: \n {}'.format(PotRefPoints),
-            'Anomalous Rejected Points data was saved to {}'.format(AnomRejRefPointFile)]
+            'The potential reference point(s) {} have anomalous rotation measure values'.format(np.flatnonzero(isAnomalousRM).tolist())]
 logging.info(loggingDivider)
 for message in messages:
     logging.info(message)
@@ -296,33 +232,29 @@ for message in messages:
 
 #======================================================================================================================
 
-# -------- SAVE REJECTED REFERENCE POINT INFO. --------
-RejectedRefPoints = AllPotentialRefPoints.loc[RejectedReferencePoints].sort_values('Extinction_Value')
-RejectedRefPoints.to_csv(RejRefPointFile, sep=config.dataSeparator)
-messages = ['Rejected Reference Points data was saved to {}'.format(RejRefPointFile)]
-for message in messages:
-    logging.info(message)
-# -------- SAVE REJECTED REFERENCE POINT INFO. --------
-
-#======================================================================================================================
-
 # -------- FINALIZE REMAINING POINTS AFTER WINNOWING FROM PRIOR STAGES --------
-#Get the indexes of the remaining points.
-RemainingPotRefPoints = [int(np.round(i)) for i in PotRefPoints]
-#Make sure the number of points taken is no more than the accepted maximum number of points.
+# Make sure the number of points taken is no more than the accepted maximum number of points.
 maxRefPoints = int(round(len(MatchedRMExtinctionData.index) * config.maxFracPointNum))
-if len(RemainingPotRefPoints) > maxRefPoints: RemainingPotRefPoints = RemainingPotRefPoints[:maxRefPoints]
 
-#Get the data of the points by selecting them from the data table, and save them.
-FilteredRefPoints = AllPotentialRefPoints.loc[RemainingPotRefPoints].sort_values('Extinction_Value').reset_index()
+# Record why each point was rejected. Points without any flag remain as potential reference points.
+AllPotentialRefPoints[rjl.REJECTION_FLAGS] = rjl.getRejectionFlags(isNearHighExt & config.useNearExtinctionRemove,
+                                                                  isFarHighExt & config.useFarExtinctionRemove,
+                                                                  isAnomalousRM & config.useanomalousIQRNumRemove,
+                                                                  maxRefPoints)
 '''
-#Important comment: Originally points were identified by the 'Id#' column. 
+#Important comment: Points are identified by the 'ID#' column. 
 However, they are not in order from lowest to highest extinction. 
-We reset the index after sorting to get an index of the points from lowest to highest extinction. 
+The later stages select the remaining points from this table, and index them from lowest to highest extinction. 
 However, if you ever need to cross-reference with the points prior to this reset, 
-you need to compare with the 'Id#' column, not the new index column!
+you need to compare with the 'ID#' column, not the index!
 '''
-FilteredRefPoints.to_csv(FilteredRefPointsPath, sep=config.dataSeparator)
+# ---- SAVE REFERENCE POINT DATA AS A TABLE
+if AllPotRefPointsPath is not None:
+    AllPotentialRefPoints.to_csv(AllPotRefPointsPath, index=False, sep=config.dataSeparator)
+# ---- SAVE REFERENCE POINT DATA AS A TABLE.
+
+FilteredRefPoints = rjl.getRemainingRefPoints(AllPotentialRefPoints)
+RemainingPotRefPoints = np.flatnonzero(AllPotentialRefPoints[rjl.REJECTION_FLAGS] == 0).tolist()
 
 # ---- Check if the number of points left after filtering is good for further analysis.
 if len(FilteredRefPoints.index) < 1:
@@ -348,11 +280,17 @@ elif len(FilteredRefPoints.index) == len(MatchedRMExtinctionData.index):
 # ---- Check if the number of points left after filtering is good for further analysis.
 
 # ---- Log info
-messages = ["The Remaining Reference Points will be:",
+flags = AllPotentialRefPoints[rjl.REJECTION_FLAGS]
+messages = ["The number of potential reference points rejected for each reason is:",
+            "\t-Near a region of high extinction: {}".format(np.sum((flags & rjl.REJECTED_NEAR_HIGH_EXT) != 0)),
+            "\t-Far from a region of high extinction: {}".format(np.sum((flags & rjl.REJECTED_FAR_HIGH_EXT) != 0)),
+            "\t-Anomalous rotation measure: {}".format(np.sum((flags & rjl.REJECTED_ANOMALOUS_RM) != 0)),
+            "\t-Beyond the maximum number of reference points ({}): {}".format(maxRefPoints, np.sum((flags & rjl.REJECTED_MAX_FRACTION) != 0)),
+            "The Remaining Reference Points will be:",
             RemainingPotRefPoints,
             "The Remaining data is thus:",
             FilteredRefPoints,
-            'Remaining data was saved to {}'.format(FilteredRefPointsPath)]
+            'All potential reference points, with the reasons they were rejected in the column {}, were saved to {}'.format(rjl.REJECTION_FLAGS, AllPotRefPointsPath)]
 logging.info(loggingDivider)
 for message in messages:
     logging.info(message)
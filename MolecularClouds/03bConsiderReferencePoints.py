@@ -17,7 +17,10 @@ from LocalLibraries.RegionOfInterest import Region
 import LocalLibraries.config as config
 
 import LocalLibraries.OptimalRefPoints as orp
+import LocalLibraries.MatchedRMExtinctionFunctions as MREF
 import LocalLibraries.RefJudgeLib as rjl
+from LocalLibraries.TableCacheLib import TableCache
+from LocalLibraries.CalculateB import loadAbundanceTable
 
 import logging
 
@@ -30,22 +33,23 @@ regionOfInterest = Region(cloudName)
 # ---- Input Files
 # Matched rm and extinction data
 MatchedRMExtinctFile = config.MatchedRMExtinctionFile
-# Filtered rm and extinction data
-FilteredRefFile = config.FilteredRefPointsFile
-# All Potential Reference Points Data
+# All Potential Reference Points Data, with the reasons they were rejected
 AllPotRefPointsPath = config.AllPotRefPointFile
+# The lines which divide the cloud into quadrants, from 02a
+QuadDivDataFile = config.QuadDivDataFile
 # ---- Input Files
 
 # ---- Output Files
-QuadDivDataFile = config.QuadDivDataFile
-
 ChosenRefPointFile = config.ChosenRefPointFile
 ChosenRefDataFile = config.ChosenRefDataFile
+RefPointInfluenceFile = config.RefPointInfluenceFile
 
 BLOSvsNRef_AllPotRefPointsPlot = config.BLOSvsNRef_AllPlotFile
 BLOSvsNRef_ChosenPlotFile = config.BLOSvsNRef_ChosenPlotFile
 
 StabilityTrendDataTablePath = config.StabilityTrendDataTablePath
+# Stability trend data of earlier runs, reused when nothing it depends on has changed
+StabilityTrendCacheDir = config.StabilityTrendCacheDir
 LogFile = config.Script03bFile
 # ---- Output Files
 
@@ -64,21 +68,15 @@ MatchedRMExtinctionData = pd.read_csv(MatchedRMExtinctFile, sep=config.dataSepar
 AllPotentialRefPoints = pd.read_csv(AllPotRefPointsPath, sep=config.dataSeparator)
 # ---- LOAD AND UNPACK POTENTIAL REFERENCE POINTS DATA
 
-# ---- LOAD AND UNPACK FILTERED RM AND EXTINCTION DATA
-FilteredRefPoints = pd.read_csv(FilteredRefFile, sep=config.dataSeparator)
-# ---- LOAD AND UNPACK FILTERED RM AND EXTINCTION DATA
+# ---- SELECT THE FILTERED RM AND EXTINCTION DATA
+FilteredRefPoints = rjl.getRemainingRefPoints(AllPotentialRefPoints)
+# ---- SELECT THE FILTERED RM AND EXTINCTION DATA
 
 #============================================================================================================
 # -------- SORT THE AVAILABLE POINTS INTO QUADRANTS RELATIVE TO THE CLOUD, TO ENSURE EVEN SAMPLING --------
-# ---- Find the lines which divide the cloud into quadrants.
-cloudCenterX, cloudCenterY = rjl.findWeightedCenter(regionOfInterest.hdu.data, regionOfInterest.xmin, regionOfInterest.xmax, regionOfInterest.ymin, regionOfInterest.ymax)
-m, b = rjl.getDividingLine(regionOfInterest.hdu.data, regionOfInterest.xmin, regionOfInterest.xmax, regionOfInterest.ymin, regionOfInterest.ymax)
-mPerp, bPerp = rjl.getPerpendicularLine(cloudCenterX, cloudCenterY, m)
-# ---- Find the lines which divide the cloud into quadrants.
-
-# ---- Sort the points into those quadrants.
-Q1, Q2, Q3, Q4 = rjl.sortQuadrants(list(FilteredRefPoints.index), FilteredRefPoints['Extinction_Index_x'], FilteredRefPoints['Extinction_Index_y'], m, b, mPerp, bPerp)
-# ---- Sort the points into those quadrants.
+# ---- Sort the points into the quadrants of the cloud, which were found for every matched point in 02a.
+Q1, Q2, Q3, Q4 = rjl.groupQuadrants(FilteredRefPoints.index, FilteredRefPoints[rjl.QUADRANT])
+# ---- Sort the points into the quadrants of the cloud.
 
 # ---- Calculate Results. (They will be used in a later stage)
 minSamples = config.minPointsPerQuadrant
@@ -94,20 +92,6 @@ quadrantsUndersampled = quadrantsUndersampled + 1 if Q3Less else quadrantsUnders
 quadrantsUndersampled = quadrantsUndersampled + 1 if Q4Less else quadrantsUndersampled
 # ---- Calculate Results.
 
-# ---- Save Data
-QuadDivCols = ['Cloud Center X', 'Cloud Center Y',
-               'Slope of Line Through Cloud', 'Vertical Offset of Line Through Cloud',
-               'Slope of Perpendicular Line', 'Vertical Offset of Perpendicular Line']
-QuadDivData = pd.DataFrame(columns = QuadDivCols)
-QuadDivData['Cloud Center X'] = [cloudCenterX]
-QuadDivData['Cloud Center Y'] = [cloudCenterY]
-QuadDivData['Slope of Line Through Cloud'] = m
-QuadDivData['Vertical Offset of Line Through Cloud'] = b
-QuadDivData['Slope of Perpendicular Line'] = mPerp
-QuadDivData['Vertical Offset of Perpendicular Line'] = bPerp
-QuadDivData.to_csv(QuadDivDataFile, index=False, sep=config.dataSeparator)
-# ---- Save Data
-
 # ---- Log results
 messages = ["The filtered reference points, sorted by quadrant, are:",
             "Q1: {}".format(Q1),
@@ -118,7 +102,7 @@ messages = ["The filtered reference points, sorted by quadrant, are:",
             "{} quadrants have less than {} reference points after filtering!".format(quadrantsUndersampled, minSamples),
             "If 1 or more quadrants have insufficient points sampled at this stage,",
             "consider raising your extinction threshold in your start settings configuration and trying again!",
-            "The lines which divide the cloud into quadrants have been saved to {}.".format(QuadDivDataFile)]
+            "The lines which divide the cloud into quadrants are saved in {}.".format(QuadDivDataFile)]
 logging.info(loggingDivider)
 for message in messages:
     logging.info(message)
@@ -127,7 +111,10 @@ for message in messages:
 #============================================================================================================
 # -------- FIND OPTIMAL NUMBER OF REFERENCE POINTS --------
 # ---- Find the trend data
-TrendDataTable = orp.findTrendData(FilteredRefPoints, MatchedRMExtinctionData, regionOfInterest)
+trendCache = TableCache(StabilityTrendCacheDir, int(config.trendCacheSizeMB * 2**20))
+# The abundance data is loaded once, for the trend data, the comparison of reference points and their influence.
+AvAbundanceTable = loadAbundanceTable(regionOfInterest.AvFilePath)
+TrendDataTable = orp.findTrendData(FilteredRefPoints, MatchedRMExtinctionData, AvAbundanceTable, trendCache)
 TrendDataTable.to_csv(StabilityTrendDataTablePath, sep=config.dataSeparator)
 # ---- Find the trend data
 
@@ -144,7 +131,14 @@ TotalNumPoints = len(MatchedRMExtinctionData)
 We can now determine the optimal number of reference points using the calculated BLOS values as a function of 
 number of candidate reference points.
  '''
-Optimal_NumRefPoints = orp.stabilityCheckAlg(TrendDataTable) #[orp.minRefRMOn(MatchedRMExtinctionData, FilteredRefPoints, 1.5)] #orp.stabilityCheckAlg(TrendDataTable) #[orp.minRefRMOff(FilteredRefPoints, 1)]
+if config.stabilityThresholdMode == 'Exact':
+    # Every distinct result, with the width of the range of thresholds which gives it.
+    StabilityOutcomes = orp.stabilityCheckExact(TrendDataTable)
+    Optimal_NumRefPoints = list(StabilityOutcomes['Optimal Number of Reference Points'])
+    logging.info(loggingDivider)
+    logging.info("The optimal numbers of reference points found for every stability threshold are: \n {}".format(StabilityOutcomes))
+else:
+    Optimal_NumRefPoints = orp.stabilityCheckAlg(TrendDataTable, config.numStabilityThresholds, numWorkers=config.numWorkers) #[orp.minRefRMOn(MatchedRMExtinctionData, FilteredRefPoints, 1.5)] #orp.stabilityCheckAlg(TrendDataTable) #[orp.minRefRMOff(FilteredRefPoints, 1)]
 # -------- Find the optimal number of reference points using the trend data
 # The number of reference points should be greater than 3 (minimum valu in config) and less than half the total number of points
 minStablePoints = config.minRefPoints
@@ -161,19 +155,22 @@ if len(Optimal_NumRefPoints_Selection) < 1:
     for message in messages:
         logging.critical(message)
         print(message)
-OptimalNumRefPoints_from_AllPotentialRefPoints = orp.mode(Optimal_NumRefPoints_Selection)
+if config.stabilityThresholdMode == 'Exact':
+    OptimalNumRefPoints_from_AllPotentialRefPoints = orp.widestOutcome(StabilityOutcomes[StabilityOutcomes['Optimal Number of Reference Points'].isin(Optimal_NumRefPoints_Selection)])
+else:
+    OptimalNumRefPoints_from_AllPotentialRefPoints = orp.mode(Optimal_NumRefPoints_Selection)
 # -------- Find the optimal number of reference points using the trend data
 
 # -------- Solidify reference points.
 chosenRefPoints_Num = [i for i in range(OptimalNumRefPoints_from_AllPotentialRefPoints)] if config.UseOptRefPoints else [i for i in range(len(FilteredRefPoints.index))]
-chosenRefPoints = FilteredRefPoints.loc[chosenRefPoints_Num].sort_values('Extinction_Value')
+chosenRefPoints = FilteredRefPoints.loc[chosenRefPoints_Num].sort_values('Extinction_Value', kind='stable')
 # -------- Solidify reference points.
 
 # -------- FIND OPTIMAL NUMBER OF REFERENCE POINTS --------
 #======================================================================================================================
 # -------- ENSURE CHOSEN OPTIMAL NUMBER OF POINTS SAMPLES THE QUADRANTS FAIRLY --------
 # ---- Sort chosen ref points into quadrants
-Q1c, Q2c, Q3c, Q4c = rjl.sortQuadrants(list(chosenRefPoints.index), chosenRefPoints['Extinction_Index_x'], chosenRefPoints['Extinction_Index_y'], m, b, mPerp, bPerp)
+Q1c, Q2c, Q3c, Q4c = rjl.groupQuadrants(chosenRefPoints.index, chosenRefPoints[rjl.QUADRANT])
 # ---- Sort chosen ref points into quadrants
 
 # ---- Check to see which quadrants are undersampled as a result of the optimal selection of points
@@ -208,7 +205,12 @@ minSamples = minSamples+1 #Account for the index shift.
 
 # ---- Solidify ref points
 chosenRefPoints_After_Quadrants_Num = [i for i in range(minSamples)] if config.useQuadrantEnforce else chosenRefPoints_Num
-chosenRefPoints = FilteredRefPoints.loc[chosenRefPoints_After_Quadrants_Num].sort_values('Extinction_Value')
+if config.refPointSearch == 'Standard Error':
+    # Search all the filtered points for those with the smallest reference RM standard error, instead of the first points.
+    chosenRefPoints_After_Quadrants_Num = orp.searchRefSubset(FilteredRefPoints, config.minRefPoints,
+                                                              int(config.maxFracPointNum * TotalNumPoints),
+                                                              config.minPointsPerQuadrant if config.useQuadrantEnforce else 0)
+chosenRefPoints = FilteredRefPoints.loc[chosenRefPoints_After_Quadrants_Num].sort_values('Extinction_Value', kind='stable')
 # ---- Solidify ref points
 
 # ---- Log info
@@ -222,6 +224,7 @@ messages = ['By analyzing the stability of calculated BLOS values as a function
             "Q3: {}".format(Q3c),
             "Q4: {}".format(Q4c),
             "Additional points are taken until quadrants which could meet the minimum sampling criteria set in the configuration start settings,",
+            "The reference points are chosen with the {} search.".format(config.refPointSearch),
             "Given this information, the recommended reference points are {}.".format([i + 1 for i in chosenRefPoints_After_Quadrants_Num]),
             "Given this information, the remaining table is \n {}.".format(chosenRefPoints),
             'Please review the BLOS trend stability plot at {}.'.format(BLOSvsNRef_AllPotRefPointsPlot)]
@@ -245,7 +248,8 @@ extinction greater than the extinction of the last chosen reference point/
 RefPoints = chosenRefPoints[:-1].append(FilteredRefPoints.set_index('ID#').
                                         loc[list(chosenRefPoints['ID#'])[-1]:].reset_index())\
     .reset_index(drop=True)
-TrendDataTable = orp.findTrendData(RefPoints, MatchedRMExtinctionData, regionOfInterest)
+TrendDataTable = orp.findTrendData(RefPoints, MatchedRMExtinctionData, AvAbundanceTable, trendCache)
+logging.info("{} of the stability trend tables were reused from {}, and {} were calculated.".format(trendCache.numHits, StabilityTrendCacheDir, trendCache.numMisses))
 # ---- Check the trend data of the chosen reference points
 
 # ---- Create a figure
@@ -294,6 +298,22 @@ if config.useUserRefPtsJudgement:
     if len(user_chosen_ref_pts) > 0:
         print(f"The following points were chosen: {user_chosen_ref_pts}")
         logging.info(f"The following points were chosen: {user_chosen_ref_pts}")
+        # ---- Compare the software-recommended and the user-chosen reference points, evaluated together.
+        judgementMembership = np.array([AllPotentialRefPoints['ID#'].isin(chosenRefPoints['ID#']),
+                                        AllPotentialRefPoints['ID#'].isin(user_chosen_ref_pts)])
+        judgementWeights = rjl.getQuadrantWeights(judgementMembership, AllPotentialRefPoints[rjl.QUADRANT]) if config.weightingScheme == "Quadrant" else None
+        judgementRefData, judgementBLOS = orp.evaluateRefSets(AllPotentialRefPoints, judgementMembership, MatchedRMExtinctionData,
+                                                              AvAbundanceTable, judgementWeights)
+        # Each choice is judged on the on points 04 finds the BLOS of with it.
+        isJudgementOnPoint = np.array([MREF.isOnPoint(MatchedRMExtinctionData, AllPotentialRefPoints.loc[members],
+                                                      config.onPtsExtMultipleThreshold * refExtinction)
+                                       for members, refExtinction in zip(judgementMembership, judgementRefData['Reference Extinction'])])
+        judgementBLOS = np.where(isJudgementOnPoint, judgementBLOS, np.nan)
+        judgementRefData.index = ['Software-Recommended', 'User-Chosen']
+        judgementRefData['Median |BLOS| of On Points (uG)'] = np.nanmedian(np.abs(judgementBLOS), axis=1) if judgementBLOS.shape[1] > 0 else np.nan
+        print(f"The reference values of the software-recommended and the user-chosen points are: \n {judgementRefData}")
+        logging.info(f"The reference values of the software-recommended and the user-chosen points are: \n {judgementRefData}")
+        # ---- Compare the software-recommended and the user-chosen reference points.
         chosenRefPoints = AllPotentialRefPoints.copy()[AllPotentialRefPoints['ID#'].isin(user_chosen_ref_pts)]
     else:
         print("No points were chosen. The default program-suggested reference points will be used.")
@@ -302,33 +322,14 @@ if config.useUserRefPtsJudgement:
 
 #======================================================================================================================
 # -------- DETERMINE WEIGHTING SCHEME --------
-refRM = 0.0
-refAvgErr = 0.0
-refRMStd = 0.0
-refExtinc = 0.0
-
+# The chosen reference points are evaluated as a batch of one set.
+chosenMembership = np.ones((1, len(chosenRefPoints)), dtype=bool)
 if config.weightingScheme == "Quadrant":
-    # -------- Sort ref points into quadrants
-    Q1c, Q2c, Q3c, Q4c = rjl.sortQuadrants(list(chosenRefPoints.index), chosenRefPoints['Extinction_Index_x'],
-                                           chosenRefPoints['Extinction_Index_y'], m, b, mPerp, bPerp)
-    # -------- Sort ref points into quadrants
-    perQuadrantWeight = 1000000000.0 #Arbitrarily large number for weighting; large to avoid roundoff issues, but I dislike this method.
-    chosenPoints = []
-    weightPoints = []
-    for quadrant in [Q1c, Q2c, Q3c, Q4c]:
-        chosenPoints += quadrant #Notes on +=: When both inputs are lists, the result is list concatenation. Ex. A = [1], B = [2, 3], then A += B = [1, 2, 3]. Here, both objects are lists.
-        weightPoints += [perQuadrantWeight/(1.0*len(quadrant)) for _ in range(len(quadrant))] #Notes: The good news is that if the length of the quadrant was 0, then the for wouldn't even run.
-    refRM += np.average(chosenRefPoints.loc[chosenPoints]['Rotation_Measure(rad/m2)'], weights = weightPoints)
-    refExtinc += np.average(chosenRefPoints.loc[chosenPoints]['Extinction_Value'], weights = weightPoints)
-    refAvgErr += np.average(chosenRefPoints.loc[chosenPoints]['RM_Err(rad/m2)'], weights = weightPoints)
-    refRMStd += (np.sqrt(np.cov(chosenRefPoints.loc[chosenPoints]['Rotation_Measure(rad/m2)'], aweights=weightPoints)) / np.sqrt(len(chosenRefPoints.loc[chosenPoints]['Rotation_Measure(rad/m2)']))) #This is why we needed the weighted points method. Standard deviation.
-
+    # -------- Weight each quadrant equally, using the quadrant label of each point
+    chosenWeights = rjl.getQuadrantWeights(chosenMembership, chosenRefPoints[rjl.QUADRANT])
 else:
-    refRM = np.mean(chosenRefPoints['Rotation_Measure(rad/m2)'])
-    refAvgErr = np.mean(chosenRefPoints['RM_Err(rad/m2)'])
-    refRMStd = np.std(chosenRefPoints['Rotation_Measure(rad/m2)'], ddof=1) / np.sqrt(
-        len(chosenRefPoints['Rotation_Measure(rad/m2)']))
-    refExtinc = np.mean(chosenRefPoints['Extinction_Value'])
+    chosenWeights = None
+refRM, refAvgErr, refRMStd, refExtinc = [values[0] for values in MREF.calcSetFiducialVals(chosenRefPoints, chosenMembership, chosenWeights)]
 # -------- DETERMINE WEIGHTING SCHEME --------
 
 # -------- CALCULATE AND SAVE REFERENCE VALUES --------
@@ -354,6 +355,20 @@ logging.info(message)
 print(message)
 # -------- CALCULATE AND SAVE REFERENCE VALUES. --------
 
+# -------- FIND THE INFLUENCE OF EACH REFERENCE POINT --------
+# The on points are those 04 finds the BLOS of with these reference values.
+influenceOnPoints = MREF.getOnPoints(MatchedRMExtinctionData, chosenRefPoints, config.onPtsExtMultipleThreshold * refExtinc)
+InfluenceData = orp.leaveOneOutInfluence(chosenRefPoints, influenceOnPoints, AvAbundanceTable, config.weightingScheme)
+InfluenceData.to_csv(RefPointInfluenceFile, index=False, na_rep=config.missingDataRep, sep=config.dataSeparator)
+
+messages = ['The change in the reference values and BLOS values when each reference point is left out is: \n {}'.format(InfluenceData),
+            'The influence of each reference point was saved to {}'.format(RefPointInfluenceFile)]
+logging.info(loggingDivider)
+for message in messages:
+    logging.info(message)
+print(messages[-1])
+# -------- FIND THE INFLUENCE OF EACH REFERENCE POINT. --------
+
 # -------- SAVE REFERENCE POINTS  --------
 chosenRefPoints.to_csv(ChosenRefPointFile, index=False, sep=config.dataSeparator)
 
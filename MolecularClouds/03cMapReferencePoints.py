@@ -13,6 +13,7 @@ from LocalLibraries.RegionOfInterest import Region
 import LocalLibraries.config as config
 import LocalLibraries.PlotTemplates as pt
 import LocalLibraries.PlotUtils as putil
+import LocalLibraries.RefJudgeLib as rjl
 
 import logging
 
@@ -30,12 +31,6 @@ ChosenRefPointFile = config.ChosenRefPointFile
 
 QuadDivDataFile = config.QuadDivDataFile
 extinctionCoordinateDataFile = config.ExtinctionCoordDataFile
-
-NearRejectedRefPointsPath = config.NearExtinctRefPointFile
-FarRejectedRefPointsPath = config.FarExtinctRefPointFile
-AnomalousRejectedRefPointsPath = config.AnomRefPointFile
-RejectedRefPointsPath = config.RejRefPointFile
-RemainingRefPointsPath = config.FilteredRefPointsFile
 # ---- Input Files
 
 # ---- Output Files
@@ -70,11 +65,13 @@ extinctionCoordinateData = pd.read_csv(extinctionCoordinateDataFile, sep=config.
 
 QuadDivData = pd.read_csv(QuadDivDataFile, sep=config.dataSeparator)
 
-NearRejectedRefPoints = pd.read_csv(NearRejectedRefPointsPath, sep=config.dataSeparator)
-FarRejectedRefPoints = pd.read_csv(FarRejectedRefPointsPath, sep=config.dataSeparator)
-AnomalousRejectedRefPoints = pd.read_csv(AnomalousRejectedRefPointsPath, sep=config.dataSeparator)
-RejectedRefPoints = pd.read_csv(RejectedRefPointsPath, sep=config.dataSeparator)
-RemainingRefPoints = pd.read_csv(RemainingRefPointsPath, sep=config.dataSeparator)
+# ---- Select the categories of reference points by the reasons they were rejected
+NearRejectedRefPoints = rjl.getRejectedRefPoints(AllPotentialRefPoints, rjl.REJECTED_NEAR_HIGH_EXT)
+FarRejectedRefPoints = rjl.getRejectedRefPoints(AllPotentialRefPoints, rjl.REJECTED_FAR_HIGH_EXT)
+AnomalousRejectedRefPoints = rjl.getRejectedRefPoints(AllPotentialRefPoints, rjl.REJECTED_ANOMALOUS_RM)
+RejectedRefPoints = rjl.getRejectedRefPoints(AllPotentialRefPoints)
+RemainingRefPoints = rjl.getRemainingRefPoints(AllPotentialRefPoints)
+# ---- Select the categories of reference points by the reasons they were rejected.
 
 chosenRefPoints = pd.read_csv(ChosenRefPointFile, sep=config.dataSeparator)
 # ---- LOAD AND UNPACK MATCHED RM AND EXTINCTION DATA
@@ -0,0 +1,99 @@
+"""
+This file (03d) is an optional part of the third stage of the BLOSMapping method, to help choose the extinction threshold.
+It evaluates the filtering of 03a and the reference values of 03b for each of a list of extinction thresholds in one run,
+instead of editing the starting settings configuration and rerunning 03a-04 for every value.
+- Run it after 03a. The thresholds to evaluate are set in the starting settings configuration (Threshold Sweep).
+- The reference values are those of all the remaining points, without the stability trend or quadrant enforcement.
+"""
+import pandas as pd
+import numpy as np
+import math
+
+from LocalLibraries.RegionOfInterest import Region
+
+import LocalLibraries.config as config
+import LocalLibraries.RefJudgeLib as rjl
+import LocalLibraries.ThresholdSweepLib as tsl
+
+import logging
+
+# -------- LOAD THE REGION OF INTEREST --------
+cloudName = config.cloud
+regionOfInterest = Region(cloudName)
+# -------- LOAD THE REGION OF INTEREST. --------
+
+# -------- DEFINE FILES AND PATHS --------
+# ---- Input Files
+# Matched rm and extinction data
+MatchedRMExtinctFile = config.MatchedRMExtinctionFile
+# Threshold data of the region, from 03a
+extinctionCoordinateDataFile = config.ExtinctionCoordDataFile
+# ---- Input Files
+
+# ---- Output Files
+ThresholdSweepDataFile = config.ThresholdSweepDataFile
+LogFile = config.Script03dFile
+# ---- Output Files
+# -------- DEFINE FILES AND PATHS. --------
+
+# -------- CONFIGURE LOGGING --------
+logging.basicConfig(filename=LogFile, filemode='w', format=config.logFormat, level=logging.INFO)
+loggingDivider = config.logSectionDivider
+# -------- CONFIGURE LOGGING --------
+
+# ---- LOAD AND UNPACK MATCHED RM AND EXTINCTION DATA
+MatchedRMExtinctionData = pd.read_csv(MatchedRMExtinctFile, sep=config.dataSeparator)
+extinctionCoordinateData = pd.read_csv(extinctionCoordinateDataFile, sep=config.dataSeparator)
+# ---- LOAD AND UNPACK MATCHED RM AND EXTINCTION DATA
+
+# -------- LOAD THE THRESHOLDS TO EVALUATE --------
+# The thresholds are multiples of the average extinction if the thresholds of 03a are.
+avgExt = extinctionCoordinateData['Average Extinction'][0]
+thresholds = [threshold * avgExt if config.avgExtMultiplier else threshold for threshold in config.sweepThresholds]
+# -------- LOAD THE THRESHOLDS TO EVALUATE. --------
+
+# -------- PREPARE THE MATCHED POINTS --------
+# ---- Define the near and far ranges, as 03a does
+cloudDistance = regionOfInterest.distance  # [pc]
+cloudJeansLength = regionOfInterest.jeanslength  # [pc]
+minDiff = np.degrees(np.arctan(cloudJeansLength / cloudDistance))  # [deg]
+
+degPerPix = abs(regionOfInterest.hdu.header['CDELT1'])
+minDiff_pix = minDiff / degPerPix
+NDeltNear = config.nearExtinctionMultiplier * math.ceil(minDiff_pix)  # Round up
+NDeltFar = config.farExtinctionMultiplier * math.ceil(minDiff_pix)  # Round up
+# ---- Define the near and far ranges.
+
+# ---- Find the highest extinction near every pixel, which decides near and far for every threshold.
+nearBoxMaxima = rjl.getHighExtBoxMaxima(regionOfInterest.hdu.data, NDeltNear)
+farBoxMaxima = rjl.getHighExtBoxMaxima(regionOfInterest.hdu.data, NDeltFar)
+# ---- Find the highest extinction near every pixel.
+
+sweepPoints = tsl.getSweepPoints(MatchedRMExtinctionData, nearBoxMaxima, farBoxMaxima, MatchedRMExtinctionData[rjl.QUADRANT])
+# -------- PREPARE THE MATCHED POINTS. --------
+
+# -------- EVALUATE EVERY THRESHOLD --------
+sweepSettings = {'highExtinctionThreshMultiplier': config.highExtinctionThreshMultiplier,
+                 'useNearExtinctionRemove': config.useNearExtinctionRemove,
+                 'useFarExtinctionRemove': config.useFarExtinctionRemove,
+                 'anomalousIQRNum': config.anomalousIQRNum,
+                 'useAnomalousRemove': config.useanomalousIQRNumRemove,
+                 'maxRefPoints': int(round(len(MatchedRMExtinctionData.index) * config.maxFracPointNum)),
+                 'weightingScheme': config.weightingScheme,
+                 'minPointsPerQuadrant': config.minPointsPerQuadrant}
+ThresholdSweepData = tsl.sweepThresholds(sweepPoints, thresholds, sweepSettings)
+ThresholdSweepData.to_csv(ThresholdSweepDataFile, index=False, sep=config.dataSeparator)
+# -------- EVALUATE EVERY THRESHOLD. --------
+
+# ---- Log info
+messages = ['The filtering of 03a and the reference values of all remaining points were evaluated for the extinction thresholds {}.'.format(thresholds),
+            'The extinction threshold currently used by 03a is {}.'.format(extinctionCoordinateData['Extinction Threshold'][0]),
+            "\t-A close region around the point has been defined to the configuration-selected {} pixels".format(NDeltNear),
+            "\t-A far region around the point has been defined to the configuration-selected {} pixels".format(NDeltFar),
+            "The results are: \n {}".format(ThresholdSweepData),
+            'Threshold sweep data was saved to {}'.format(ThresholdSweepDataFile)]
+logging.info(loggingDivider)
+for message in messages:
+    logging.info(message)
+print(messages[-1])
+# ---- Log info
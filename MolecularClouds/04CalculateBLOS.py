@@ -1,15 +1,18 @@
 """
 This is the fourth stage of the BLOSMapping method where the BLOS values are calculated using the reference points selected in
-the previous stage.  This file also produces a scatter plot of BLOS points.
+the previous stage.  This file also produces a scatter plot of BLOS points, and bootstrap intervals of the BLOS values
+due to the choice of reference points if they are turned on in the starting settings configuration.
 """
 import math
 import pandas as pd
+import numpy as np
 
 import matplotlib.pyplot as plt
 from LocalLibraries.RegionOfInterest import Region
-from LocalLibraries.CalculateB import CalculateB
+from LocalLibraries.CalculateB import CalculateB, loadAbundanceTable
 
 import LocalLibraries.MatchedRMExtinctionFunctions as MREF
+import LocalLibraries.BootstrapLib as bsl
 import LocalLibraries.config as config
 import LocalLibraries.PlotTemplates as pt
 import LocalLibraries.PlotUtils as putil
@@ -30,6 +33,7 @@ MatchedRMExtinctFile = config.MatchedRMExtinctionFile
 #Output Files
 BLOSPointsFile = config.BLOSPointsFile
 BLOSPointsPlotFile = config.BLOSPointsPlot
+BLOSBootstrapFile = config.BLOSBootstrapFile
 LogFile = config.Script04File
 # -------- DEFINE FILES AND PATHS. --------
 
@@ -45,14 +49,15 @@ RefData = pd.read_csv(ChosenRefDataFile, sep=config.dataSeparator)
 
 # -------- DETERMINE REMAINING POINTS AFTER FILTERING --------
 fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction = MREF.unpackRefData(RefData)
-RemainingPointTable = MREF.rmMatchingPts(MatchedRMExtinctTable, RefPointTable)
 ExtLimit = config.onPtsExtMultipleThreshold * fiducialExtinction
-RemainingPointTable = MREF.rmLowExtPts(RemainingPointTable, ExtLimit)
+RemainingPointTable = MREF.getOnPoints(MatchedRMExtinctTable, RefPointTable, ExtLimit)
 # -------- DETERMINE REMAINING POINTS AFTER FILTERING --------
 # =====================================================================================================================
 
 # -------- CALCULATE BLOS --------
-BLOSData = CalculateB(regionOfInterest.AvFilePath, RemainingPointTable, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction, NegativeExtinctionEntriesChange = config.negScaledExtOption)
+# The abundance data is loaded once, for the BLOS of the on points, their bootstrap intervals and the reference points.
+AvAbundanceTable = loadAbundanceTable(regionOfInterest.AvFilePath)
+BLOSData = CalculateB(AvAbundanceTable, RemainingPointTable, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction, NegativeExtinctionEntriesChange = config.negScaledExtOption)
 BLOSData.to_csv(BLOSPointsFile, index=False, na_rep=config.missingDataRep, sep=config.dataSeparator)
 
 message = 'Saving calculated magnetic field values to ' + BLOSPointsFile
@@ -60,6 +65,26 @@ logging.info(message)
 print(message)
 # -------- CALCULATE BLOS. --------
 
+# -------- FIND THE BOOTSTRAP UNCERTAINTY OF THE REFERENCE POINTS --------
+if config.useBootstrap:
+    BootstrapData, fiducialIntervals = bsl.bootstrapBLOS(RefPointTable, BLOSData, AvAbundanceTable,
+                                                         numSamples=config.numBootstrapSamples,
+                                                         confidence=config.bootstrapConfidence, seed=config.bootstrapSeed,
+                                                         weightingScheme=config.weightingScheme,
+                                                         NegativeExtinctionEntriesChange=config.negScaledExtOption,
+                                                         numWorkers=config.numWorkers)
+    BootstrapData.to_csv(BLOSBootstrapFile, index=False, na_rep=config.missingDataRep, sep=config.dataSeparator)
+
+    messages = ['The chosen reference points were resampled {} times with seed {}.'.format(config.numBootstrapSamples, config.bootstrapSeed),
+                'The median and {}% interval of the reference RM are {:.4f} [{:.4f}, {:.4f}] rad/m^2.'.format(config.bootstrapConfidence, *fiducialIntervals['Reference RM']),
+                'The median and {}% interval of the reference extinction are {:.4f} [{:.4f}, {:.4f}] mag.'.format(config.bootstrapConfidence, *fiducialIntervals['Reference Extinction']),
+                'The median width of the BLOS intervals is {} uG.'.format(np.nanmedian(BootstrapData['Bootstrap Interval Width(uG)']) if len(BootstrapData) > 0 else np.nan),
+                'Saving the bootstrap intervals of the magnetic field values to ' + BLOSBootstrapFile]
+    for message in messages:
+        logging.info(message)
+    print(messages[-1])
+# -------- FIND THE BOOTSTRAP UNCERTAINTY OF THE REFERENCE POINTS. --------
+
 # =====================================================================================================================
 
 # -------- PREPARE TO PLOT BLOS POINTS --------
@@ -94,7 +119,7 @@ pt.labelPoints(ax, n, x, y, textFix = config.textFix)
 # -------- PREPARE TO PLOT REF BLOS POINTS --------
 # ---- CALCULATE REF POINT BLOS.
 #Utilized only for the plot which includes the reference points used to find the BLOS
-RefBLOSData = CalculateB(regionOfInterest.AvFilePath, RefPointTable, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction, NegativeExtinctionEntriesChange="None")
+RefBLOSData = CalculateB(AvAbundanceTable, RefPointTable, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction, NegativeExtinctionEntriesChange="None")
 # ---- CALCULATE REF POINT BLOS.
 
 Refn = list(RefBLOSData['ID#'])
@@ -6,7 +6,7 @@ This is the fifth stage of the BLOSMapping method where the dependence on densit
 import os
 import pandas as pd
 
-from LocalLibraries.CalculateB import CalculateB
+from LocalLibraries.CalculateB import CalculateBBatch
 from LocalLibraries.RegionOfInterest import Region
 import LocalLibraries.config as config
 import LocalLibraries.MatchedRMExtinctionFunctions as MREF
@@ -51,13 +51,13 @@ p = [1, 2.5, 5, 10, 20, 30, 40, 50]  # Percents of the input density
 percent = ['-{}'.format(i) for i in p[::-1]] + ['0'] + ['+{}'.format(i) for i in p]
 errPercent = []
 
-for value in percent:
-    #Load the abundance file paths with the appropriate values.
-    AvAbundanceFile = config.template_AvAbundanceData.format(0, value)
-    AvAbundancePath = os.path.join(regionOfInterest.AvFileDir, AvAbundanceFile)
+#Load the abundance file paths with the appropriate values.
+AvAbundancePaths = [os.path.join(regionOfInterest.AvFileDir, config.template_AvAbundanceData.format(0, value)) for value in percent]
+#Calculate the magnetic fields given these paths, for all of them at once
+BTables = CalculateBBatch(AvAbundancePaths, RemainingTable, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction, NegativeExtinctionEntriesChange = config.negScaledExtOption)
+
+for value, B in zip(percent, BTables):
     saveFilePath = DensVaryFileTemplate.format(value)
-    #Calculate the magnetic fields given these paths
-    B = CalculateB(AvAbundancePath, RemainingTable, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction, NegativeExtinctionEntriesChange = config.negScaledExtOption)
     B.to_csv(saveFilePath, index=False, na_rep=config.missingDataRep, sep=config.dataSeparator)
     #If there are any missing values in the calculation, warn the user.
     if B.isnull().values.any():
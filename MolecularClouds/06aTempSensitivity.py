@@ -5,7 +5,7 @@ This is the sixth stage the BLOSMapping method where the dependence on temperatu
 """
 import os
 import pandas as pd
-from LocalLibraries.CalculateB import CalculateB
+from LocalLibraries.CalculateB import CalculateBBatch
 from LocalLibraries.RegionOfInterest import Region
 import LocalLibraries.config as config
 
@@ -50,13 +50,13 @@ p = [5, 10, 20]  # Percents of the input temperature
 percent = ['-{}'.format(i) for i in p[::-1]] + ['0'] + ['+{}'.format(i) for i in p]
 errPercent = []
 
-for value in percent:
-    # Load the abundance file paths with the appropriate values.
-    AvAbundanceFile = config.template_AvAbundanceData.format(value, 0)
-    AvAbundancePath = os.path.join(regionOfInterest.AvFileDir, AvAbundanceFile)
+# Load the abundance file paths with the appropriate values.
+AvAbundancePaths = [os.path.join(regionOfInterest.AvFileDir, config.template_AvAbundanceData.format(value, 0)) for value in percent]
+# Calculate the magnetic fields given these paths, for all of them at once
+BTables = CalculateBBatch(AvAbundancePaths, RemainingTable, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction, NegativeExtinctionEntriesChange = config.negScaledExtOption)
+
+for value, B in zip(percent, BTables):
     saveFilePath = TempVaryTemplate.format(value)
-    # Calculate the magnetic fields given these paths
-    B = CalculateB(AvAbundancePath, RemainingTable, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction, NegativeExtinctionEntriesChange = config.negScaledExtOption)
     B.to_csv(saveFilePath, index=False, na_rep=config.missingDataRep, sep=config.dataSeparator)
     # If there are any missing values in the calculation, warn the user.
     if B.isnull().values.any():
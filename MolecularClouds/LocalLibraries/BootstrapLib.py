@@ -0,0 +1,134 @@
+'''
+This module contains functions to find the uncertainty of the BLOS values that comes from the choice of reference
+points, by bootstrap resampling of the reference points.
+
+- Every bootstrap sample draws as many reference points as were chosen, with replacement, and finds its reference values
+    as 03b does. Samples are drawn in chunks of a fixed size, each from its own seeded generator, so the result only
+    depends on the seed and not on the number of worker processes.
+- The BLOS of the on points is then found for every sample, for a block of points at a time, and only the percentiles of
+    each block are kept. No more than a chunk of samples or a block of BLOS values is held in memory at once.
+'''
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from . import ParallelLib as PL
+from . import OptimalRefPoints as orp
+from . import CalculateB as CB
+
+BOOTSTRAP_COLUMNS = ['ID#', 'Magnetic_Field(uG)', 'Bootstrap Median BLOS(uG)', 'Bootstrap Lower BLOS(uG)',
+                     'Bootstrap Upper BLOS(uG)', 'Bootstrap Interval Width(uG)']
+
+
+def bootstrapFiducialChunk(arrays, chunk):
+    '''
+    Finds the reference values of a chunk of bootstrap samples of the reference points.
+    :param arrays: A dictionary of the 'RM', 'Extinction' and 'Quadrant' numpy arrays of the reference points.
+    :param chunk: A tuple of (number of samples, seed sequence of the chunk, weighting scheme).
+    :return: fiducialRM, fiducialExtinction - numpy arrays of the reference values of each sample of the chunk.
+    '''
+    numSamples, seedSequence, weightingScheme = chunk
+    rm = arrays['RM']
+    numPoints = len(rm)
+    rng = np.random.default_rng(seedSequence)
+
+    # The number of times each reference point is drawn in each sample, as the weights of the point in the sample.
+    draws = rng.integers(0, numPoints, size=(numSamples, numPoints)) + numPoints * np.arange(numSamples)[:, np.newaxis]
+    weights = np.bincount(draws.ravel(), minlength=numSamples * numPoints).reshape(numSamples, numPoints).astype(float)
+    if weightingScheme == 'Quadrant':
+        # Each quadrant drawn has equal weight, shared between the draws of the quadrant.
+        quadrants = arrays['Quadrant']
+        quadrantDraws = weights @ (quadrants[:, np.newaxis] == np.arange(5)[np.newaxis, :])
+        weights = weights / np.where(weights > 0, quadrantDraws[:, quadrants], 1.0)
+
+    sumWeights = np.sum(weights, axis=1)
+    fiducialRM = np.sum(weights * rm, axis=1) / sumWeights
+    fiducialExtinction = np.sum(weights * arrays['Extinction'], axis=1) / sumWeights
+    return fiducialRM, fiducialExtinction
+
+
+def bootstrapBLOSBlock(arrays, block):
+    '''
+    Finds the percentiles of the BLOS of a block of on points over all the bootstrap samples.
+    :param arrays: A dictionary of the 'onRM' and 'onExtinction' numpy arrays of the on points, the 'fiducialRM' and
+        'fiducialExtinction' numpy arrays of the samples, and the 'Av', 'e-' and 'layerSums' numpy arrays of the abundance
+        data.
+    :param block: A tuple of (start, stop, percentiles, NegativeExtinctionEntriesChange).
+    :return: A numpy array (number of percentiles x number of points of the block).
+    '''
+    start, stop, percentiles, negativeOption = block
+    BLOS, _ = orp.scaledBLOS(arrays['onRM'][start:stop], arrays['onExtinction'][start:stop], arrays['fiducialRM'],
+                             arrays['fiducialExtinction'],
+                             {'Av': arrays['Av'], 'e-': arrays['e-'], 'layerSums': arrays['layerSums']}, negativeOption)
+    with warnings.catch_warnings():
+        # Points which have no BLOS in any sample have nan percentiles.
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanpercentile(BLOS, percentiles, axis=0)
+
+
+def bootstrapBLOS(refPoints, BLOSData, AvAbundanceData, numSamples=2000, confidence=95, seed=0,
+                  weightingScheme='None', NegativeExtinctionEntriesChange='Delete', chunkSize=250, maxBlockSize=2**22,
+                  numWorkers=1):
+    '''
+    Finds bootstrap percentile intervals of the reference values and of the BLOS of every on point.
+    :param refPoints: The chosen reference points. PANDAS table.
+    :param BLOSData: The BLOS of the on points, from CalculateB. PANDAS table.
+    :param AvAbundanceData: The extinction and abundance data produced by chemical evolution code. PANDAS table, or a
+        table from CalculateB.loadAbundanceTable.
+    :param numSamples: The number of bootstrap samples. Int.
+    :param confidence: The width of the interval, in percent. Float.
+    :param seed: The seed of the random number generator. Int.
+    :param weightingScheme: 'Quadrant' to give each quadrant equal weight in a sample, otherwise every draw has equal
+        weight.
+    :param NegativeExtinctionEntriesChange: What to do about negative scaled extinction entries. See orp.scaledBLOS.
+    :param chunkSize: The number of samples drawn from each generator. Changing it changes the samples drawn. Int.
+    :param maxBlockSize: The most (samples x on points) BLOS values found at once, to bound the memory used. Int.
+    :param numWorkers: The number of worker processes. 0 uses one per available core. The result does not depend on it.
+    :return: BootstrapData - A PANDAS table of BOOTSTRAP_COLUMNS, one row per on point.
+        fiducialIntervals - A dictionary of 'Reference RM' and 'Reference Extinction': numpy array of the median, lower
+        and upper percentiles of the reference value.
+    '''
+    percentiles = [50, 50 - confidence / 2, 50 + confidence / 2]
+
+    # -------- FIND THE REFERENCE VALUES OF EVERY SAMPLE --------
+    chunks = PL.splitIntoChunks(numSamples, chunkSize)
+    seedSequences = np.random.SeedSequence(seed).spawn(len(chunks))
+    refArrays = {'RM': refPoints['Rotation_Measure(rad/m2)'].to_numpy(dtype=float),
+                 'Extinction': refPoints['Extinction_Value'].to_numpy(dtype=float),
+                 'Quadrant': refPoints['Quadrant'].to_numpy(dtype=int) if weightingScheme == 'Quadrant'
+                 else np.zeros(len(refPoints), dtype=int)}
+    chunkResults = PL.mapWithSharedArrays(bootstrapFiducialChunk,
+                                          [(stop - start, seedSequence, weightingScheme)
+                                           for (start, stop), seedSequence in zip(chunks, seedSequences)],
+                                          refArrays, numWorkers)
+    fiducialRM = np.concatenate([result[0] for result in chunkResults])
+    fiducialExtinction = np.concatenate([result[1] for result in chunkResults])
+    fiducialIntervals = {'Reference RM': np.percentile(fiducialRM, percentiles),
+                         'Reference Extinction': np.percentile(fiducialExtinction, percentiles)}
+    # -------- FIND THE REFERENCE VALUES OF EVERY SAMPLE. --------
+
+    # -------- FIND THE BLOS PERCENTILES OF EVERY ON POINT --------
+    numOnPoints = len(BLOSData)
+    blockArrays = {'onRM': BLOSData['RM_Raw_Value'].to_numpy(dtype=float),
+                   'onExtinction': BLOSData['Extinction'].to_numpy(dtype=float),
+                   'fiducialRM': fiducialRM, 'fiducialExtinction': fiducialExtinction,
+                   'Av': np.asarray(AvAbundanceData['Av'], dtype=float), 'e-': np.asarray(AvAbundanceData['e-'], dtype=float)}
+    blockArrays['layerSums'] = CB.layerColumnSums(blockArrays['Av'], blockArrays['e-'])
+    # Blocks are bounded in size, and shared between the worker processes when there is more than one.
+    blockSize = max(min(maxBlockSize // max(numSamples, 1), -(-numOnPoints // PL.getWorkerCount(numWorkers))), 1)
+    blocks = PL.splitIntoChunks(numOnPoints, blockSize)
+    blockResults = PL.mapWithSharedArrays(bootstrapBLOSBlock,
+                                          [(start, stop, percentiles, NegativeExtinctionEntriesChange) for start, stop in blocks],
+                                          blockArrays, numWorkers)
+    BLOSPercentiles = np.concatenate(blockResults, axis=1) if blockResults else np.empty((len(percentiles), 0))
+    # -------- FIND THE BLOS PERCENTILES OF EVERY ON POINT. --------
+
+    BootstrapData = pd.DataFrame({'ID#': BLOSData['ID#'].to_numpy(),
+                                  'Magnetic_Field(uG)': BLOSData['Magnetic_Field(uG)'].to_numpy(dtype=float),
+                                  'Bootstrap Median BLOS(uG)': BLOSPercentiles[0],
+                                  'Bootstrap Lower BLOS(uG)': BLOSPercentiles[1],
+                                  'Bootstrap Upper BLOS(uG)': BLOSPercentiles[2],
+                                  'Bootstrap Interval Width(uG)': BLOSPercentiles[2] - BLOSPercentiles[1]},
+                                 columns=BOOTSTRAP_COLUMNS)
+    return BootstrapData, fiducialIntervals
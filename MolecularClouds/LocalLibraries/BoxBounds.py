@@ -89,3 +89,48 @@ def getBoxBound(px, py, data, NDelt):
     ind_ymax = int(min(ind_ymax, data.shape[0]))
 
     return ind_xmin, ind_xmax, ind_ymin, ind_ymax
+
+
+def getBoxBoundArrays(px, py, data, NDelt):
+    '''
+    Returns valid bounds of boxes around many coordinates at once. Vectorized form of getBoxBound.
+    :param px: Numpy array of the x coordinates of the centers of the boxes
+    :param py: Numpy array of the y coordinates of the centers of the boxes
+    :param data: A data canvas, to make sure the boxes are within the bounds of the canvas.
+    :param NDelt: Number of pixels horizontally and vertically from the center to extend out each box. Scalar or numpy array.
+    :return: ind_xmin, ind_xmax, ind_ymin, ind_ymax - Numpy arrays of the x and y bounds of the boxes.
+    '''
+    px = np.asarray(px)
+    py = np.asarray(py)
+    NDelt = np.asarray(NDelt).astype(int)
+
+    ind_xmin = np.clip(px - NDelt, 0, data.shape[1]).astype(int)
+    ind_xmax = np.clip(px + NDelt + 1, 0, data.shape[1]).astype(int)  # add 1 to be inclusive of the upper bound
+    ind_ymin = np.clip(py - NDelt, 0, data.shape[0]).astype(int)
+    ind_ymax = np.clip(py + NDelt + 1, 0, data.shape[0]).astype(int)  # add 1 to be inclusive of the upper bound
+
+    return ind_xmin, ind_xmax, ind_ymin, ind_ymax
+
+
+def summedAreaTable(mask):
+    '''
+    Builds the summed-area table of a mask, for counting its True pixels within boxes with countInBoxes.
+    :param mask: A 2d boolean numpy array.
+    :return: A 2d numpy array, one larger than the mask in each dimension, of the count of True pixels above and to the left.
+    '''
+    table = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+    table[1:, 1:] = np.cumsum(np.cumsum(mask, axis=0, dtype=np.int64), axis=1)
+    return table
+
+
+def countInBoxes(table, px, py, NDelt):
+    '''
+    Counts the True pixels of a mask within the box around each of many coordinates.
+    :param table: The summed-area table of the mask. See summedAreaTable.
+    :param px: Numpy array of the x coordinates of the centers of the boxes
+    :param py: Numpy array of the y coordinates of the centers of the boxes
+    :param NDelt: Number of pixels horizontally and vertically from the center to extend out each box. Scalar or numpy array.
+    :return: Numpy array of the number of True pixels in each box.
+    '''
+    ind_xmin, ind_xmax, ind_ymin, ind_ymax = getBoxBoundArrays(px, py, table[1:, 1:], NDelt)
+    return table[ind_ymax, ind_xmax] - table[ind_ymin, ind_xmax] - table[ind_ymax, ind_xmin] + table[ind_ymin, ind_xmin]
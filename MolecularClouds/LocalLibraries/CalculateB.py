@@ -1,100 +1,223 @@
 """
 Contains the functions to calculate BLOS values.
 """
-import math
 
 import pandas as pd
 import numpy as np
 from . import config
 
-def electronColumnDensity(Av, eAbundance, indLayerOfInterest, ScaledExtinction):
+def layerColumnSums(Av, eAbundance):
+    '''
+    Finds the running sum over the layers of the cloud that the electron column density is built from.
+    :param Av: Per layer extinction value of the cloud. List/iterable.
+    :param eAbundance: Per layer electron abundance of the cloud. List/iterable.
+    :return: A numpy array where element j is the sum of (Av[i] - Av[i - 1]) * eAbundance[i] over the layers i = 1 to j.
+    '''
+    Av = np.asarray(Av, dtype=float)
+    eAbundance = np.asarray(eAbundance, dtype=float)
+    return np.concatenate(([0.0], np.cumsum(np.diff(Av) * eAbundance[1:])))
+
+def electronColumnDensity(Av, eAbundance, indLayerOfInterest, ScaledExtinction, layerSums=None):
     '''
     Finds the electron column density.
+    - The sum over the layers above the layer of interest is read from the running sum over the layers.
+    - In the partial layer, the interpolated electron abundance is that of the layer above the layer of interest.
 
     :param Av: The extinction of the cloud. List.
     :param eAbundance: The electron abundances per layer of the cloud. List.
-    :param indLayerOfInterest: The layers of interest in the cloud. List.
-    :param ScaledExtinction: The extinction corresponding to the layer cared about. List.
-    :return: LayerNe: The electron column density for each of the input layers of interest. List.
+    :param indLayerOfInterest: The layers of interest in the cloud; nan where there is none. List or numpy array of any shape.
+    :param ScaledExtinction: The extinction corresponding to the layer cared about. List or numpy array of the same shape.
+    :param layerSums: Optional. The running sum over the layers, from layerColumnSums, if already found for this cloud.
+    :return: LayerNe: The electron column density for each of the input layers of interest. Numpy array.
     '''
     # -------- LOAD CONSTANT INFO FROM CONFIG --------
     conversionFactor = config.VExtinct_2_Hcol  # to convert extinction to H column density
     # -------- LOAD CONSTANT INFO FROM CONFIG --------
 
     # -------- CALCULATE THE TOTAL ELECTRON COLUMN DENSITY --------
-    LayerNe = []
-    # -------- Matched Extinction Value
-    # For each BLOS point:
-    for i, val in enumerate(indLayerOfInterest):
-        # Temporary value
-        tempSumAvSubXe = 0
-        if math.isnan(val):
-            tempSumAvSubXe = math.nan
-        elif val != 0:
-            for index3 in range(1, val):
-                tempSumAvSubXe = tempSumAvSubXe + ((Av[index3] - Av[index3 - 1]) * eAbundance[index3])
-            # Interpolate:
-            xp = [Av[val], Av[val - 1]]
-            fp = [eAbundance[val], eAbundance[val - 1]]
-            interpAv = (ScaledExtinction[i] / 2)
-            interpEAbund = np.interp(interpAv, xp, fp)
-            tempSumAvSubXe = tempSumAvSubXe + ((Av[0]) * eAbundance[0]) + (interpAv - Av[val - 1]) * interpEAbund
-        else:
-            tempSumAvSubXe = tempSumAvSubXe + ((Av[0]) * eAbundance[0])
-        LayerNe.append(tempSumAvSubXe * conversionFactor)
-    return LayerNe
-    # -------- Matched Extinction Value.
+    Av = np.asarray(Av, dtype=float)
+    eAbundance = np.asarray(eAbundance, dtype=float)
+    layerSums = layerColumnSums(Av, eAbundance) if layerSums is None else layerSums
+    indLayerOfInterest = np.asarray(indLayerOfInterest, dtype=float)
+    noLayer = np.isnan(indLayerOfInterest)
+    indLayer = np.where(noLayer, 0, indLayerOfInterest).astype(int)
+    indLayerAbove = np.maximum(indLayer - 1, 0)
+
+    surface = Av[0] * eAbundance[0]
+    interpAv = np.asarray(ScaledExtinction, dtype=float) / 2
+    partialLayer = (interpAv - Av[indLayerAbove]) * eAbundance[indLayerAbove]
+    LayerNe = np.where(indLayer == 0, surface, layerSums[indLayerAbove] + surface + partialLayer)
+    LayerNe = np.where(noLayer, np.nan, LayerNe)
+    return LayerNe * conversionFactor
+    # -------- CALCULATE THE TOTAL ELECTRON COLUMN DENSITY. --------
 
 def findLayerOfInterest(Av, eAbundance, scaledExtinction):
     '''
     Finds the layer depth and the associated electron abundance of that layer given the extinction of
     :param Av: Per layer extinction value of the cloud. List/iterable.
     :param eAbundance: Per layer electron abundance of the cloud. List/iterable.
-    :param scaledExtinction: A list of extinctions for which the user wants to find the layer depth and electron abundance for. List/iterable.
+    :param scaledExtinction: The extinctions for which the user wants to find the layer depth and electron abundance for. List/iterable/numpy array of any shape.
     :return:
-        eAbundanceMatched: The electron abundance. List.
-        indLayerOfInterest: The number of layers deep corresponding to the input extinction. List.
+        eAbundanceMatched: The electron abundance. Numpy array.
+        indLayerOfInterest: The number of layers deep corresponding to the input extinction; nan where there is none. Numpy array.
     '''
     # -------- FIND THE LAYER OF INTEREST --------
-    eAbundanceMatched = []
-    indLayerOfInterest = []
-
-    # For each BLOS point:
-    for i in range(0, len(scaledExtinction)):
-        '''We want to find the layer that is closest in value and greater than the half the scaled 
-         extinction value. Since Av is a list ordered from least to greatest, this corresponds to the first location 
-         where Av is greater than half the scaled extinction value 
-        '''
-        try:
-            ind = np.where(Av >= scaledExtinction[i] / 2)[0][0]
-            indLayerOfInterest.append(ind)
-            eAbundanceMatched.append(eAbundance[ind])
-        except:
-            indLayerOfInterest.append(math.nan)
-            eAbundanceMatched.append(math.nan)
+    Av = np.asarray(Av, dtype=float)
+    eAbundance = np.asarray(eAbundance, dtype=float)
+    halfExtinction = np.asarray(scaledExtinction, dtype=float) / 2
+
+    '''We want to find the layer that is closest in value and greater than the half the scaled 
+     extinction value. Since Av is a list ordered from least to greatest, this corresponds to the first location 
+     where Av is greater than half the scaled extinction value. The running maximum of Av keeps this true even where
+     Av is not ordered.
+    '''
+    ind = np.searchsorted(np.maximum.accumulate(Av), halfExtinction, side='left')
+    # No layer is deep enough for extinctions beyond the last layer, and none is found for nan extinctions.
+    noLayer = np.isnan(halfExtinction) | (ind >= len(Av))
+    ind = np.where(noLayer, 0, ind)
 
+    indLayerOfInterest = np.where(noLayer, np.nan, ind)
+    eAbundanceMatched = np.where(noLayer, np.nan, eAbundance[ind])
     return eAbundanceMatched, indLayerOfInterest
     # -------- FIND THE LAYER OF INTEREST. --------
 
+def loadAbundanceTable(AvAbundancePath):
+    '''
+    Loads the extinction and electron abundance of each layer of the cloud, with the running sum over its layers.
+    :param AvAbundancePath: Path to extinction data produced by chemical evolution code.
+    :return: A dictionary of 'Av', 'e-' and 'layerSums' numpy arrays. See layerColumnSums.
+    '''
+    AvAbundanceData = pd.read_csv(AvAbundancePath, delim_whitespace=True, skiprows=1)
+    Av = AvAbundanceData["Av"].to_numpy(dtype=float)
+    eAbundance = AvAbundanceData["e-"].to_numpy(dtype=float)
+    return {'Av': Av, 'e-': eAbundance, 'layerSums': layerColumnSums(Av, eAbundance)}
+
+def calculateBArrays(RM, Extinction, fiducialRM, fiducialExtinction, AvAbundanceTable, RMErr=None, MinExtinction=None,
+                     MaxExtinction=None, fiducialRMAvgErr=0, fiducialRMStd=0, NegativeExtinctionEntriesChange="Delete"):
+    '''
+    Calculates BLOS from arrays, as CalculateB does for a table of points. The inputs broadcast against each other, so
+    that the BLOS of the same points can be found for many sets of reference values at once, for example by giving the
+    fiducial values the shape (number of sets, 1).
+
+    :param RM: The rotation measure of the points. Numpy array.
+    :param Extinction: The extinction of the points. Numpy array.
+    :param fiducialRM: Reference RM. Float or numpy array.
+    :param fiducialExtinction: Reference extinction. Float or numpy array.
+    :param AvAbundanceTable: The abundance data of the cloud; a dictionary of 'Av' and 'e-' numpy arrays (and optionally
+        'layerSums'), such as from loadAbundanceTable. A list of them finds BLOS for each, stacked along a new first axis.
+    :param RMErr: Optional. The rotation measure error of the points. Numpy array.
+    :param MinExtinction: Optional. The minimum extinction near each point. Numpy array.
+    :param MaxExtinction: Optional. The maximum extinction near each point. Numpy array.
+    :param fiducialRMAvgErr: Average Error of the Reference RM. Float or numpy array.
+    :param fiducialRMStd: Standard Deviation of the Reference RM. Float or numpy array.
+    :param NegativeExtinctionEntriesChange: What to do about negative scaled extinction entries; Zero sets their magnetic
+        fields to 0 and Delete sets them to nan. Default is set to Delete. String.
+    :return: A dictionary of column name of CalculateB: numpy array, for the columns which can be found from the inputs.
+    '''
+    if isinstance(AvAbundanceTable, (list, tuple)):
+        results = [calculateBArrays(RM, Extinction, fiducialRM, fiducialExtinction, table, RMErr, MinExtinction,
+                                    MaxExtinction, fiducialRMAvgErr, fiducialRMStd, NegativeExtinctionEntriesChange)
+                   for table in AvAbundanceTable]
+        return {name: np.stack([result[name] for result in results]) for name in results[0]} if results else {}
+
+    # -------- LOAD CONSTANT INFO FROM CONFIG --------
+    pcTocm = config.pcTocm
+    # -------- LOAD CONSTANT INFO FROM CONFIG --------
+    Av = np.asarray(AvAbundanceTable['Av'], dtype=float)
+    eAbundance = np.asarray(AvAbundanceTable['e-'], dtype=float)
+    layerSums = AvAbundanceTable['layerSums'] if 'layerSums' in AvAbundanceTable else layerColumnSums(Av, eAbundance)
+    RM = np.asarray(RM, dtype=float)
+    BLOSArrays = {}
+
+    # -------- SCALE THE RM AND EXTINCTION DATA --------
+    ScaledRM = RM - np.asarray(fiducialRM, dtype=float)
+    ScaledExtinction = np.asarray(Extinction, dtype=float) - np.asarray(fiducialExtinction, dtype=float)
+    BLOSArrays['Scaled_RM'] = ScaledRM
+    BLOSArrays['Scaled_Extinction'] = ScaledExtinction
+    # -------- SCALE THE RM AND EXTINCTION DATA. --------
+
+    # -------- CALCULATE THE RM ERROR --------
+    if RMErr is not None:
+        RMErr = np.asarray(RMErr, dtype=float)
+        BLOSArrays['TotalRMScaledErrWithStDev'] = RMErr + np.asarray(fiducialRMStd, dtype=float)
+        BLOSArrays['TotalRMScaledErrWithAvgErr'] = RMErr + np.asarray(fiducialRMAvgErr, dtype=float)
+    # -------- CALCULATE THE RM ERROR. --------
+
+    # -------- FIND THE LAYER OF INTEREST AND THE TOTAL ELECTRON COLUMN DENSITY --------
+    eAbundanceMatched, indLayerOfInterest = findLayerOfInterest(Av, eAbundance, ScaledExtinction)
+    BLOSArrays['eAbundance'] = eAbundanceMatched
+    LayerNe = electronColumnDensity(Av, eAbundance, indLayerOfInterest, ScaledExtinction, layerSums)
+    # -------- FIND THE LAYER OF INTEREST AND THE TOTAL ELECTRON COLUMN DENSITY. --------
+
+    # -------- CALCULATE THE MAGNETIC FIELD --------
+    with np.errstate(divide='ignore', invalid='ignore'):
+        BLOSArrays['Raw_Magnetic_FieldMagnetic_Field(uG)'] = RM / (0.812 * LayerNe * pcTocm * 2)
+        BLOSArrays['Magnetic_Field(uG)'] = ScaledRM / (0.812 * LayerNe * pcTocm * 2)
+        if RMErr is not None:
+            BLOSArrays['Reference_BField_RMErr(\u00B1)'] = (RMErr / RM) * BLOSArrays['Magnetic_Field(uG)']
+        for column, boundExtinction in [('BField_of_Min_Extinction', MinExtinction), ('BField_of_Max_Extinction', MaxExtinction)]:
+            if boundExtinction is not None:
+                ScaledBoundExtinction = np.asarray(boundExtinction, dtype=float) - np.asarray(fiducialExtinction, dtype=float)
+                _, indLayerOfInterest_Bound = findLayerOfInterest(Av, eAbundance, ScaledBoundExtinction)
+                LayerNeBound = electronColumnDensity(Av, eAbundance, indLayerOfInterest_Bound, ScaledBoundExtinction, layerSums)
+                BLOSArrays[column] = ScaledRM / (0.812 * LayerNeBound * pcTocm * 2)
+    # -------- CALCULATE THE MAGNETIC FIELD. --------
+
+    # -------- CORRECT NEGATIVE SCALED EXTINCTION VALUES --------
+    isNegative = ScaledExtinction < 0
+    for column in ['Raw_Magnetic_FieldMagnetic_Field(uG)', 'Magnetic_Field(uG)', 'Reference_BField_RMErr(\u00B1)',
+                   'BField_of_Min_Extinction', 'BField_of_Max_Extinction']:
+        if column in BLOSArrays and NegativeExtinctionEntriesChange in ["Zero", "Delete"]:
+            BLOSArrays[column] = np.where(isNegative, 0 if NegativeExtinctionEntriesChange == "Zero" else np.nan,
+                                          BLOSArrays[column])
+    # -------- CORRECT NEGATIVE SCALED EXTINCTION VALUES. --------
+    return BLOSArrays
+
+def _pointBArrays(AvAbundancePaths, RMExtinctionData, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction,
+                  NegativeExtinctionEntriesChange):
+    '''
+    Finds the calculateBArrays columns of a table of points, for one abundance file/table or a list of them.
+    '''
+    loadTable = lambda table: loadAbundanceTable(table) if isinstance(table, str) else table
+    if isinstance(AvAbundancePaths, (list, tuple)):
+        AvAbundanceTables = [loadTable(table) for table in AvAbundancePaths]
+    else:
+        AvAbundanceTables = loadTable(AvAbundancePaths)
+    return calculateBArrays(RMExtinctionData['Rotation_Measure(rad/m2)'].to_numpy(dtype=float),
+                            RMExtinctionData['Extinction_Value'].to_numpy(dtype=float),
+                            fiducialRM, fiducialExtinction, AvAbundanceTables,
+                            RMErr=RMExtinctionData['RM_Err(rad/m2)'].to_numpy(dtype=float),
+                            MinExtinction=RMExtinctionData['Min_Extinction_Value'].to_numpy(dtype=float),
+                            MaxExtinction=RMExtinctionData['Max_Extinction_Value'].to_numpy(dtype=float),
+                            fiducialRMAvgErr=fiducialRMAvgErr, fiducialRMStd=fiducialRMStd,
+                            NegativeExtinctionEntriesChange=NegativeExtinctionEntriesChange)
+
 # -------- FUNCTION DEFINITION --------
-def CalculateB(AvAbundancePath, ExtincRMPoints, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction, NegativeExtinctionEntriesChange = "Delete"):
+def CalculateB(AvAbundancePath, ExtincRMPoints, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction, NegativeExtinctionEntriesChange = "Delete", BLOSArrays=None):
     """
             Takes files containing extinction, rotation measure data, and reference point data for the region of interest
-            and calculates BLOS, returning a PANDAS accordingly.
+            and calculates BLOS, returning a PANDAS accordingly. The calculation itself is done by calculateBArrays.
 
-            :param AvAbundancePath:  Path to extinction data produced by chemical evolution code
+            :param AvAbundancePath:  Path to extinction data produced by chemical evolution code, or the abundance data already loaded by loadAbundanceTable.
             :param ExtincRNPoints: Table (pandas dataframe) of non-reference points.
             :param fiducialRM: Reference RM, representing the galactic RM contribution. On positions have this subtracted from them. Float.
             :param fiducialRMAvgErr: Average Error of the Reference RM. Float.
             :param fiducialRMStd: Standard Deviation of the Reference RM. Float.
             :param fiducialExtinction: Reference extinction of the galactic contribution. On positions have this subtracted from them. Float.
             :param NegativeExtinctionEntriesChange: What to do about negative scaled extinction entries. Default is set to Delete. String.
+            :param BLOSArrays: Optional. The result of calculateBArrays for these points and values, if already found as part of a batch.
             """
 
     # -------- SELECT EXTINCTION RM POINT DATA --------
     RMExtinctionData = ExtincRMPoints.copy().reset_index(drop=True)
     # -------- SELECT EXTINCTION RM POINT DATA --------
 
+    # -------- CALCULATE BLOS --------
+    if BLOSArrays is None:
+        BLOSArrays = _pointBArrays(AvAbundancePath, RMExtinctionData, fiducialRM, fiducialRMAvgErr, fiducialRMStd,
+                                   fiducialExtinction, NegativeExtinctionEntriesChange)
+    # -------- CALCULATE BLOS. --------
+
     # -------- CREATE BLOS TABLE --------
     cols = ['ID#', 'Ra(deg)', 'Dec(deg)', 'RM_Raw_Value', 'RM_Raw_Err', 'Scaled_RM', 'TotalRMScaledErrWithStDev',
             'TotalRMScaledErrWithAvgErr', 'Extinction', 'Scaled_Extinction', 'eAbundance',
@@ -110,76 +233,35 @@ def CalculateB(AvAbundancePath, ExtincRMPoints, fiducialRM, fiducialRMAvgErr, fi
     BLOSData['RM_Raw_Value'] = RMExtinctionData['Rotation_Measure(rad/m2)']
     BLOSData['RM_Raw_Err'] = RMExtinctionData['RM_Err(rad/m2)']
     BLOSData['Extinction'] = RMExtinctionData['Extinction_Value']
+    for column, values in BLOSArrays.items():
+        BLOSData[column] = values
     # -------- ADD TO BLOS TABLE. --------
 
-    # -------- SCALE THE RM AND EXTINCTION DATA --------
-    BLOSData['Scaled_RM'] = RMExtinctionData['Rotation_Measure(rad/m2)'] - fiducialRM
-
-    BLOSData['Scaled_Extinction'] = RMExtinctionData['Extinction_Value'] - fiducialExtinction
-    Scaled_Min_Extinction_Value = RMExtinctionData['Min_Extinction_Value'] - fiducialExtinction
-    Scaled_Max_Extinction_Value = RMExtinctionData['Max_Extinction_Value'] - fiducialExtinction
-    # ---- Enforce the negative extinction criteria.
-
-    # -------- SCALE THE RM AND EXTINCTION DATA. --------
-
-    # -------- CALCULATE THE RM ERROR --------
-    BLOSData['TotalRMScaledErrWithStDev'] = RMExtinctionData['RM_Err(rad/m2)'] + fiducialRMStd
-    BLOSData['TotalRMScaledErrWithAvgErr'] = RMExtinctionData['RM_Err(rad/m2)'] + fiducialRMAvgErr
-    # -------- CALCULATE THE RM ERROR. --------
-
-    # -------- FIND THE LAYER OF INTEREST --------
-
-    # -------- LOAD CONSTANT INFO FROM CONFIG --------
-    conversionFactor = config.VExtinct_2_Hcol  # to convert extinction to H column density
-    pcTocm = config.pcTocm
-    # -------- LOAD CONSTANT INFO FROM CONFIG --------
-
-    # -------- LOAD ABUNDANCE DATA
-    AvAbundanceData = pd.read_csv(AvAbundancePath, delim_whitespace=True, skiprows=1)
-    Av = AvAbundanceData["Av"]
-    eAbundance = AvAbundanceData["e-"]
-    # -------- LOAD ABUNDANCE DATA.
-
-    eAbundanceMatched, indLayerOfInterest = findLayerOfInterest(Av, eAbundance, BLOSData['Scaled_Extinction'])
-    _, indLayerOfInterest_MinExt = findLayerOfInterest(Av, eAbundance, Scaled_Min_Extinction_Value)
-    _, indLayerOfInterest_MaxExt = findLayerOfInterest(Av, eAbundance, Scaled_Max_Extinction_Value)
-
-    BLOSData['eAbundance'] = eAbundanceMatched
-    # -------- FIND THE LAYER OF INTEREST. --------
-
-    # -------- CALCULATE THE TOTAL ELECTRON COLUMN DENSITY --------
-    LayerNe = electronColumnDensity(Av, eAbundance, indLayerOfInterest, BLOSData['Scaled_Extinction'])
-    LayerNeMinExt = electronColumnDensity(Av, eAbundance, indLayerOfInterest_MinExt, Scaled_Min_Extinction_Value)
-    LayerNeMaxExt = electronColumnDensity(Av, eAbundance, indLayerOfInterest_MaxExt, Scaled_Max_Extinction_Value)
-    # -------- CALCULATE THE TOTAL ELECTRON COLUMN DENSITY. -------
-
-    # -------- CALCULATE THE MAGNETIC FIELD --------
-    BLOSData['Raw_Magnetic_FieldMagnetic_Field(uG)'] = BLOSData['RM_Raw_Value'] / (
-            0.812 * np.array(LayerNe) * pcTocm * 2)
-
-    BLOSData['Magnetic_Field(uG)'] = BLOSData['Scaled_RM'] / (
-            0.812 * np.array(LayerNe) * pcTocm * 2)
-
-    BLOSData['Reference_BField_RMErr(\u00B1)'] = (BLOSData['RM_Raw_Err'] / BLOSData['RM_Raw_Value']) \
-                                                 * BLOSData['Magnetic_Field(uG)']
-
-    BLOSData['BField_of_Min_Extinction'] = BLOSData['Scaled_RM'] / (0.812 * np.array(LayerNeMinExt) * pcTocm * 2)
-    BLOSData['BField_of_Max_Extinction'] = BLOSData['Scaled_RM'] / (0.812 * np.array(LayerNeMaxExt) * pcTocm * 2)
-
-    # -------- CALCULATE THE MAGNETIC FIELD. --------
-
-    # -------- CORRECT NEGATIVE SCALED EXTINCTION VALUES. --------
-    if NegativeExtinctionEntriesChange == "Zero":
-        negativeScaledExtinctionIndex = BLOSData[BLOSData['Scaled_Extinction'] < 0].index.tolist()
-        BLOSData.loc[negativeScaledExtinctionIndex, 'Raw_Magnetic_FieldMagnetic_Field(uG)'] = 0
-        BLOSData.loc[negativeScaledExtinctionIndex, 'Magnetic_Field(uG)'] = 0
-        BLOSData.loc[negativeScaledExtinctionIndex, 'Reference_BField_RMErr(\u00B1)'] = 0
-        BLOSData.loc[negativeScaledExtinctionIndex, 'BField_of_Min_Extinction'] = 0
-        BLOSData.loc[negativeScaledExtinctionIndex, 'BField_of_Max_Extinction'] = 0
-
-    elif NegativeExtinctionEntriesChange == "Delete":
+    # -------- DELETE NEGATIVE SCALED EXTINCTION VALUES. --------
+    if NegativeExtinctionEntriesChange == "Delete":
         negativeScaledExtinctionIndex = BLOSData[BLOSData['Scaled_Extinction'] < 0].index.tolist()
         BLOSData.drop(negativeScaledExtinctionIndex, inplace=True)
-    # -------- CORRECT NEGATIVE SCALED EXTINCTION VALUES. --------
+    # -------- DELETE NEGATIVE SCALED EXTINCTION VALUES. --------
 
     return BLOSData
+
+def CalculateBBatch(AvAbundancePaths, ExtincRMPoints, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction, NegativeExtinctionEntriesChange = "Delete"):
+    """
+            Calculates the BLOS of the same points with each of a list of abundance files, as CalculateB does for one.
+            The BLOS for all the files is found in one call of calculateBArrays before the tables are put together.
+
+            :param AvAbundancePaths: List of paths to extinction data produced by chemical evolution code, or of the abundance data already loaded by loadAbundanceTable.
+            :param ExtincRNPoints: Table (pandas dataframe) of non-reference points.
+            :param fiducialRM: Reference RM. Float.
+            :param fiducialRMAvgErr: Average Error of the Reference RM. Float.
+            :param fiducialRMStd: Standard Deviation of the Reference RM. Float.
+            :param fiducialExtinction: Reference extinction. Float.
+            :param NegativeExtinctionEntriesChange: What to do about negative scaled extinction entries. Default is set to Delete. String.
+            :return: A list of BLOS tables, one per abundance file, in the order given.
+            """
+    RMExtinctionData = ExtincRMPoints.copy().reset_index(drop=True)
+    BLOSArrays = _pointBArrays(list(AvAbundancePaths), RMExtinctionData, fiducialRM, fiducialRMAvgErr, fiducialRMStd,
+                               fiducialExtinction, NegativeExtinctionEntriesChange)
+    return [CalculateB(path, RMExtinctionData, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction,
+                       NegativeExtinctionEntriesChange, BLOSArrays={column: values[i] for column, values in BLOSArrays.items()})
+            for i, path in enumerate(AvAbundancePaths)]
@@ -6,14 +6,16 @@ import math
 
 import numpy as np
 from scipy import interpolate as interpolate
+from scipy import ndimage as ndimage
 
 
-def fillMissing(data, fillMode, interpMethod = 'linear'):
+def fillMissing(data, fillMode, interpMethod = 'linear', borderWidth = None):
     '''
     Fill missing data within the provided data array.
     :param data: The 2d numpy data array with missing data values.
     :param fillMode: What the missing data should be filled with. String.
     :param interpMethod: Interpolation method, if interpolation is to be used. Default is linear. String.
+    :param borderWidth: Width of the ring of known pixels used as interpolation input, if interpolation is to be used. See interpMask. Int.
     :return: data - with the fillings.
     '''
     nodata = np.isnan(data)
@@ -25,30 +27,46 @@ def fillMissing(data, fillMode, interpMethod = 'linear'):
     elif fillMode == 'Inf':
         data[nodata] = math.inf
     elif fillMode == 'Interpolate':
-        data = interpMask(data, nodata, interpMethod)
+        data = interpMask(data, nodata, interpMethod, borderWidth = borderWidth)
     else:
         data[nodata] = math.nan
 
     return data
 
 
-def interpMask(data, mask, method='cubic', fill_value=0):
+def interpMask(data, mask, method='cubic', fill_value=0, borderWidth=None):
     '''
     Given some data and a mask on that data, performs interpolation on the points in the data specified by the mask.
     :param data: The data to interpolate on. Numpy array.
     :param mask: A boolean mask on that data that indicates where to interpolate on. Boolean numpy array.
     :param method: The interpolation method. Strong. Ex. 'linear', 'nearest', 'cubic'.
     :param fill_value: Default value to fill values outside the convex hull of the input data.
+    :param borderWidth: Width, in pixels, of the ring of known pixels around each masked region which is used as the
+        interpolation input. Only the pixels bordering a masked region affect the interpolated values inside it, so this
+        keeps the triangulation to the size of the region's perimeter rather than the whole data array. On a regular grid
+        the smaller triangulation can split ties between equally good triangles differently, so interpolated values can
+        differ slightly from those found with every known pixel.
+        None or values less than 1 (the default) use every known pixel. Int.
     :return: returnData: The data with the interpolated data.
     '''
+    if not np.any(mask):
+        return copy.deepcopy(data)
+
     width = data.shape[1]
     height = data.shape[0]
     x, y = np.meshgrid(np.arange(width), np.arange(height))
 
-    goodX = x[~mask]
-    goodY = y[~mask]
+    # ---- Select the known pixels used as input
+    known = ~mask
+    if borderWidth is not None and borderWidth >= 1:
+        # Grow the mask (including diagonals) and only keep the known pixels it reaches.
+        border = ndimage.binary_dilation(mask, structure=np.ones((3, 3), dtype=bool), iterations=int(borderWidth))
+        known = known & border
+
+    goodX = x[known]
+    goodY = y[known]
 
-    knownData = data[~mask]
+    knownData = data[known]
 
     missingX = x[mask]
     missingY = y[mask]
@@ -0,0 +1,317 @@
+'''
+This module contains the persistent, per-cloud store that matched rotation measure data is written to as it is produced.
+
+- Rows are kept as one columnar .npz file per chunk, with a manifest listing the chunks which are complete. A chunk is
+    only listed once its file is fully written, so an interrupted run loses at most the chunk it was working on.
+- Every row belongs to a source, identified by a source key. A later row for the same source replaces the earlier one,
+    so runs only need to add rows for the sources which are new or have changed.
+- A small index holds a few columns of the latest row of every source, and where that row is kept. Runs decide what to
+    match again from the index alone, and read full rows one chunk at a time. When a run finishes, the rows replaced by
+    later ones are removed from their chunks.
+- The store is keyed by a hash of everything other than the catalogue that the matches depend on. A run with a
+    different key starts the store afresh.
+'''
+import os
+import json
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_NAME = 'manifest.json'
+INDEX_NAME = 'index.npz'
+
+# Columns every stored row holds: the source it belongs to, its ID# in the matched table, and whether it was matched.
+SOURCE_KEY = 'Source_Key'
+ID = 'ID#'
+MATCHED = 'Matched'
+# Index columns of where the latest row of a source is kept: its chunk, and its row within the chunk.
+CHUNK = 'Chunk'
+ROW = 'Row'
+
+
+def hashValues(*values):
+    '''
+    Hashes a set of values, such as settings and numpy arrays, into one key.
+    :param values: Strings, numbers, numpy arrays, or lists/tuples of these.
+    :return: A hex digest. String.
+    '''
+    digest = hashlib.sha1()
+    for value in values:
+        if isinstance(value, np.ndarray):
+            digest.update(str((value.shape, value.dtype.str)).encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(repr(value).encode())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+def _writeAtomically(path, write):
+    '''
+    Writes a file through a temporary file, so the file is either fully written or not changed at all.
+    :param path: Path to the file.
+    :param write: A function taking the temporary path and writing the file to it.
+    '''
+    tempPath = path + '.tmp'
+    write(tempPath)
+    os.replace(tempPath, path)
+
+
+def _saveArrays(path, arrays):
+    '''
+    Saves a dictionary of numpy arrays to an .npz file, without np.savez changing the file name.
+    '''
+    with open(path, 'wb') as arraysFile:
+        np.savez(arraysFile, **arrays)
+
+
+class MatchStore:
+    def __init__(self, directory, key, indexColumns=()):
+        '''
+        Opens the chunk store in a directory, keeping its completed chunks only if they were made with the same key.
+        :param directory: The directory of the store. Created if needed.
+        :param key: The key of the current run. See hashValues.
+        :param indexColumns: The columns, other than ID and MATCHED, to keep in the index of every source.
+        '''
+        self.directory = directory
+        self.key = key
+        self.indexColumns = [ID, MATCHED] + [column for column in indexColumns if column not in (ID, MATCHED)]
+        self.chunks = []
+        self.compacting = False
+
+        manifest = self._readManifest()
+        if manifest is not None and manifest.get('key') == key:
+            self.chunks = manifest['chunks']
+            self.compacting = manifest.get('compacting', False)
+        else:
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+            os.makedirs(directory)
+            self._writeManifest()
+
+        # The index of the sources as stored when the store was opened, and the index rows of the chunks added since.
+        self.index = self._loadIndex()
+        self._newIndexRows = []
+
+    def _readManifest(self):
+        path = os.path.join(self.directory, MANIFEST_NAME)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'r') as manifestFile:
+                return json.load(manifestFile)
+        except (OSError, ValueError):
+            return None
+
+    def _writeManifest(self):
+        def write(path):
+            with open(path, 'w') as manifestFile:
+                json.dump({'key': self.key, 'chunks': self.chunks, 'compacting': self.compacting}, manifestFile)
+        _writeAtomically(os.path.join(self.directory, MANIFEST_NAME), write)
+
+    def _chunkPath(self, chunkNumber, kind):
+        return os.path.join(self.directory, '{}_{:06d}.npz'.format(kind, chunkNumber))
+
+    def _emptyIndex(self):
+        return pd.DataFrame(columns=[SOURCE_KEY] + self.indexColumns + [CHUNK, ROW]).set_index(SOURCE_KEY)
+
+    def _chunkIndexRows(self, chunkNumber, columns):
+        '''
+        Makes the index rows of the sources of a chunk.
+        :param chunkNumber: The number of the chunk.
+        :param columns: A dictionary of column name: numpy array of the chunk, holding at least SOURCE_KEY and the index
+            columns.
+        '''
+        numRows = len(columns[SOURCE_KEY])
+        indexRows = pd.DataFrame({column: columns[column] for column in [SOURCE_KEY] + self.indexColumns})
+        indexRows[CHUNK] = np.full(numRows, chunkNumber, dtype=np.int64)
+        indexRows[ROW] = np.arange(numRows, dtype=np.int64)
+        return indexRows
+
+    def _combineIndex(self, index, indexRows):
+        '''
+        Adds index rows to an index, a later row of a source replacing the earlier one.
+        '''
+        if len(indexRows) == 0:
+            return index
+        combined = pd.concat(([index.reset_index()] if len(index) > 0 else []) + indexRows, ignore_index=True)
+        return combined.drop_duplicates(SOURCE_KEY, keep='last').set_index(SOURCE_KEY)
+
+    def _loadIndex(self):
+        '''
+        Loads the saved index, and adds the sources of any chunks stored since it was saved, such as by an interrupted
+        run. The index is rebuilt from every chunk if it was not saved, or if the run saving it was interrupted while it
+        was removing replaced rows.
+        '''
+        index = self._emptyIndex()
+        numIndexed = 0
+        path = os.path.join(self.directory, INDEX_NAME)
+        if os.path.isfile(path) and not self.compacting:
+            try:
+                with np.load(path, allow_pickle=False) as indexFile:
+                    if str(indexFile['key']) == self.key and list(indexFile['columns']) == self.indexColumns:
+                        numIndexed = int(indexFile['numChunks'])
+                        index = pd.DataFrame({column: indexFile['values_' + column]
+                                              for column in [SOURCE_KEY] + self.indexColumns + [CHUNK, ROW]}).set_index(SOURCE_KEY)
+            except (OSError, ValueError, KeyError):
+                index, numIndexed = self._emptyIndex(), 0
+        if numIndexed > self.numCompleted:
+            index, numIndexed = self._emptyIndex(), 0
+        indexRows = []
+        for chunkNumber in range(numIndexed, self.numCompleted):
+            with np.load(self._chunkPath(chunkNumber, 'columns')) as columnsFile:
+                indexRows.append(self._chunkIndexRows(chunkNumber, {column: columnsFile[column]
+                                                                    for column in [SOURCE_KEY] + self.indexColumns}))
+        return self._combineIndex(index, indexRows)
+
+    def _saveIndex(self):
+        index = self.index.reset_index()
+        arrays = {'values_' + column: index[column].to_numpy() for column in index.columns}
+        arrays['values_' + SOURCE_KEY] = arrays['values_' + SOURCE_KEY].astype(str)
+        arrays.update({'key': np.array(self.key), 'columns': np.array(self.indexColumns),
+                       'numChunks': np.array(self.numCompleted)})
+        _writeAtomically(os.path.join(self.directory, INDEX_NAME), lambda path: _saveArrays(path, arrays))
+
+    @property
+    def numCompleted(self):
+        '''
+        The number of chunks which are complete.
+        '''
+        return len(self.chunks)
+
+    def appendChunk(self, columns, changes, info):
+        '''
+        Adds the next chunk to the store.
+        :param columns: A dictionary of column name: numpy array, the rows of the chunk. Must include the SOURCE_KEY
+            column and the index columns.
+        :param changes: A dictionary of name: numpy array of any other data needed to carry on after this chunk.
+        :param info: A dictionary of summary values of the chunk (json serializable).
+        '''
+        chunkNumber = len(self.chunks)
+        # Text columns are stored as fixed width strings, since object arrays cannot be loaded without pickling.
+        columns = {name: values.astype(str) if values.dtype == object else values for name, values in columns.items()}
+        _writeAtomically(self._chunkPath(chunkNumber, 'columns'), lambda path: _saveArrays(path, columns))
+        _writeAtomically(self._chunkPath(chunkNumber, 'changes'), lambda path: _saveArrays(path, changes))
+        self.chunks.append(dict(info, rows=int(len(next(iter(columns.values()))) if columns else 0)))
+        self._writeManifest()
+        self._newIndexRows.append(self._chunkIndexRows(chunkNumber, columns))
+
+    def loadColumns(self, chunkNumber, columns=None):
+        '''
+        :param chunkNumber: The number of a completed chunk.
+        :param columns: Optional. The names of the columns to load. All of them by default.
+        :return: A dictionary of column name: numpy array.
+        '''
+        with np.load(self._chunkPath(chunkNumber, 'columns')) as columnsFile:
+            return {name: columnsFile[name] for name in (columnsFile.files if columns is None else columns)}
+
+    def loadChanges(self, chunkNumber):
+        '''
+        :param chunkNumber: The number of a completed chunk.
+        :return: A dictionary of name: numpy array, as given to appendChunk.
+        '''
+        with np.load(self._chunkPath(chunkNumber, 'changes')) as changesFile:
+            return {name: changesFile[name] for name in changesFile.files}
+
+    def loadRows(self, keys, columns=None):
+        '''
+        Loads the full rows of a set of sources, as they were stored when the store was opened, one chunk at a time.
+        :param keys: The source keys. Every one must be in the index.
+        :param columns: Optional. The names of the columns to load. All of them by default.
+        :return: A pandas DataFrame of the rows, indexed by SOURCE_KEY, in the order of the keys.
+        '''
+        locations = self.index.loc[list(keys), [CHUNK, ROW]]
+        tables = []
+        for chunkNumber, chunkLocations in locations.groupby(CHUNK, sort=True):
+            chunkColumns = self.loadColumns(int(chunkNumber), columns)
+            rows = chunkLocations[ROW].to_numpy(dtype=np.int64)
+            tables.append(pd.DataFrame({name: values[rows] for name, values in chunkColumns.items()},
+                                       index=chunkLocations.index))
+        if len(tables) == 0:
+            return pd.DataFrame(columns=[SOURCE_KEY] + ([] if columns is None else list(columns))).set_index(SOURCE_KEY)
+        rows = pd.concat(tables).reindex(list(keys))
+        return rows.drop(columns=[SOURCE_KEY]) if SOURCE_KEY in rows.columns else rows
+
+    def nextID(self):
+        '''
+        :return: The first ID# which has never been given to a row, as of when the store was opened. Int.
+        '''
+        if len(self.index) == 0:
+            return 0
+        return int(max(np.max(self.index[ID]), -1)) + 1
+
+    def changedIDs(self):
+        '''
+        Compares the sources stored since the store was opened with how they were stored before.
+        :return: A pandas DataFrame of the ID# and the Change ('Added', 'Updated' or 'Removed') of every ID# which
+            changed, sorted by ID#.
+        '''
+        latest = self._combineIndex(self._emptyIndex(), self._newIndexRows)
+        previous = self.index.reindex(latest.index)
+        wasMatched = previous[MATCHED].fillna(False).to_numpy(dtype=bool)
+        isMatched = latest[MATCHED].to_numpy(dtype=bool)
+        changes = [pd.DataFrame({ID: latest[ID].to_numpy()[isMatched & wasMatched], 'Change': 'Updated'}),
+                   pd.DataFrame({ID: latest[ID].to_numpy()[isMatched & ~wasMatched], 'Change': 'Added'}),
+                   pd.DataFrame({ID: previous[ID].to_numpy()[~isMatched & wasMatched], 'Change': 'Removed'})]
+        changes = pd.concat(changes, ignore_index=True)
+        changes[ID] = changes[ID].astype(np.int64)
+        return changes.sort_values(ID, kind='stable').reset_index(drop=True)
+
+    def finish(self):
+        '''
+        Adds the chunks stored since the store was opened to the index, removes the rows they replace from the earlier
+        chunks, and saves the index.
+        '''
+        self.index = self._combineIndex(self.index, self._newIndexRows)
+        self._newIndexRows = []
+
+        # ---- Remove the rows which were replaced by later ones.
+        chunkSizes = self.index.groupby(CHUNK).size()
+        replaced = [chunkNumber for chunkNumber in range(self.numCompleted)
+                    if chunkSizes.get(chunkNumber, 0) < self.chunks[chunkNumber]['rows']]
+        if len(replaced) > 0:
+            # The index is rebuilt from the chunks if a run stops while rows are being removed.
+            self.compacting = True
+            self._writeManifest()
+            rowNumbers = self.index[ROW].to_numpy(dtype=np.int64).copy()
+            for chunkNumber in replaced:
+                inChunk = np.flatnonzero(self.index[CHUNK].to_numpy() == chunkNumber)
+                kept = rowNumbers[inChunk]
+                order = np.argsort(kept, kind='stable')
+                columns = {name: values[kept[order]] for name, values in self.loadColumns(chunkNumber).items()}
+                _writeAtomically(self._chunkPath(chunkNumber, 'columns'), lambda path: _saveArrays(path, columns))
+                rowNumbers[inChunk[order]] = np.arange(len(order))
+                self.chunks[chunkNumber]['rows'] = len(order)
+            self.index[ROW] = rowNumbers
+        # ---- Remove the rows which were replaced by later ones.
+
+        self._saveIndex()
+        self.compacting = False
+        self._writeManifest()
+
+    def writeTable(self, path, columns, sep, addColumns=None, blockSize=100000):
+        '''
+        Writes the latest row of every matched source into one table, numbered by ID#. Call finish first, so the index
+        holds every stored row. The table is written a block of rows at a time, reading each block from its chunks.
+        :param path: Path to the table file.
+        :param columns: The columns of the table, in order.
+        :param sep: The separator of the table.
+        :param addColumns: Optional. A function taking a block of the table and returning a dictionary of column name:
+            values which are added to the end of it.
+        :param blockSize: The most rows written at once. Int.
+        :return: The number of rows written.
+        '''
+        matched = self.index.loc[self.index[MATCHED].astype(bool)].sort_values(ID, kind='stable')
+        numRows = len(matched)
+        for start in range(0, max(numRows, 1), blockSize):
+            blockKeys = matched.index[start:start + blockSize]
+            table = self.loadRows(blockKeys, [ID] + list(columns))
+            table = table.set_index(ID) if len(table) > 0 else pd.DataFrame(columns=columns).rename_axis(ID)
+            table = table[columns]
+            if addColumns is not None:
+                for name, values in addColumns(table).items():
+                    table[name] = values
+            table.to_csv(path, sep=sep, mode='w' if start == 0 else 'a', header=start == 0)
+        return numRows
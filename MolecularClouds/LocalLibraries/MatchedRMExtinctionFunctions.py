@@ -32,6 +32,116 @@ def calcFiducialVals(refData):
     # -------- FIND FIDUCIAL REFERENCE VALUES. --------
     return fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction
 
+def calcPrefixFiducialVals(refData):
+    '''
+    Calculates the reference values of every prefix of the reference points PANDAS table (its first 1, 2, ..., N points)
+    from running sums, as the points are added one by one. Assumes no weighting.
+    :param refData: Table with the Reference Point information, in the order the points are added. PANDAS table.
+    :return: fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction - numpy arrays of the reference values,
+        where element k holds the reference values of the first k+1 points.
+    '''
+    numPoints = np.arange(1, len(refData) + 1)
+    rm = refData['Rotation_Measure(rad/m2)'].to_numpy(dtype=float)
+
+    # -------- FIND FIDUCIAL REFERENCE VALUES --------
+    fiducialRM = np.cumsum(rm) / numPoints
+    fiducialRMAvgErr = np.cumsum(refData['RM_Err(rad/m2)'].to_numpy(dtype=float)) / numPoints
+    fiducialExtinction = np.cumsum(refData['Extinction_Value'].to_numpy(dtype=float)) / numPoints
+    # Standard error of the sampled mean, from sums taken about the first point so that they do not lose precision:
+    shiftedRM = rm - rm[:1]
+    sumShiftedRM = np.cumsum(shiftedRM)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (np.cumsum(shiftedRM ** 2) - sumShiftedRM ** 2 / numPoints) / (numPoints - 1)
+        fiducialRMStd = np.sqrt(np.maximum(variance, 0)) / np.sqrt(numPoints)
+    # -------- FIND FIDUCIAL REFERENCE VALUES. --------
+    return fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction
+
+def calcSetFiducialVals(refData, membership, weights=None):
+    '''
+    Calculates the reference values of many sets of reference points at once, each drawn from the same reference points
+    PANDAS table. The values of each set are those np.average and np.cov give with the same weights, so that equal
+    weights give the values of calcFiducialVals.
+    :param refData: Table with the Reference Point information of all the candidate points. PANDAS table.
+    :param membership: Boolean numpy array (number of sets x number of candidate points); True where a point is in a set.
+    :param weights: Optional. Numpy array of the weight of each point in each set, of the same shape as membership, or
+        of one weight per candidate point. Default is equal weights.
+    :return: fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction - numpy arrays holding the reference values
+        of each set. The standard error is nan for sets of fewer than two points.
+    '''
+    membership = np.atleast_2d(np.asarray(membership, dtype=bool))
+    setWeights = membership * (1.0 if weights is None else np.asarray(weights, dtype=float))
+    numPoints = np.sum(membership, axis=1)
+    rm = refData['Rotation_Measure(rad/m2)'].to_numpy(dtype=float)
+
+    # -------- FIND FIDUCIAL REFERENCE VALUES --------
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sumWeights = np.sum(setWeights, axis=1)
+        fiducialRM = np.sum(setWeights * rm, axis=1) / sumWeights
+        fiducialRMAvgErr = np.sum(setWeights * refData['RM_Err(rad/m2)'].to_numpy(dtype=float), axis=1) / sumWeights
+        fiducialExtinction = np.sum(setWeights * refData['Extinction_Value'].to_numpy(dtype=float), axis=1) / sumWeights
+        # Standard error of the sampled mean, with the weighted variance of np.cov:
+        deviations = np.where(membership, rm[np.newaxis, :] - fiducialRM[:, np.newaxis], 0)
+        variance = np.sum(setWeights * deviations ** 2, axis=1) / (sumWeights - np.sum(setWeights ** 2, axis=1) / sumWeights)
+        fiducialRMStd = np.where(numPoints > 1, np.sqrt(variance) / np.sqrt(numPoints), np.nan)
+    # -------- FIND FIDUCIAL REFERENCE VALUES. --------
+    return fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction
+
+def calcLeaveOneOutFiducialVals(refData, quadrants=None):
+    '''
+    Calculates the reference values of the reference points PANDAS table with each point left out in turn, from sums over
+    the points and over each quadrant, in O(N). The values are those of calcSetFiducialVals for the same sets.
+    :param refData: Table with the Reference Point information. PANDAS table.
+    :param quadrants: Optional. Numpy array of the quadrant of each point, to give each quadrant equal weight as the
+        Quadrant weighting scheme does. Default is equal weights.
+    :return: fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction - numpy arrays, where element i holds the
+        reference values without point i. nan where fewer than two points are left for the standard error, or none
+        for the other values.
+    '''
+    numPoints = len(refData)
+    groups = np.zeros(numPoints, dtype=int) if quadrants is None else np.asarray(quadrants, dtype=int)
+    numGroups = np.max(groups) + 1 if numPoints > 0 else 0
+    rm = refData['Rotation_Measure(rad/m2)'].to_numpy(dtype=float)
+    # Sums are taken about the mean RM so that the weighted variance does not lose precision.
+    shiftedRM = rm - np.mean(rm) if numPoints > 0 else rm
+    columns = [shiftedRM, shiftedRM ** 2, refData['RM_Err(rad/m2)'].to_numpy(dtype=float),
+               refData['Extinction_Value'].to_numpy(dtype=float)]
+
+    # -------- FIND THE SUMS OF EVERY POINT'S GROUP, WITH AND WITHOUT THE POINT --------
+    groupCounts = np.bincount(groups, minlength=numGroups).astype(float)
+    def groupWeight(counts):
+        # The weight of each point in a group of a given number of points.
+        with np.errstate(divide='ignore'):
+            perPoint = 1.0 / counts if quadrants is not None else np.ones_like(counts)
+        return np.where(counts > 0, perPoint, 0.0)
+    fullWeight = groupWeight(groupCounts)
+    leftWeight = groupWeight(groupCounts[groups] - 1)
+
+    totals = [np.sum(fullWeight[groups] * column) for column in columns]
+    sumWeights = np.sum(fullWeight * groupCounts)
+    sumSquaredWeights = np.sum(fullWeight ** 2 * groupCounts)
+    leftTotals = []
+    for column, total in zip(columns, totals):
+        groupSums = np.bincount(groups, weights=column, minlength=numGroups)
+        # The sum over all the points, with the point's group replaced by the group without the point.
+        leftTotals.append(total - fullWeight[groups] * groupSums[groups] + leftWeight * (groupSums[groups] - column))
+    leftCounts = groupCounts[groups] - 1
+    leftSumWeights = sumWeights - fullWeight[groups] * groupCounts[groups] + leftWeight * leftCounts
+    leftSumSquaredWeights = sumSquaredWeights - fullWeight[groups] ** 2 * groupCounts[groups] + leftWeight ** 2 * leftCounts
+    # -------- FIND THE SUMS OF EVERY POINT'S GROUP, WITH AND WITHOUT THE POINT. --------
+
+    # -------- FIND FIDUCIAL REFERENCE VALUES --------
+    with np.errstate(divide='ignore', invalid='ignore'):
+        leftShiftedRM = leftTotals[0] / leftSumWeights
+        fiducialRM = leftShiftedRM + (np.mean(rm) if numPoints > 0 else 0)
+        fiducialRMAvgErr = leftTotals[2] / leftSumWeights
+        fiducialExtinction = leftTotals[3] / leftSumWeights
+        # Standard error of the sampled mean, with the weighted variance of np.cov:
+        weightedSquares = leftTotals[1] - leftShiftedRM ** 2 * leftSumWeights
+        variance = weightedSquares / (leftSumWeights - leftSumSquaredWeights / leftSumWeights)
+        fiducialRMStd = np.where(numPoints - 1 > 1, np.sqrt(np.maximum(variance, 0)) / np.sqrt(numPoints - 1), np.nan)
+    # -------- FIND FIDUCIAL REFERENCE VALUES. --------
+    return fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction
+
 def rmMatchingPts(ExtincRMTable, refRMTable):
     '''
     Given two matched RM extinction tables, returns a new table with the elements the second has in common with the first removed.
@@ -45,8 +155,8 @@ def rmMatchingPts(ExtincRMTable, refRMTable):
 
     # -------- REMOVE REFERENCE POINTS FROM THE MATCHED RM AND EXTINCTION DATA --------
     # The rm points used as reference points should not be used to calculate BLOS
-    ind = refRMTable['ID#']  # Indices of the reference points
-    RMExtinctionData = AllMatchedRMExtinctionData.drop(ind).reset_index(drop=True)
+    isRefPoint = AllMatchedRMExtinctionData['ID#'].isin(refRMTable['ID#'])  # ID#s of the reference points
+    RMExtinctionData = AllMatchedRMExtinctionData.loc[~isRefPoint].reset_index(drop=True)
     return RMExtinctionData
 
 def rmLowExtPts(ExtincRMTable, extRef):
@@ -62,4 +172,28 @@ def rmLowExtPts(ExtincRMTable, extRef):
 
     # -------- REMOVE REFERENCE POINTS FROM THE MATCHED RM AND EXTINCTION DATA --------
     AllMatchedRMExtinctionData = AllMatchedRMExtinctionData.drop(AllMatchedRMExtinctionData[AllMatchedRMExtinctionData['Extinction_Value'] < extRef].index)
-    return AllMatchedRMExtinctionData
\ No newline at end of file
+    return AllMatchedRMExtinctionData
+
+def isOnPoint(ExtincRMTable, refRMTable, extRef):
+    '''
+    Given a RM extinction table, the reference points and an extinction value, finds which points are on points: those
+    which are not reference points and whose extinction is not lower than the specified extinction value.
+    :param ExtincRMTable: The matched RM extinction table.
+    :param refRMTable: The table of the reference points.
+    :param extRef: The lowest extinction of an on point.
+    :return: A boolean numpy array, True for the on points of the first table.
+    '''
+    isRefPoint = ExtincRMTable['ID#'].isin(refRMTable['ID#']).to_numpy()
+    isLowExtinction = (ExtincRMTable['Extinction_Value'] < extRef).to_numpy()
+    return ~isRefPoint & ~isLowExtinction
+
+def getOnPoints(ExtincRMTable, refRMTable, extRef):
+    '''
+    Given a RM extinction table, the reference points and an extinction value, returns a new table of the on points.
+    The same as rmLowExtPts(rmMatchingPts(ExtincRMTable, refRMTable), extRef). See isOnPoint.
+    :param ExtincRMTable: The matched RM extinction table.
+    :param refRMTable: The table of the reference points.
+    :param extRef: The lowest extinction of an on point.
+    :return: RMExtinctionData: A table with the on points of the first table.
+    '''
+    return ExtincRMTable.loc[isOnPoint(ExtincRMTable, refRMTable, extRef)].reset_index(drop=True)
@@ -7,12 +7,20 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import collections
+import heapq
+import warnings
 
-from .CalculateB import CalculateB
 from . import MatchedRMExtinctionFunctions as MREF
+from . import CalculateB as CB
+from . import RefJudgeLib as rjl
+from . import ParallelLib as PL
+from . import TableCacheLib as TCL
 #from statistics import mode #Before Python 3.8, errors when there are multiple modes. This is not behavior we desire.
 from . import config as config
 
+# Changes whenever findTrendData would give different trend data from the same inputs, so cached trend data is not reused.
+TREND_DATA_VERSION = 1
+
 def mode(listInput):
     '''
     Here we create a different way to obtain the mode.
@@ -21,7 +29,74 @@ def mode(listInput):
     '''
     return collections.Counter(listInput).most_common()[0][0]
 
-def stabilityCheckAlg(TrendDataTable):
+def firstNanMax(values, axis=0):
+    '''
+    Finds the maximum as the builtin max does over a sequence of floats: nan if the first value is nan, otherwise the
+    largest of the values which are not nan.
+    :param values: Numpy array.
+    :param axis: The axis to find the maximum along.
+    :return: The maxima. Numpy array, or a float for a 1d array.
+    '''
+    values = np.moveaxis(np.asarray(values, dtype=float), axis, 0)
+    return np.where(np.isnan(values[0]), np.nan, np.fmax.reduce(values, axis=0))
+
+def firstNanMin(values, axis=0):
+    '''
+    Finds the minimum as the builtin min does over a sequence of floats. See firstNanMax.
+    '''
+    values = np.moveaxis(np.asarray(values, dtype=float), axis, 0)
+    return np.where(np.isnan(values[0]), np.nan, np.fmin.reduce(values, axis=0))
+
+def longestRunStarts(absDiffs, thresholds):
+    '''
+    Finds where the longest run of similar adjacent BLOS values starts, for every threshold and every BLOS point.
+    - A pair of adjacent values is part of a run if its difference is within the threshold, and ends the run if it is
+        not. A pair whose difference is nan does neither.
+    - The number of pairs of the run so far is the number of pairs within the threshold since the last pair which was
+        not. The longest run is where this first reaches its maximum, and starts at the first pair of that run.
+    :param absDiffs: The absolute differences of adjacent BLOS values; one row per BLOS point. Numpy array.
+    :param thresholds: The thresholds. Numpy array.
+    :return:
+        hasRun: Whether each BLOS point has a run for each threshold. Numpy array of (thresholds x BLOS points).
+        runStarts: The number of reference points where the longest run starts, where there is a run. Numpy array of
+            (thresholds x BLOS points).
+    '''
+    numPairs = absDiffs.shape[1]
+    isRun = absDiffs[np.newaxis, :, :] <= thresholds[:, np.newaxis, np.newaxis]
+    isBreak = absDiffs[np.newaxis, :, :] > thresholds[:, np.newaxis, np.newaxis]
+
+    # Number of pairs within the threshold so far, and as of the last pair which was not.
+    runPairsSoFar = np.cumsum(isRun, axis=2)
+    runPairsSoFar -= np.maximum.accumulate(np.where(isBreak, runPairsSoFar, 0), axis=2)
+
+    # Where each run starts, as the last pair which started a run.
+    pairNumber = np.arange(numPairs)
+    runStartPairs = np.maximum.accumulate(np.where(isRun & (runPairsSoFar == 1), pairNumber, -1), axis=2)
+
+    longestRunEnd = np.argmax(runPairsSoFar, axis=2)
+    hasRun = np.take_along_axis(runPairsSoFar, longestRunEnd[:, :, np.newaxis], axis=2)[:, :, 0] > 0
+    # The run starting after pair i (counted from 0) starts at i + 1 reference points.
+    runStarts = np.take_along_axis(runStartPairs, longestRunEnd[:, :, np.newaxis], axis=2)[:, :, 0] + 1
+    return hasRun, runStarts
+
+def firstModes(values, hasValue, maxValue):
+    '''
+    Finds the mode of each row of values as mode() does: of the most common values, the one which appears first.
+    :param values: Non-negative integers. Numpy array of (rows x values).
+    :param hasValue: Which of the values are counted. Boolean numpy array, the shape of values.
+    :param maxValue: The largest value. Int.
+    :return: The mode of each row. Numpy array.
+    '''
+    numRows, numValues = values.shape
+    rowNumber, valueNumber = np.nonzero(hasValue)
+    counts = np.zeros((numRows, maxValue + 1), dtype=int)
+    np.add.at(counts, (rowNumber, values[rowNumber, valueNumber]), 1)
+    firstSeen = np.full((numRows, maxValue + 1), numValues)
+    np.minimum.at(firstSeen, (rowNumber, values[rowNumber, valueNumber]), valueNumber)
+    isMostCommon = counts == counts.max(axis=1, keepdims=True)
+    return np.argmin(np.where(isMostCommon, firstSeen, numValues + 1), axis=1)
+
+def stabilityCheckAlg(TrendDataTable, numThresholds=500, maxChunkSize=2**22, numWorkers=1):
     '''
     The following algorithm searches for the number of candidate reference points where the trend of calculated BLOS
      values stabilizes
@@ -33,64 +108,285 @@ def stabilityCheckAlg(TrendDataTable):
     This algorithm is used on every BLOS point that was not used as a reference point.  The optimal number of
     reference points is taken to be the number of reference points where the longest run occurs most often
 
-    We repeat this algorithm over all potential threshold values
+    We repeat this algorithm over all potential threshold values. All the BLOS points are evaluated for many thresholds
+    at once, in chunks of thresholds, which are spread over worker processes for large trend tables.
     :param TrendDataTable: The input dataframe for which this data is analyzed.
+    :param numThresholds: The number of evenly spaced thresholds, from the smallest to the largest difference.
+    :param maxChunkSize: The most (thresholds x BLOS points x pairs) evaluated at once, to bound the memory used.
+    :param numWorkers: The number of worker processes that chunks of thresholds are evaluated on, with the trend data
+        shared between them. The result does not depend on it. 0 uses one per available core.
     :return: Optimal_NumRefPoints: The minimal number of reference points needed before the longest stable run.
     '''
-    UpperLimit = max([max(abs(np.diff(list(TrendDataTable.loc[number])))) for number in TrendDataTable.index])
-    LowerLimit = min([min(abs(np.diff(list(TrendDataTable.loc[number])))) for number in TrendDataTable.index])
-    numThresholds = 500 #TODO: potentially make this a parameter in the config file in case we want to change it.
+    absDiffs = np.abs(np.diff(TrendDataTable.to_numpy(dtype=float), axis=1))
+    if absDiffs.shape[0] == 0 or absDiffs.shape[1] == 0:
+        raise ValueError("The stability trend needs at least one BLOS point and two numbers of reference points.")
+    UpperLimit = firstNanMax(firstNanMax(absDiffs, axis=1))
+    LowerLimit = firstNanMin(firstNanMin(absDiffs, axis=1))
     thresholds = np.linspace(LowerLimit, UpperLimit, numThresholds)
 
-    Optimal_NumRefPoints = []
+    # Chunks of thresholds are bounded in size, and shared between the worker processes when there is more than one.
+    thresholdsPerChunk = max(maxChunkSize // absDiffs.size, 1)
+    if thresholdsPerChunk < numThresholds:
+        thresholdsPerChunk = max(min(thresholdsPerChunk, -(-numThresholds // PL.getWorkerCount(numWorkers))), 1)
+    chunks = PL.splitIntoChunks(numThresholds, thresholdsPerChunk)
+    chunkResults = PL.mapWithSharedArrays(optimalNumRefPointsOfChunk, chunks,
+                                          {'absDiffs': absDiffs, 'thresholds': thresholds}, numWorkers)
 
-    for threshold in thresholds:
-
-        LongestRun_NumRefPoints = []
-        LongestRun_Length = []
-
-        # For every point within the region of interest that was not used as a reference point:
-        for index in range(len(TrendDataTable)):
-            y = list(TrendDataTable.loc[index])  # List of BLOS values for the given point
-            x = list(np.arange(1, len(y) + 1))  # List of number of reference points
-
-            # -------- STABILITY TREND ALGORITHM --------
-            run_length = 1  # To keep track of how many similar values we get in a row
-            on_a_run = 0  # To indicate if we are on a run (1) or not (0)
-            run_started = []  # To keep track of the number of reference points where the run started
-            run = []  # To keep track of the total length of each run
-
-            # For each pair of adjacent BLOS values:
-            for i in range(1, len(y)):
-                # Find the absolute difference in adjacent BLOS values
-                diff = abs(y[i] - y[i - 1])
-
-                if diff <= threshold:
-                    # If the difference is below the threshold, then we have started, or are in, a "run" of similar
-                    # values
-                    run_length += 1
-                    if on_a_run == 0:
-                        # We have started a new run
-                        on_a_run = 1
-                        run_started.append(x[i - 1])
-
-                if diff > threshold or i == len(y) - 1:
-                    # If the difference was not below the threshold, or, if it is the end of the list of BLOS values
-                    if on_a_run == 1:
-                        # then if we were on a run, it ends
-                        run.append(run_length)
-                        on_a_run = 0
-                        run_length = 1
-            # -------- STABILITY TREND ALGORITHM --------
-
-            if len(run) > 0:
-                # We want to find the number of reference points where the longest run occurred
-                ind_longestRun = np.where(np.array(run) == max(run))[0][0]
-                LongestRun_NumRefPoints.append(run_started[ind_longestRun])
-                LongestRun_Length.append(max(run))
-        Optimal_NumRefPoints.append(mode(LongestRun_NumRefPoints))
+    Optimal_NumRefPoints = []
+    for chunkResult in chunkResults:
+        Optimal_NumRefPoints += list(chunkResult)
     return Optimal_NumRefPoints
 
+def optimalNumRefPointsOfChunk(arrays, chunk):
+    '''
+    Runs the stability trend algorithm of stabilityCheckAlg for a chunk of its thresholds.
+    :param arrays: A dictionary holding the absolute differences of adjacent BLOS values ('absDiffs') and all the
+        thresholds ('thresholds'). Numpy arrays.
+    :param chunk: The (start, stop) indexes of the thresholds of the chunk.
+    :return: The optimal number of reference points for each threshold of the chunk. Numpy array.
+    '''
+    absDiffs = arrays['absDiffs']
+    hasRun, runStarts = longestRunStarts(absDiffs, arrays['thresholds'][chunk[0]:chunk[1]])
+    if not np.all(np.any(hasRun, axis=1)):
+        raise ValueError("There is a threshold for which none of the BLOS values have a stable run.")
+    return firstModes(runStarts, hasRun, absDiffs.shape[1])
+
+def stabilityCheckExact(TrendDataTable):
+    '''
+    The stability trend algorithm of stabilityCheckAlg, evaluated for every threshold rather than a sample of them.
+        - Runs only change where the threshold reaches one of the differences of adjacent BLOS values, so the result
+        is the same for every threshold from one distinct difference up to the next.
+        - The thresholds are swept upwards through the sorted differences. As each pair of adjacent values joins a run,
+        the runs on either side of it are merged, and the longest run of its BLOS point and the count of longest run
+        starts are updated.
+    :param TrendDataTable: The input dataframe for which this data is analyzed.
+    :return: A PANDAS table with one row per distinct optimal number of reference points, in the order they first occur
+        as the threshold increases, with the lowest threshold giving each and the total width of the threshold intervals
+        giving each. The intervals run from the smallest to the largest difference.
+    '''
+    absDiffs = np.abs(np.diff(TrendDataTable.to_numpy(dtype=float), axis=1))
+    numPoints, numPairs = absDiffs.shape
+
+    # ---- Runs: adjacent pairs which are not breaks, kept by their first and last pair. Pairs whose difference is nan
+    # never break a run, but do not add to it either.
+    inRun = np.isnan(absDiffs).tolist()
+    runEnd = [{} for _ in range(numPoints)]
+    runStart = [{} for _ in range(numPoints)]
+    runPairs = [{} for _ in range(numPoints)]
+    runFirstPair = [{} for _ in range(numPoints)]
+    for index in range(numPoints):
+        pair = 0
+        while pair < numPairs:
+            if inRun[index][pair]:
+                end = pair
+                while end + 1 < numPairs and inRun[index][end + 1]:
+                    end += 1
+                runEnd[index][pair], runStart[index][end] = end, pair
+                runPairs[index][pair], runFirstPair[index][pair] = 0, -1
+                pair = end
+            pair += 1
+
+    # ---- The longest run of each BLOS point, and how often each number of reference points starts one.
+    longestPairs = [0] * numPoints
+    longestFirstPair = [-1] * numPoints
+    startCounts = np.zeros(numPairs + 1, dtype=int)
+    firstPointOfStart = np.full(numPairs + 1, numPoints)
+    pointsOfStart = [[] for _ in range(numPairs + 1)]
+
+    def moveStart(index, oldStart, newStart):
+        if oldStart > 0:
+            startCounts[oldStart] -= 1
+            heap = pointsOfStart[oldStart]
+            while heap and longestFirstPair[heap[0]] + 1 != oldStart:
+                heapq.heappop(heap)
+            firstPointOfStart[oldStart] = heap[0] if heap else numPoints
+        startCounts[newStart] += 1
+        heapq.heappush(pointsOfStart[newStart], index)
+        firstPointOfStart[newStart] = min(firstPointOfStart[newStart], index)
+
+    # ---- Sweep the thresholds upwards through the distinct differences.
+    flatDiffs = absDiffs.ravel()
+    order = np.flatnonzero(~np.isnan(flatDiffs))
+    order = order[np.argsort(flatDiffs[order], kind='stable')]
+    sortedDiffs = flatDiffs[order]
+    distinctDiffs, groupStarts = np.unique(sortedDiffs, return_index=True)
+    groupEnds = np.append(groupStarts[1:], len(order))
+
+    outcomes = {}
+    for groupNumber, threshold in enumerate(distinctDiffs):
+        for flat in order[groupStarts[groupNumber]:groupEnds[groupNumber]]:
+            index, pair = divmod(int(flat), numPairs)
+            # Merge the pair with the runs on either side of it.
+            start, end, pairs, firstPair = pair, pair, 1, pair
+            if pair > 0 and inRun[index][pair - 1]:
+                start = runStart[index].pop(pair - 1)
+                pairs += runPairs[index][start]
+                firstPair = runFirstPair[index][start] if runFirstPair[index][start] >= 0 else pair
+            if pair + 1 < numPairs and inRun[index][pair + 1]:
+                end = runEnd[index].pop(pair + 1)
+                pairs += runPairs[index].pop(pair + 1)
+                runFirstPair[index].pop(pair + 1)
+            inRun[index][pair] = True
+            runEnd[index][start], runStart[index][end] = end, start
+            runPairs[index][start], runFirstPair[index][start] = pairs, firstPair
+
+            # The first of the longest runs is kept. The run starting after pair i starts at i + 1 reference points.
+            if pairs > longestPairs[index] or (pairs == longestPairs[index] and firstPair < longestFirstPair[index]):
+                oldStart = longestFirstPair[index] + 1
+                longestPairs[index], longestFirstPair[index] = pairs, firstPair
+                if firstPair + 1 != oldStart:
+                    moveStart(index, oldStart, firstPair + 1)
+
+        # The mode, as mode() finds it: of the most common starts, the one of the first BLOS point.
+        optimal = int(np.argmax(startCounts * (numPoints + 1) - firstPointOfStart))
+        width = distinctDiffs[groupNumber + 1] - threshold if groupNumber + 1 < len(distinctDiffs) else 0.0
+        if optimal not in outcomes:
+            outcomes[optimal] = [optimal, threshold, 0.0]
+        outcomes[optimal][2] += width
+
+    return pd.DataFrame(list(outcomes.values()), columns=['Optimal Number of Reference Points', 'Lowest Threshold',
+                                                          'Threshold Interval Width'])
+
+def widestOutcome(StabilityOutcomes):
+    '''
+    Finds the optimal number of reference points given by the widest range of thresholds.
+    :param StabilityOutcomes: The results of stabilityCheckExact, or some of its rows.
+    :return: The optimal number of reference points. Of equally wide results, the one given by the lowest threshold.
+    '''
+    StabilityOutcomes = StabilityOutcomes.sort_values('Lowest Threshold', kind='stable')
+    widest = StabilityOutcomes['Threshold Interval Width'].to_numpy().argmax()
+    return StabilityOutcomes['Optimal Number of Reference Points'].iloc[widest]
+
+def subsetStandardErrors(count, shiftedSum, shiftedSquares):
+    '''
+    Finds the standard error of the mean RM of sets of points from their sums, as calcFiducialVals does.
+    :param count: Numpy array of the number of points of each set.
+    :param shiftedSum: Numpy array of the sum of the shifted RM of each set.
+    :param shiftedSquares: Numpy array of the sum of the squared shifted RM of each set.
+    :return: Numpy array of the standard error of each set; inf for sets of fewer than two points.
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = np.maximum(shiftedSquares - shiftedSum ** 2 / count, 0) / (count - 1)
+        return np.where(count > 1, np.sqrt(variance / count), np.inf)
+
+def searchRefSubset(potentialRefPoints, minRefPoints, maxRefPoints, minPointsPerQuadrant=0, maxMoves=1000):
+    '''
+    Searches for the set of reference points with the smallest standard error of the reference RM, rather than taking
+    the first points in order of extinction.
+    - Without the quadrant minimum, the best set of any size is a run of consecutive points in order of RM. The runs of
+        every allowed size are checked from running sums, and the best one which meets the quadrant minimum is the start.
+        If none does, points are added one at a time, first to the quadrants short of points, then while a point lowers
+        the standard error.
+    - The set is then improved by adding, removing or swapping one point at a time, taking the move which lowers the
+        standard error the most, until none does.
+    The sums over the set are updated with each move, so every step checks all the candidates (or all the pairs of a
+    chosen and a candidate point) at once, without recalculating the statistics of any set.
+    :param potentialRefPoints: The candidate reference points, with their quadrant. PANDAS table.
+    :param minRefPoints: The minimum number of reference points. Int.
+    :param maxRefPoints: The maximum number of reference points, unless more are needed to meet minPointsPerQuadrant. Int.
+    :param minPointsPerQuadrant: The minimum number of points of each quadrant, or all the points of a quadrant with
+        fewer. Int.
+    :param maxMoves: The most moves made to improve the set. Int.
+    :return: The indexes of the chosen reference points, in order of extinction. List.
+    '''
+    numPoints = len(potentialRefPoints)
+    if numPoints == 0:
+        return []
+    rm = potentialRefPoints['Rotation_Measure(rad/m2)'].to_numpy(dtype=float)
+    quadrants = potentialRefPoints['Quadrant'].to_numpy(dtype=int)
+    # Sums are taken about the median RM so that the variance does not lose precision.
+    shiftedRM = rm - np.median(rm)
+    shiftedSquares = shiftedRM ** 2
+    quadrantMinimum = np.minimum(np.bincount(quadrants, minlength=5), minPointsPerQuadrant)
+    quadrantMinimum[0] = 0
+    minRefPoints = min(max(minRefPoints, 1), numPoints)
+    maxRefPoints = min(max(maxRefPoints, minRefPoints), numPoints)
+
+    # -------- START FROM THE BEST RUN OF POINTS IN ORDER OF RM --------
+    order = np.argsort(rm, kind='stable')
+    runSums = np.concatenate(([0.0], np.cumsum(shiftedRM[order])))
+    runSquares = np.concatenate(([0.0], np.cumsum(shiftedSquares[order])))
+    runQuadrantCounts = np.concatenate((np.zeros((1, 5), dtype=int),
+                                        np.cumsum(quadrants[order][:, np.newaxis] == np.arange(5), axis=0)))
+    bestError, bestRun = np.inf, None
+    for runLength in range(minRefPoints, maxRefPoints + 1):
+        starts = np.arange(numPoints - runLength + 1)
+        errors = subsetStandardErrors(runLength, runSums[starts + runLength] - runSums[starts],
+                                      runSquares[starts + runLength] - runSquares[starts])
+        meetsQuadrants = np.all(runQuadrantCounts[starts + runLength] - runQuadrantCounts[starts] >= quadrantMinimum, axis=1)
+        errors = np.where(meetsQuadrants, errors, np.inf)
+        best = int(np.argmin(errors))
+        if errors[best] < bestError or bestRun is None and meetsQuadrants[best]:
+            bestError, bestRun = errors[best], (best, best + runLength)
+
+    chosen = np.zeros(numPoints, dtype=bool)
+    if bestRun is not None:
+        chosen[order[bestRun[0]:bestRun[1]]] = True
+    else:
+        # No run meets the quadrant minimum; add points one at a time instead, which may take more than the maximum.
+        quadrantNeeds = quadrantMinimum.copy()
+        while True:
+            count = np.sum(chosen)
+            needsPoints = np.any(quadrantNeeds > 0)
+            if not needsPoints and count >= minRefPoints:
+                break
+            allowed = ~chosen & (quadrantNeeds[quadrants] > 0 if needsPoints else True)
+            if not np.any(allowed):
+                break
+            if count == 0:
+                # With a single point there is no standard error yet; start from the point nearest the median RM.
+                errors = np.abs(shiftedRM)
+            else:
+                errors = subsetStandardErrors(count + 1, np.sum(shiftedRM[chosen]) + shiftedRM,
+                                              np.sum(shiftedSquares[chosen]) + shiftedSquares)
+            best = int(np.argmin(np.where(allowed, errors, np.inf)))
+            chosen[best] = True
+            quadrantNeeds[quadrants[best]] -= 1
+    # -------- START FROM THE BEST RUN OF POINTS IN ORDER OF RM. --------
+
+    # -------- IMPROVE THE SET ONE POINT AT A TIME --------
+    count = int(np.sum(chosen))
+    setSum, setSquares = np.sum(shiftedRM[chosen]), np.sum(shiftedSquares[chosen])
+    maxRefPoints = max(maxRefPoints, count)
+    for _ in range(maxMoves):
+        inSet, outSet = np.flatnonzero(chosen), np.flatnonzero(~chosen)
+        currentError = subsetStandardErrors(count, setSum, setSquares)
+        # A point may only leave a quadrant with more than its minimum, unless the point replacing it is in the same quadrant.
+        canLeave = np.bincount(quadrants[inSet], minlength=5)[quadrants[inSet]] > quadrantMinimum[quadrants[inSet]]
+
+        moves = []
+        if count < maxRefPoints and len(outSet) > 0:
+            addErrors = subsetStandardErrors(count + 1, setSum + shiftedRM[outSet], setSquares + shiftedSquares[outSet])
+            best = int(np.argmin(addErrors))
+            moves.append((addErrors[best], [], [outSet[best]]))
+        if count > minRefPoints and np.any(canLeave):
+            removeErrors = np.where(canLeave, subsetStandardErrors(count - 1, setSum - shiftedRM[inSet],
+                                                                   setSquares - shiftedSquares[inSet]), np.inf)
+            best = int(np.argmin(removeErrors))
+            moves.append((removeErrors[best], [inSet[best]], []))
+        if len(outSet) > 0:
+            swapErrors = subsetStandardErrors(count, setSum - shiftedRM[inSet][:, np.newaxis] + shiftedRM[outSet],
+                                              setSquares - shiftedSquares[inSet][:, np.newaxis] + shiftedSquares[outSet])
+            isValid = canLeave[:, np.newaxis] | (quadrants[inSet][:, np.newaxis] == quadrants[outSet])
+            swapErrors = np.where(isValid, swapErrors, np.inf)
+            best = np.unravel_index(np.argmin(swapErrors), swapErrors.shape)
+            moves.append((swapErrors[best], [inSet[best[0]]], [outSet[best[1]]]))
+        if len(moves) == 0:
+            break
+
+        moveError, leaving, joining = min(moves, key=lambda move: move[0])
+        # Moves must lower the standard error by more than roundoff, so that the search cannot cycle.
+        if not moveError < currentError * (1 - 1e-12):
+            break
+        chosen[leaving], chosen[joining] = False, True
+        count += len(joining) - len(leaving)
+        setSum += np.sum(shiftedRM[joining]) - np.sum(shiftedRM[leaving])
+        setSquares += np.sum(shiftedSquares[joining]) - np.sum(shiftedSquares[leaving])
+    # -------- IMPROVE THE SET ONE POINT AT A TIME. --------
+
+    chosenPoints = potentialRefPoints[chosen]
+    return list(chosenPoints.sort_values('Extinction_Value', kind='stable').index)
+
 def plotStabilityTrend(TrendDataTable):
     '''
     Generates the stability trend graph for the given reference dataset.
@@ -119,47 +415,157 @@ def plotStabilityTrend(TrendDataTable):
     # plt.legend(loc='center right', bbox_to_anchor=(1.1, 0.5), ncol=2, framealpha=1, title='Identification Number')
     # -------- CREATE A FIGURE. --------
 
-def findTrendData(potentialRefPoints, ExtincRMTable, regionOfInterest):
+def scaledBLOS(RM, Extinction, fiducialRM, fiducialExtinction, AvAbundanceData, NegativeExtinctionEntriesChange="Delete"):
+    '''
+    Finds the BLOS of many points for many sets of reference values at once, as CalculateB does for one set.
+    :param RM: Numpy array of the rotation measure of each point.
+    :param Extinction: Numpy array of the extinction of each point.
+    :param fiducialRM: Numpy array of the reference RM of each set of reference values.
+    :param fiducialExtinction: Numpy array of the reference extinction of each set of reference values.
+    :param AvAbundanceData: The extinction and abundance data produced by chemical evolution code. PANDAS table, or a
+        table from CalculateB.loadAbundanceTable.
+    :param NegativeExtinctionEntriesChange: What to do about negative scaled extinction entries; Zero sets their BLOS to
+        0 and Delete sets it to nan. Default is set to Delete. String.
+    :return: BLOS - Numpy array (number of sets of reference values x number of points).
+        scaledExtinction - Numpy array of the same shape, of the scaled extinction of each point.
+    '''
+    # The rows of these arrays represent the sets of reference values and the columns represent the individual points.
+    BLOSArrays = CB.calculateBArrays(np.asarray(RM, dtype=float)[np.newaxis, :], np.asarray(Extinction, dtype=float)[np.newaxis, :],
+                                     np.asarray(fiducialRM, dtype=float)[:, np.newaxis],
+                                     np.asarray(fiducialExtinction, dtype=float)[:, np.newaxis], AvAbundanceData,
+                                     NegativeExtinctionEntriesChange=NegativeExtinctionEntriesChange)
+    return BLOSArrays['Magnetic_Field(uG)'], BLOSArrays['Scaled_Extinction']
+
+def evaluateRefSets(refData, membership, onPoints, AvAbundanceTable, weights=None):
+    '''
+    Evaluates many sets of reference points at once: the reference values of each set, and the BLOS of every on point
+    found with them.
+    :param refData: Table with the Reference Point information of all the candidate points. PANDAS table.
+    :param membership: Boolean numpy array (number of sets x number of candidate points); True where a point is in a set.
+    :param onPoints: The points to find the BLOS of. PANDAS table.
+    :param AvAbundanceTable: The abundance data of the region, from CalculateB.loadAbundanceTable.
+    :param weights: Optional. The weight of each point in each set. See MREF.calcSetFiducialVals.
+    :return: referenceData - A PANDAS table with the reference values of each set, one row per set, in the columns of
+        ChosenRefDataFile.
+        BLOS - Numpy array (number of sets x number of on points) of the BLOS of the on points. Negative scaled extinction
+        entries are treated as set in the configuration, with deleted entries set to nan.
+    '''
+    membership = np.atleast_2d(np.asarray(membership, dtype=bool))
+    fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction = MREF.calcSetFiducialVals(refData, membership, weights)
+    referenceData = pd.DataFrame({'Number of Reference Points': np.sum(membership, axis=1),
+                                  'Reference Extinction': fiducialExtinction,
+                                  'Reference RM': fiducialRM,
+                                  'Reference RM AvgErr': fiducialRMAvgErr,
+                                  'Reference RM Std': fiducialRMStd})
+
+    BLOS, _ = scaledBLOS(onPoints['Rotation_Measure(rad/m2)'], onPoints['Extinction_Value'], fiducialRM, fiducialExtinction,
+                         AvAbundanceTable, config.negScaledExtOption)
+    return referenceData, BLOS
+
+def leaveOneOutInfluence(refData, onPoints, AvAbundanceTable, weightingScheme='None'):
+    '''
+    Finds how much each reference point drives the result: the change in the reference values, and in the BLOS of every
+    on point, when the point is left out of the reference points.
+    :param refData: Table with the Reference Point information of the chosen reference points. PANDAS table.
+    :param onPoints: The points to find the BLOS of. PANDAS table.
+    :param AvAbundanceTable: The abundance data of the region, from CalculateB.loadAbundanceTable.
+    :param weightingScheme: 'Quadrant' to give each quadrant equal weight, otherwise every point has equal weight.
+    :return: A PANDAS table with one row per reference point, ranked from the most to the least influential by the median
+        change in the BLOS of the on points.
+    '''
+    quadrants = refData['Quadrant'].to_numpy() if weightingScheme == 'Quadrant' else None
+    membership = np.ones((1, len(refData)), dtype=bool)
+    weights = None if quadrants is None else rjl.getQuadrantWeights(membership, quadrants)
+    fiducialRM, _, _, fiducialExtinction = MREF.calcSetFiducialVals(refData, membership, weights)
+    leftRM, _, leftRMStd, leftExtinction = MREF.calcLeaveOneOutFiducialVals(refData, quadrants)
+
+    # The rows of these arrays represent the reference point left out, and the columns represent the on points.
+    RM = onPoints['Rotation_Measure(rad/m2)'].to_numpy(dtype=float)
+    Extinction = onPoints['Extinction_Value'].to_numpy(dtype=float)
+    BLOS, _ = scaledBLOS(RM, Extinction, fiducialRM, fiducialExtinction, AvAbundanceTable, config.negScaledExtOption)
+    leftBLOS, _ = scaledBLOS(RM, Extinction, leftRM, leftExtinction, AvAbundanceTable, config.negScaledExtOption)
+    BLOSChange = np.abs(leftBLOS - BLOS)
+
+    with warnings.catch_warnings():
+        # Points left out of every calculation have nan changes.
+        warnings.simplefilter('ignore', RuntimeWarning)
+        InfluenceData = pd.DataFrame({'ID#': refData['ID#'].to_numpy(),
+                                      'Rotation_Measure(rad/m2)': refData['Rotation_Measure(rad/m2)'].to_numpy(),
+                                      'Extinction_Value': refData['Extinction_Value'].to_numpy(),
+                                      'Reference RM Shift': leftRM - fiducialRM[0],
+                                      'Reference Extinction Shift': leftExtinction - fiducialExtinction[0],
+                                      'Reference RM Std Without Point': leftRMStd,
+                                      'Median BLOS Change(uG)': np.nanmedian(BLOSChange, axis=1) if BLOSChange.shape[1] > 0 else np.nan,
+                                      'Max BLOS Change(uG)': np.nanmax(BLOSChange, axis=1) if BLOSChange.shape[1] > 0 else np.nan})
+    InfluenceData = InfluenceData.sort_values('Median BLOS Change(uG)', ascending=False, kind='stable').reset_index(drop=True)
+    InfluenceData.insert(0, 'Influence Rank', np.arange(1, len(InfluenceData) + 1))
+    return InfluenceData
+
+def trendDataKey(potentialRefPoints, ExtincRMTable, AvAbundanceTable):
+    '''
+    Finds the key of the stability trend data in a TableCache, from everything the trend data depends on.
+    :param potentialRefPoints: The potential reference points. PANDAS table.
+    :param ExtincRMTable: All matched RM-Extinction points. PANDAS table.
+    :param AvAbundanceTable: The abundance data of the region, from CalculateB.loadAbundanceTable.
+    :return: The key. String.
+    '''
+    return TCL.hashValues(TREND_DATA_VERSION, TCL.hashTable(potentialRefPoints), TCL.hashTable(ExtincRMTable),
+                          np.asarray(AvAbundanceTable['Av'], dtype=float), np.asarray(AvAbundanceTable['e-'], dtype=float),
+                          config.negScaledExtOption,
+                          config.pcTocm, config.VExtinct_2_Hcol)
+
+def findTrendData(potentialRefPoints, ExtincRMTable, AvAbundanceTable, cache=None):
     '''
     Finds the stability trend data; the calculated BLOS values as a function of the number of reference points (added one by one).
+    - The reference values of every number of candidate reference points are found from running sums.
+    - Only the reference values change as candidates are added, so the BLOS of every remaining point for every number of
+        candidates is found at once, as one (number of candidates x number of points) array.
     :param potentialRefPoints: The potential reference points. PANDAS table.
     :param ExtincRMTable: All matched RM-Extinction points. PANDAS table.
-    :param regionOfInterest: A RegionOfInterest object that contains all the data for the region of analysis.
+    :param AvAbundanceTable: The abundance data of the region, from CalculateB.loadAbundanceTable.
+    :param cache: Optional. A TableCache the trend data is loaded from if it has been found before, and stored in if not.
     :return: TrendDataTable - The stability trend data, in PANDAS table format.
     '''
-    # -------- CREATE A TABLE FOR ALL BLOS DATA --------
-    # The rows of this table will represent the number of reference points and the columns of this table will
-    # represent the individual BLOS points.  Each entry in the table is a calculated BLOS value.
-    AllData = pd.DataFrame()
-    # -------- CREATE A TABLE FOR ALL BLOS DATA. --------
+    if cache is not None and cache.enabled:
+        key = trendDataKey(potentialRefPoints, ExtincRMTable, AvAbundanceTable)
+        TrendDataTable = cache.get(key)
+        if TrendDataTable is None:
+            TrendDataTable = findTrendData(potentialRefPoints, ExtincRMTable, AvAbundanceTable)
+            cache.put(key, TrendDataTable)
+        return TrendDataTable
 
-    # -------- CALCULATE BLOS AS A FUNCTION OF # REF POINTS --------
-    for num in range(len(potentialRefPoints)):
-        # -------- Extract {num} points from the table of potential reference points
-        # The extracted potential reference points will be referred to as "candidates"
-        candidateRefPoints = potentialRefPoints.loc[:num]
-        # -------- Extract {num} points from the table of potential reference points.
-
-        #Note: This assumes no weighting scheme.
-        fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction = MREF.calcFiducialVals(candidateRefPoints)
-        remainderTable = MREF.rmMatchingPts(ExtincRMTable, candidateRefPoints)
-
-        # -------- Use the candidate reference points to calculate BLOS
-        BLOSData = CalculateB(regionOfInterest.AvFilePath, remainderTable, fiducialRM, fiducialRMAvgErr, fiducialRMStd, fiducialExtinction, NegativeExtinctionEntriesChange = config.negScaledExtOption)
-        BLOSData = BLOSData.set_index('ID#', drop=True)
-        # -------- Use the candidate reference points to calculate BLOS
-
-        # -------- Add calculated BLOS to the table of BLOS vs number of reference points
-        AllData[str(num + 1)] = BLOSData['Magnetic_Field(uG)']
-        # -------- Add calculated BLOS to the table of BLOS vs number of reference points
-    # -------- CALCULATE BLOS AS A FUNCTION OF # REF POINTS. --------
+    # -------- FIND THE REFERENCE VALUES AS A FUNCTION OF # REF POINTS --------
+    # The candidate reference points are the first {num} potential reference points.
+    #Note: This assumes no weighting scheme.
+    numCandidates = len(potentialRefPoints)
+    if numCandidates == 0:
+        return pd.DataFrame()
+    fiducialRM, _, _, fiducialExtinction = MREF.calcPrefixFiducialVals(potentialRefPoints)
+    # -------- FIND THE REFERENCE VALUES AS A FUNCTION OF # REF POINTS. --------
 
-    # -------- FIND OPTIMAL NUM REF POINTS --------
+    # -------- LOAD THE POINTS ONCE --------
     # If a point has been used as a candidate reference point at any time it will not be used to determine the
     # optimal number of reference points
-    TrendDataTable = AllData.copy().drop(list(potentialRefPoints['ID#']), errors='ignore')
-    TrendDataTable = TrendDataTable.reset_index(drop=True)
+    remainderTable = MREF.rmMatchingPts(ExtincRMTable, potentialRefPoints)
+    RM = remainderTable['Rotation_Measure(rad/m2)'].to_numpy(dtype=float)
+    Extinction = remainderTable['Extinction_Value'].to_numpy(dtype=float)
+    # -------- LOAD THE POINTS ONCE. --------
+
+    # -------- CALCULATE BLOS AS A FUNCTION OF # REF POINTS --------
+    # The rows of this array represent the number of reference points and the columns represent the individual
+    # BLOS points.
+    BLOS, ScaledExtinction = scaledBLOS(RM, Extinction, fiducialRM, fiducialExtinction, AvAbundanceTable, config.negScaledExtOption)
+    if config.negScaledExtOption == "Delete":
+        # The points are those for which BLOS was calculated with the first candidate.
+        BLOS = BLOS[:, ~(ScaledExtinction[0] < 0)]
+    # -------- CALCULATE BLOS AS A FUNCTION OF # REF POINTS. --------
+
+    # -------- CREATE A TABLE FOR ALL BLOS DATA --------
+    # The rows of this table represent the individual BLOS points and the columns of this table represent the number
+    # of reference points.  Each entry in the table is a calculated BLOS value.
+    TrendDataTable = pd.DataFrame(BLOS.T, columns=[str(num + 1) for num in range(numCandidates)])
     return TrendDataTable
+    # -------- CREATE A TABLE FOR ALL BLOS DATA. --------
 
 #======================================================================================================================
 #Experimental Functions.
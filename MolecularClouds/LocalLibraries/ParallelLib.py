@@ -0,0 +1,153 @@
+'''
+This module contains functions related to running work over a pool of processes.
+
+- Read-only numpy arrays are placed in shared memory once, and every worker process attaches to them by name rather
+    than receiving its own copy.
+- The analysis scripts run at module level (they have no main guard), so worker processes are only started with the
+    'fork' start method. Where it is not available the work is done serially, with identical results.
+'''
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Arrays attached by a worker process, and the shared memory blocks that back them.
+_workerArrays = {}
+_workerBlocks = []
+
+
+def getWorkerCount(requestedWorkers):
+    '''
+    Finds the number of worker processes to use.
+    :param requestedWorkers: The number of worker processes requested. 0 or None uses one per available core. Int.
+    :return: The number of worker processes. Int.
+    '''
+    if requestedWorkers is None or requestedWorkers < 1:
+        return max(os.cpu_count() or 1, 1)
+    return int(requestedWorkers)
+
+
+def canUseProcesses():
+    '''
+    Checks whether worker processes can be started safely from a script without a main guard.
+    :return: True if the 'fork' start method is available.
+    '''
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def splitIntoChunks(nItems, chunkSize):
+    '''
+    Splits a range of items into consecutive chunks.
+    :param nItems: The number of items. Int.
+    :param chunkSize: The maximum number of items in a chunk. Int.
+    :return: A list of (start, stop) index pairs, in order.
+    '''
+    chunkSize = max(int(chunkSize), 1)
+    return [(start, min(start + chunkSize, nItems)) for start in range(0, nItems, chunkSize)]
+
+
+class SharedArrays:
+    def __init__(self, arrays):
+        '''
+        Copies a set of read-only arrays into shared memory. Use as a context manager so the memory is released.
+        :param arrays: A dictionary of name: numpy array.
+        '''
+        self.blocks = []
+        self.specs = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            sharedArray = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            sharedArray[...] = array
+            self.blocks.append(block)
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        '''
+        Releases the shared memory.
+        '''
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def _attachSharedArrays(specs):
+    '''
+    Worker process initializer: attaches to the shared arrays described by SharedArrays.specs.
+    :param specs: A dictionary of name: (shared memory name, shape, dtype).
+    '''
+    _workerArrays.clear()
+    for name, (blockName, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=blockName)
+        _workerBlocks.append(block)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        _workerArrays[name] = array
+
+
+def _runOnWorker(task):
+    '''
+    Runs one task on a worker process with the attached shared arrays.
+    :param task: A tuple of (function, argument).
+    :return: The function's result.
+    '''
+    func, arg = task
+    return func(_workerArrays, arg)
+
+
+def imapWithSharedArrays(func, items, arrays, numWorkers=1, maxPending=None):
+    '''
+    Applies func(arrays, arg) to a stream of (context, arg) items, yielding (context, result) in the order of the items.
+    Items are only drawn from the stream as workers become free, so a long stream is never held in memory at once.
+    :param func: A module level function taking a dictionary of read-only arrays and one argument.
+    :param items: An iterable of (context, arg). The context stays in this process and is passed back with the result.
+    :param arrays: A dictionary of name: numpy array which each task reads. Copied into shared memory when workers are
+        used, so later changes to these arrays are not seen by the tasks.
+    :param numWorkers: The number of worker processes. 0 or None uses one per available core. Int.
+    :param maxPending: The maximum number of tasks submitted ahead of the one being yielded. Default is twice the
+        number of workers.
+    :return: A generator of (context, result).
+    '''
+    numWorkers = getWorkerCount(numWorkers)
+    if numWorkers <= 1 or not canUseProcesses():
+        for context, arg in items:
+            yield context, func(arrays, arg)
+        return
+
+    maxPending = maxPending or 2 * numWorkers
+    with SharedArrays(arrays) as shared:
+        with ProcessPoolExecutor(max_workers=numWorkers, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=_attachSharedArrays, initargs=(shared.specs,)) as executor:
+            pending = deque()
+            for context, arg in items:
+                pending.append((context, executor.submit(_runOnWorker, (func, arg))))
+                if len(pending) >= maxPending:
+                    context, future = pending.popleft()
+                    yield context, future.result()
+            while pending:
+                context, future = pending.popleft()
+                yield context, future.result()
+
+
+def mapWithSharedArrays(func, args, arrays, numWorkers=1):
+    '''
+    Applies func(arrays, arg) to every argument, returning the results in the order of the arguments.
+    :param func: A module level function taking a dictionary of read-only arrays and one argument.
+    :param args: A list of arguments. One task is made per argument.
+    :param arrays: A dictionary of name: numpy array which each task reads.
+    :param numWorkers: The number of worker processes. 0 or None uses one per available core. Int.
+    :return: A list of the results, in the same order as args.
+    '''
+    args = list(args)
+    numWorkers = min(getWorkerCount(numWorkers), max(len(args), 1))
+    return [result for _, result in imapWithSharedArrays(func, ((None, arg) for arg in args), arrays, numWorkers)]
@@ -21,7 +21,8 @@ class RMCatalog:
            parameters such as ra, dec, rm, etc corresponding to a specific region of interest. Default parameters read
            the entire catalog.
 
-        :param filename: Path to the file containing the rotation measure data (eg the Taylor et al (2009) catalogue)
+        :param filename: Path to the file containing the rotation measure data (eg the Taylor et al (2009) catalogue),
+                         or a pandas DataFrame of rows already read from such a file
         :param raHoursMax: Hour component of the maximum right ascension of the region of interest
         :param raMinsMax:  Minute component of the maximum right ascension of the region of interest
         :param raSecMax:   Second component of the maximum right ascension of the region of interest
@@ -57,7 +58,10 @@ class RMCatalog:
         95-100  F6.1     rad/m2      Rotation Measusure
         102-105 F4.1     rad/m2      1-sigma error in RM
         """
-        RMCatalogueData = pd.read_csv(filename, delim_whitespace=True)
+        if isinstance(filename, pd.DataFrame):
+            RMCatalogueData = filename.reset_index(drop=True)
+        else:
+            RMCatalogueData = pd.read_csv(filename, delim_whitespace=True)
 
         raHours = RMCatalogueData["raHours"]
         raMins = RMCatalogueData["raMins"]
@@ -155,3 +159,18 @@ class RMCatalog:
                 self.targetRMErrs.append(RMErrs[index])
         # -------- EXTRACT INFORMATION FROM THE REGION OF INTEREST. --------
 # -------- CLASS DEFINITION. --------
+
+
+def readRMCatalogChunks(filename, chunkSize, raHoursMax = 24, raMinsMax = 0, raSecMax  = 0, raHoursMin = 0,
+                        raMinsMin  = 0, raSecMin  = 0, decDegMax = 90, decDegMin = -90):
+    """
+    Reads a rotation measure catalogue a chunk of rows at a time, so that the whole catalogue is never held in memory.
+    See RMCatalog for the format of the file and the meaning of the region of interest parameters.
+
+    :param filename: Path to the file containing the rotation measure data
+    :param chunkSize: The number of catalogue rows in each chunk
+    :return: A generator of RMCatalog objects, one per chunk of rows, in catalogue order. Each holds the rows of its
+        chunk which are within the region of interest.
+    """
+    for chunk in pd.read_csv(filename, delim_whitespace=True, chunksize=chunkSize):
+        yield RMCatalog(chunk, raHoursMax, raMinsMax, raSecMax, raHoursMin, raMinsMin, raSecMin, decDegMax, decDegMin)
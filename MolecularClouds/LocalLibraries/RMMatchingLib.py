@@ -0,0 +1,451 @@
+'''
+This module contains functions related to matching rotation measure points to extinction map pixels.
+
+- Matching is split in two steps. Points whose search box holds non-physical data are matched serially, in catalogue
+    order, interpolating the data they touch. Every other point only reads pixels which never change, so it can be
+    matched with many others at once and across worker processes, against any copy of the map.
+'''
+import math
+
+import numpy as np
+
+from . import BoxBounds as bb
+from . import ConversionLibrary as cl
+from . import InterpLibrary as IL
+
+# Maximum number of box pixels gathered at once when matching a batch of points.
+BATCH_PIXEL_BUDGET = 2 ** 22
+
+# Names of the values matched to each point.
+MATCH_FIELDS = ['Extinction_Value', 'Min_Value', 'Min_x', 'Min_y', 'Max_Value', 'Max_x', 'Max_y', 'Observed']
+
+# Columns of the matched rotation measure - extinction table.
+MATCHED_COLUMNS = ['Extinction_Index_x', 'Extinction_Index_y', 'Ra(deg)', 'Dec(deg)', 'Rotation_Measure(rad/m2)',
+                   'RM_Err(rad/m2)', 'RA_inExtincFile(degree)', 'Dec_inExtincFile(degree)', 'Extinction_Value',
+                   'Error_Range(pix)', 'Min_Extinction_Value', 'Min_Extinction_Ra', 'Min_Extinction_Dec',
+                   'Max_Extinction_Value', 'Max_Extinction_RA', 'Max_Extinction_dec', 'Extinction_Observed']
+
+
+def emptyMatch(n, dtype):
+    '''
+    Makes the arrays holding the matched values for n points, filled as unmatched.
+    :param n: The number of points. Int.
+    :param dtype: The data type of the extinction map.
+    :return: A dictionary of MATCH_FIELDS: numpy array.
+    '''
+    return {'Extinction_Value': np.full(n, np.nan, dtype=dtype),
+            'Min_Value': np.full(n, np.nan, dtype=dtype),
+            'Min_x': np.full(n, -1, dtype=int),
+            'Min_y': np.full(n, -1, dtype=int),
+            'Max_Value': np.full(n, np.nan, dtype=dtype),
+            'Max_x': np.full(n, -1, dtype=int),
+            'Max_y': np.full(n, -1, dtype=int),
+            'Observed': np.zeros(n, dtype=bool)}
+
+
+def isInMap(px, py, data):
+    '''
+    Checks which points lie within the extinction map.
+    :param px: Numpy array of x pixel indices.
+    :param py: Numpy array of y pixel indices.
+    :param data: The extinction map.
+    :return: A boolean numpy array.
+    '''
+    return (px >= 0) & (px < data.shape[1]) & (py >= 0) & (py < data.shape[0])
+
+
+def _firstExtremumIndex(values, findMin):
+    '''
+    Finds the first index of the minimum or maximum of a list of values, ignoring nans.
+    :param values: A 1d numpy array.
+    :param findMin: True to find the minimum, False to find the maximum.
+    :return: The index, or -1 if there is no non-nan value.
+    '''
+    comparable = ~np.isnan(values)
+    if not np.any(comparable):
+        return -1
+    extremum = np.min(values[comparable]) if findMin else np.max(values[comparable])
+    return int(np.argmax(comparable & (values == extremum)))
+
+
+def _interpolateNullBox(px, py, data, baddata, interpMethod, borderWidth, changeLog=None):
+    '''
+    Interpolates the non-physical data in the box of nan values around a pixel, in place.
+    If a change log list is given, the (y, x) indices of the interpolated pixels are appended to it.
+    '''
+    xmin, xmax, ymin, ymax = bb.getNullBoxBound(px, py, data)
+    if changeLog is not None:
+        changedY, changedX = np.nonzero(baddata[ymin:ymax, xmin:xmax])
+        changeLog.append((changedY + ymin, changedX + xmin))
+    data[ymin:ymax, xmin:xmax] = IL.interpMask(data[ymin:ymax, xmin:xmax], baddata[ymin:ymax, xmin:xmax],
+                                               interpMethod, borderWidth=borderWidth)
+    baddata[ymin:ymax, xmin:xmax] = False
+
+
+def matchPointSerial(px, py, NDelt, data, nodata, baddata, interpByPoint, interpLocal, interpMethod, borderWidth,
+                     changeLog=None):
+    '''
+    Matches one point to the extinction map, interpolating any non-physical data it touches in place.
+    :param px: The x pixel index of the point. Int.
+    :param py: The y pixel index of the point. Int.
+    :param NDelt: Number of pixels horizontally and vertically from the point to search for the min/max extinction.
+    :param data: The extinction map. Modified in place by interpolation.
+    :param nodata: Boolean map of the missing data.
+    :param baddata: Boolean map of the non-physical data which has not been interpolated yet. Modified in place.
+    :param interpByPoint: Whether the point may be matched to a non-physical pixel by interpolating it.
+    :param interpLocal: Whether non-physical data within the search box is interpolated.
+    :param interpMethod: The interpolation method. String.
+    :param borderWidth: The interpolation border width. See IL.interpMask.
+    :param changeLog: Optional list the (y, x) indices of the interpolated pixels are appended to.
+    :return: A tuple of the MATCH_FIELDS values, or None if the point cannot be matched.
+    '''
+    # ---- Skip the point if it violates a condition.
+    inFitsFile = 0 <= px < data.shape[1] and 0 <= py < data.shape[0]
+    hasData = inFitsFile and not nodata[py, px]
+    physicalData = inFitsFile and not baddata[py, px]
+    validPoint = inFitsFile and hasData and (physicalData or interpByPoint)
+    if not validPoint:
+        return None
+    # ---- Skip the point if it violates a condition.
+
+    # ---- Interpolate Missing Data
+    if not physicalData and interpByPoint:
+        _interpolateNullBox(px, py, data, baddata, interpMethod, borderWidth, changeLog)
+    # ---- Interpolate Missing Data
+    extinction = data[py, px]
+
+    # ---- Cycle through extinction values within the error range
+    ind_xmin, ind_xmax, ind_ymin, ind_ymax = bb.getBoxBound(px, py, data, NDelt)
+    extinction_temp = []
+    x_temp = []
+    y_temp = []
+    for pxx in range(ind_xmin, ind_xmax):
+        for pyy in range(ind_ymin, ind_ymax):
+            # Skip Missing Data
+            if nodata[pyy, pxx] or (math.isnan(data[pyy, pxx]) and not baddata[pyy, pxx]):
+                continue
+            # Interpolate Bad Data, if interpolation is to be done.
+            if baddata[pyy, pxx] and interpLocal:
+                _interpolateNullBox(pxx, pyy, data, baddata, interpMethod, borderWidth, changeLog)
+            extinction_temp.append(data[pyy, pxx])
+            x_temp.append(pxx)
+            y_temp.append(pyy)
+    # ---- Cycle through extinction values within the error range.
+
+    extinction_temp = np.array(extinction_temp, dtype=data.dtype)
+    ind_min = _firstExtremumIndex(extinction_temp, True)
+    ind_max = _firstExtremumIndex(extinction_temp, False)
+    minMatch = (extinction_temp[ind_min], x_temp[ind_min], y_temp[ind_min]) if ind_min >= 0 else (np.nan, -1, -1)
+    maxMatch = (extinction_temp[ind_max], x_temp[ind_max], y_temp[ind_max]) if ind_max >= 0 else (np.nan, -1, -1)
+
+    # Negative extinction is not physical; in prior step it was interpolated away. Mark these points.
+    observed = not baddata[py, px]
+
+    return (extinction,) + minMatch + maxMatch + (observed,)
+
+
+def getSearchBoxSizes(raErrSecs, decErrArcSecs, extinctionResolutionDegs):
+    '''
+    Finds the search box half-width of each rotation measure from its own positional uncertainty.
+    It is 1 pixel at most if the extinction map has a lower resolution than the rotation measure's position,
+    and the number of pixels which fit within that uncertainty otherwise.
+    :param raErrSecs: Numpy array of the right ascension uncertainties (seconds).
+    :param decErrArcSecs: Numpy array of the declination uncertainties (arcseconds).
+    :param extinctionResolutionDegs: The resolution of the extinction map (degrees).
+    :return: RMResolutionDegs - numpy array of the positional uncertainties (degrees).
+             NDelt - numpy array of the search box half-widths (pixels).
+    '''
+    raErrs = cl.ra_hms2deg(0, 0, np.abs(np.asarray(raErrSecs, dtype=float)))  # deg
+    decErrs = np.abs(np.asarray(decErrArcSecs, dtype=float)) / 3600  # deg
+    RMResolutionDegs = np.maximum(raErrs, decErrs)
+    NDelt = np.where(extinctionResolutionDegs > RMResolutionDegs, 1, np.ceil(RMResolutionDegs / extinctionResolutionDegs))
+    return RMResolutionDegs, NDelt.astype(int)
+
+
+def storedPositionSources(keys, rotationMeasures, rmErrs):
+    '''
+    Groups the stored rotation measure sources by their catalogue position, for sourceKeys.
+    :param keys: The source keys of the stored sources. See sourceKeys.
+    :param rotationMeasures: The stored rotation measure of each source.
+    :param rmErrs: The stored rotation measure error of each source.
+    :return: A dictionary of position: [list of (key, rotation measure, rotation measure error) of the stored sources at
+        the position, in the order they were first stored; the next unused occurrence number at the position].
+    '''
+    positionSources = {}
+    for key, rm, rmErr in zip(keys, rotationMeasures, rmErrs):
+        position, occurrence = key.rsplit('#', 1)
+        entry = positionSources.setdefault(position, [[], 0])
+        entry[0].append((int(occurrence), key, rm, rmErr))
+        entry[1] = max(entry[1], int(occurrence) + 1)
+    for entry in positionSources.values():
+        entry[0] = [source[1:] for source in sorted(entry[0])]
+    return positionSources
+
+
+def sourceKeys(rmData, positionSources):
+    '''
+    Makes a key identifying each rotation measure source by its catalogue position. Sources listed more than once at the
+    same position are told apart by an occurrence number.
+    An entry at a position which has stored sources takes the key of a stored source with the same rotation measure and
+    error if there is one, and otherwise of the first stored source left at the position, so that removing one of
+    several entries at a position does not move the others onto each other's keys. Entries left over get new keys,
+    numbered in the order they appear. Stored sources are matched to the entries of one chunk at a time, so a source
+    whose entries are spread over several chunks falls back on their order sooner.
+    :param rmData: The RMCatalog of the rotation measures, in catalogue order.
+    :param positionSources: A dictionary of the sources at each position, from storedPositionSources. Updated in place,
+        so that it can be carried over successive chunks of the same catalogue; a stored source is taken only once.
+    :return: A numpy array of the keys. Strings.
+    '''
+    positions = [':'.join(str(value) for value in position)
+                 for position in zip(rmData.targetRAHours, rmData.targetRAMins, rmData.targetRASecs,
+                                     rmData.targetDecDegs, rmData.targetDecArcMins, rmData.targetDecArcSecs)]
+    keys = [None] * len(positions)
+
+    # ---- Take the stored sources with the same rotation measure and error first.
+    for i, (position, rm, rmErr) in enumerate(zip(positions, rmData.targetRotationMeasures, rmData.targetRMErrs)):
+        storedSources = positionSources.get(position, [[], 0])[0]
+        for j, (key, storedRM, storedRMErr) in enumerate(storedSources):
+            if storedRM == rm and storedRMErr == rmErr:
+                keys[i] = key
+                del storedSources[j]
+                break
+    # ---- Then the remaining stored sources in order, then new keys.
+    for i, position in enumerate(positions):
+        if keys[i] is not None:
+            continue
+        entry = positionSources.setdefault(position, [[], 0])
+        if len(entry[0]) > 0:
+            keys[i] = entry[0].pop(0)[0]
+        else:
+            keys[i] = '{}#{}'.format(position, entry[1])
+            entry[1] += 1
+    return np.array(keys, dtype=str)
+
+
+def findPointPixels(wcs, ra, dec):
+    '''
+    Finds the extinction map pixel of each rotation measure.
+    :param wcs: The world coordinate system of the extinction map.
+    :param ra: Numpy array of right ascensions (degrees).
+    :param dec: Numpy array of declinations (degrees).
+    :return: px, py - numpy arrays of the pixel indices.
+    '''
+    if len(ra) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    py, px = wcs.world_to_array_index_values(ra, dec)
+    return np.asarray(px, dtype=int).reshape(-1), np.asarray(py, dtype=int).reshape(-1)
+
+
+def findTouchedPoints(px, py, NDelt, nodata, baddata, touchableTable, interpByPoint, interpLocal):
+    '''
+    Sorts the points into those which touch non-physical data, and so must be matched serially by matchTouchedPoints,
+    and those which only read the map and can be matched by matchPoints.
+    :param px: Numpy array of the x pixel indices of the points.
+    :param py: Numpy array of the y pixel indices of the points.
+    :param NDelt: Numpy array of the search box half-widths of the points.
+    :param nodata: Boolean map of the missing data.
+    :param baddata: Boolean map of the non-physical data which has not been interpolated yet.
+    :param touchableTable: Summed-area table of the non-physical data which may be interpolated (baddata & ~nodata), as
+        it was before any point was matched. See bb.summedAreaTable.
+    :param interpByPoint: Whether a point may be matched to a non-physical pixel by interpolating it.
+    :param interpLocal: Whether non-physical data within the search boxes is interpolated.
+    :return: touched - boolean numpy array of the points which touch non-physical data.
+             readOnlyMatched - boolean numpy array of the other points which can be matched.
+    '''
+    inMap = isInMap(px, py, nodata)
+    touched = np.zeros(len(px), dtype=bool)
+    if interpLocal:
+        touched[inMap] = bb.countInBoxes(touchableTable, px[inMap], py[inMap], NDelt[inMap]) > 0
+
+    # Points which touch no non-physical data can be judged on the map directly. Their pixels never change.
+    readOnly = inMap & ~touched
+    readOnlyMatched = np.zeros(len(px), dtype=bool)
+    readOnlyMatched[readOnly] = ~nodata[py[readOnly], px[readOnly]] & (~baddata[py[readOnly], px[readOnly]] | interpByPoint)
+    return touched, readOnlyMatched
+
+
+def matchTouchedPoints(px, py, NDelt, touched, data, nodata, baddata, interpByPoint, interpLocal, interpMethod,
+                       borderWidth, changeLog=None):
+    '''
+    Matches the points which touch non-physical data, in catalogue order, interpolating the data they touch in place.
+    Points must be given to this function in catalogue order across calls, as each interpolation depends on the last.
+    :param px: Numpy array of the x pixel indices of the points, in catalogue order.
+    :param py: Numpy array of the y pixel indices of the points, in catalogue order.
+    :param NDelt: Numpy array of the search box half-widths of the points.
+    :param touched: Boolean numpy array of the points to match. See findTouchedPoints.
+    :param data: The extinction map. Modified in place by interpolation.
+    :param nodata: Boolean map of the missing data.
+    :param baddata: Boolean map of the non-physical data which has not been interpolated yet. Modified in place.
+    :param interpByPoint: Whether a point may be matched to a non-physical pixel by interpolating it.
+    :param interpLocal: Whether non-physical data within the search boxes is interpolated.
+    :param interpMethod: The interpolation method. String.
+    :param borderWidth: The interpolation border width. See IL.interpMask.
+    :param changeLog: Optional list the (y, x) indices of the interpolated pixels are appended to.
+    :return: A dictionary of point index: tuple of MATCH_FIELDS values, for the points which could be matched.
+    '''
+    serialMatches = {}
+    # Once a point is matched, its search box holds no non-physical data left to interpolate, so a later point on the
+    # same pixel with the same search box gets the same match.
+    matchedPixels = {}
+    for index in np.flatnonzero(touched):
+        pixel = (int(px[index]), int(py[index]), int(NDelt[index]))
+        match = matchedPixels.get(pixel)
+        if match is None:
+            match = matchPointSerial(pixel[0], pixel[1], pixel[2], data, nodata, baddata,
+                                     interpByPoint, interpLocal, interpMethod, borderWidth, changeLog)
+        if match is not None:
+            matchedPixels[pixel] = match
+            serialMatches[int(index)] = match
+    return serialMatches
+
+
+def uniquePixels(*pixelArrays):
+    '''
+    Groups points which share the same pixel (and any further per-point values, such as the search box half-width).
+    :param pixelArrays: Numpy arrays of equal length, such as px, py and NDelt.
+    :return: uniqueArrays - a tuple of the numpy arrays for each unique group, in order of first appearance.
+             inverse - numpy array mapping each point to its group, so that uniqueArray[inverse] gives back each point.
+    '''
+    keys = np.stack([np.asarray(array, dtype=float) for array in pixelArrays], axis=1)
+    _, firstIndex, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    # Order the groups by first appearance so results do not depend on the sort order of np.unique.
+    order = np.argsort(firstIndex, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    firstIndex = firstIndex[order]
+    return tuple(np.asarray(array)[firstIndex] for array in pixelArrays), rank[inverse]
+
+
+def matchPoints(arrays, points):
+    '''
+    Matches a batch of points to a final (read-only) extinction map.
+    Points landing on the same pixel with the same search box are matched once and the result is shared between them.
+    Within each search box pixels are visited column by column, so the first of several equal minima/maxima is the same
+    one the serial match finds.
+    :param arrays: A dictionary holding the 'data', 'nodata' and 'baddata' maps.
+    :param points: A tuple of numpy arrays (px, py, NDelt).
+    :return: A dictionary of MATCH_FIELDS: numpy array.
+    '''
+    data = arrays['data']
+    nodata = arrays['nodata']
+    baddata = arrays['baddata']
+    px, py, NDelt = points
+
+    if len(px) == 0:
+        return emptyMatch(0, data.dtype)
+    (px, py, NDelt), inverse = uniquePixels(px, py, NDelt)
+    NDelt = np.asarray(NDelt).astype(int)
+
+    match = emptyMatch(len(px), data.dtype)
+    match['Extinction_Value'][:] = data[py, px]
+    match['Observed'][:] = ~baddata[py, px]
+
+    for boxHalfWidth in np.unique(NDelt):
+        # ---- Offsets of the box pixels, in the order the serial match visits them (x outer, y inner).
+        offsets = np.arange(-boxHalfWidth, boxHalfWidth + 1)
+        dx = np.repeat(offsets, len(offsets))
+        dy = np.tile(offsets, len(offsets))
+        # ---- Offsets of the box pixels.
+
+        members = np.flatnonzero(NDelt == boxHalfWidth)
+        batchSize = max(BATCH_PIXEL_BUDGET // len(dx), 1)
+        for start in range(0, len(members), batchSize):
+            batch = members[start:start + batchSize]
+            boxX = px[batch, None] + dx[None, :]
+            boxY = py[batch, None] + dy[None, :]
+            inBox = isInMap(boxX, boxY, data)
+            boxX = np.clip(boxX, 0, data.shape[1] - 1)
+            boxY = np.clip(boxY, 0, data.shape[0] - 1)
+
+            values = data[boxY, boxX]
+            # Skip missing data, as in the serial match; nans are then ignored when finding the min/max.
+            used = inBox & ~nodata[boxY, boxX] & ~(np.isnan(values) & ~baddata[boxY, boxX])
+            comparable = used & ~np.isnan(values)
+            hasValue = np.any(comparable, axis=1)
+            rows = np.arange(len(batch))
+
+            for prefix, findMin in (('Min', True), ('Max', False)):
+                fill = np.inf if findMin else -np.inf
+                masked = np.where(comparable, values, fill)
+                extremum = masked.min(axis=1) if findMin else masked.max(axis=1)
+                first = np.argmax(comparable & (values == extremum[:, None]), axis=1)
+                found = batch[hasValue]
+                match[prefix + '_Value'][found] = values[rows, first][hasValue]
+                match[prefix + '_x'][found] = boxX[rows, first][hasValue]
+                match[prefix + '_y'][found] = boxY[rows, first][hasValue]
+
+    return {field: values[inverse] for field, values in match.items()}
+
+
+def pixelsToWorld(wcs, px, py):
+    '''
+    Converts pixel indices to world coordinates, converting each distinct pixel only once.
+    :param wcs: The world coordinate system of the extinction map.
+    :param px: Numpy array of x pixel indices. Negative indices mark points without a pixel.
+    :param py: Numpy array of y pixel indices.
+    :return: ra, dec - numpy arrays of the world coordinates (degrees), nan for points without a pixel.
+    '''
+    ra = np.full(len(px), np.nan)
+    dec = np.full(len(px), np.nan)
+    hasPixel = (np.asarray(px) >= 0) & (np.asarray(py) >= 0)
+    if np.any(hasPixel):
+        (uniqueX, uniqueY), inverse = uniquePixels(np.asarray(px)[hasPixel], np.asarray(py)[hasPixel])
+        uniqueRa, uniqueDec = wcs.wcs_pix2world(uniqueX, uniqueY, 0)
+        ra[hasPixel] = uniqueRa[inverse]
+        dec[hasPixel] = uniqueDec[inverse]
+    return ra, dec
+
+
+def mergeMatches(n, dtype, indexedMatches, serialMatches):
+    '''
+    Merges batch and serial matches into one set of arrays, in catalogue order.
+    :param n: The number of points. Int.
+    :param dtype: The data type of the extinction map.
+    :param indexedMatches: A list of (point indices, dictionary of MATCH_FIELDS: numpy array) from matchPoints.
+    :param serialMatches: A dictionary of point index: tuple of MATCH_FIELDS values, from matchTouchedPoints.
+    :return: A dictionary of MATCH_FIELDS: numpy array.
+    '''
+    merged = emptyMatch(n, dtype)
+    for indices, match in indexedMatches:
+        for field in MATCH_FIELDS:
+            merged[field][indices] = match[field]
+    for index, values in serialMatches.items():
+        for field, value in zip(MATCH_FIELDS, values):
+            merged[field][index] = value
+    return merged
+
+
+def matchedColumns(rmData, px, py, NDelt, rows, matches, wcs):
+    '''
+    Makes the columns of the matched rotation measure - extinction table for a set of rotation measures.
+    :param rmData: The RMCatalog of the rotation measures.
+    :param px: Numpy array of the x pixel indices of the rotation measures.
+    :param py: Numpy array of the y pixel indices of the rotation measures.
+    :param NDelt: Numpy array of the search box half-widths of the rotation measures.
+    :param rows: Boolean numpy array of the rotation measures to make rows for.
+    :param matches: A dictionary of MATCH_FIELDS: numpy array for the rotation measures. See mergeMatches.
+    :param wcs: The world coordinate system of the extinction map.
+    :return: A dictionary of MATCHED_COLUMNS: numpy array, for the selected rotation measures in catalogue order.
+    '''
+    matched = np.flatnonzero(rows)
+    extinctionRa, extinctionDec = pixelsToWorld(wcs, px[matched], py[matched])
+    minRa, minDec = pixelsToWorld(wcs, matches['Min_x'][matched], matches['Min_y'][matched])
+    maxRa, maxDec = pixelsToWorld(wcs, matches['Max_x'][matched], matches['Max_y'][matched])
+    return {'Extinction_Index_x': px[matched],
+            'Extinction_Index_y': py[matched],
+            'Ra(deg)': np.array(rmData.targetRaHourMinSecToDeg, dtype=float)[matched],
+            'Dec(deg)': np.array(rmData.targetDecDegArcMinSecs, dtype=float)[matched],
+            'Rotation_Measure(rad/m2)': np.array(rmData.targetRotationMeasures)[matched],
+            'RM_Err(rad/m2)': np.array(rmData.targetRMErrs)[matched],
+            'RA_inExtincFile(degree)': extinctionRa,
+            'Dec_inExtincFile(degree)': extinctionDec,
+            'Extinction_Value': matches['Extinction_Value'][matched],
+            'Error_Range(pix)': NDelt[matched],
+            'Min_Extinction_Value': matches['Min_Value'][matched],
+            'Min_Extinction_Ra': minRa,
+            'Min_Extinction_Dec': minDec,
+            'Max_Extinction_Value': matches['Max_Value'][matched],
+            'Max_Extinction_RA': maxRa,
+            'Max_Extinction_dec': maxDec,
+            'Extinction_Observed': matches['Observed'][matched]}
@@ -1,58 +1,151 @@
 '''
 Contains functions involved with providing information to make decisions on which points to include or exclude.
 '''
+import os
 import math
 import numpy as np
-from sklearn.linear_model import Ridge
+import pandas as pd
+from scipy import ndimage as ndimage
 from .BoxBounds import getBoxBound
-import copy
+from .MatchStoreLib import hashValues
+
+# The column of the potential reference point table holding why each point was rejected, as a sum of the flags below.
+# A point which is not rejected has no flag set (0) and remains a potential reference point.
+REJECTION_FLAGS = 'Rejection_Flags'
+REJECTED_NEAR_HIGH_EXT = 1  # Near a region of high extinction
+REJECTED_FAR_HIGH_EXT = 2  # Far from any region of high extinction
+REJECTED_ANOMALOUS_RM = 4  # Anomalous rotation measure
+REJECTED_MAX_FRACTION = 8  # Beyond the maximum fraction of points which may be taken as reference points
+
+# The column of the matched rm and extinction table holding the quadrant of the cloud each point is in.
+QUADRANT = 'Quadrant'
+
+# The columns of the cloud geometry table, and the key of the map and region it was found for.
+GEOMETRY_COLUMNS = ['Cloud Center X', 'Cloud Center Y',
+                    'Slope of Line Through Cloud', 'Vertical Offset of Line Through Cloud',
+                    'Slope of Perpendicular Line', 'Vertical Offset of Perpendicular Line']
+GEOMETRY_KEY = 'Geometry Key'
+# Part of the geometry key. Changed whenever the way the geometry is found changes, so older geometry is not reused.
+GEOMETRY_VERSION = 2
 
 # -------- FUNCTION DEFINITION --------
-def findWeightedCenter(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax = np.nan, maskWeight = 2):
+def getCleanRegion(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax = np.nan):
     """
-    Given a 2d numpy array and some bounds, finds the weighted center of the bounded region.
+    Copies the bounded region of a 2d numpy array, with its nan and inf values set to 0.
     :param data: 2d numpy array, such as a greyscale image file (Numerical array)
     :param xmin: Left x-axis bound (int)
     :param xmax: Right x-axis bound (int)
     :param ymin: Bottom y-axis bound (int)
     :param ymax: Top y-axis bound (int)
-    :param maskWeight: Points less than maskWeight * average data value will not be considered. Set to 0 to weight everything (Float)
     :return:
-        xCoord: The x-coordinate of the weighted center of the bound region (Float)
-        yCoord: The y-coordinate of the weighted center of the bound region (Float)
+        locData: The cleaned copy of the bounded region (Numerical array)
+        xOffset: The x-coordinate of the region in the data (int)
+        yOffset: The y-coordinate of the region in the data (int)
     """
-    #Guard against modifying input data
-    locData = copy.deepcopy(data)
-
-    #Clean input data
-    locData[np.isnan(locData)] = 0
-    locData[np.isinf(locData)] = 0
-
-    #Find offsets in case we only care about a smaller region
+    # Find offsets in case we only care about a smaller region
     xOffset = 0
     yOffset = 0
     if not math.isnan(xmax) and not math.isnan(xmin):
-        locData = locData[:, int(xmin):int(xmax)]
+        data = data[:, int(xmin):int(xmax)]
         xOffset = xmin
     if not math.isnan(ymax) and not math.isnan(ymin):
-        locData = locData[int(ymin):int(ymax), :]
+        data = data[int(ymin):int(ymax), :]
         yOffset = ymin
 
-    #Weight the multipliers by position
-    x = range(0, locData.shape[1])
-    y = range(0, locData.shape[0])
-    X, Y = np.meshgrid(x, y)
+    # Only the region is copied, so the input data is not modified.
+    locData = np.array(data)
+    locData[~np.isfinite(locData)] = 0
+    return locData, xOffset, yOffset
+# -------- FUNCTION DEFINITION --------
 
-    #Mask out all values not part of the cloud we care about
-    lowExtinctMask = locData < 1.0 * maskWeight * np.sum(locData) / (locData.shape[0] * locData.shape[1])
-    locData[lowExtinctMask] = 0
+# -------- FUNCTION DEFINITION --------
+def getMaskThreshold(locData, maskWeight = 2):
+    """
+    :param locData: A cleaned region. See getCleanRegion.
+    :param maskWeight: Multiple of the average data value which the cloud is masked at (Float)
+    :return: The data value which the cloud is masked at (Float)
+    """
+    return maskWeight * np.sum(locData) / (locData.shape[0] * locData.shape[1])
+# -------- FUNCTION DEFINITION --------
 
-    xCoord = ((X * locData).sum() / locData.sum().astype(float)) + xOffset
-    yCoord = ((Y * locData).sum() / locData.sum().astype(float)) + yOffset
+# -------- FUNCTION DEFINITION --------
+def weightedCenterOfRegion(locData, xOffset, yOffset, maskThreshold):
+    """
+    Finds the weighted center of a cleaned region. See findWeightedCenter.
+    :param locData: A cleaned region, and its offsets. See getCleanRegion.
+    :param maskThreshold: Points less than this value are not considered. See getMaskThreshold.
+    :return: xCoord, yCoord - The coordinates of the weighted center (Float)
+    """
+    # Mask out all values not part of the cloud we care about
+    cloudData = np.where(locData < maskThreshold, 0, locData)
 
+    # Weight the multipliers by position
+    xCoord = ((np.arange(locData.shape[1])[np.newaxis, :] * cloudData).sum() / cloudData.sum().astype(float)) + xOffset
+    yCoord = ((np.arange(locData.shape[0])[:, np.newaxis] * cloudData).sum() / cloudData.sum().astype(float)) + yOffset
     return xCoord, yCoord
 # -------- FUNCTION DEFINITION --------
 
+# -------- FUNCTION DEFINITION --------
+def dividingLineOfRegion(locData, xOffset, yOffset, maskThreshold, alpha = 0.1, rowsPerBlock = 256):
+    """
+    Finds the line which divides a cleaned region into two equally-weighted regions. See getDividingLine.
+    The line is the weighted ridge regression of y on x over the points above the threshold, found in closed form from
+    the weighted moments of those points. The moments are summed over blocks of rows, so no coordinate arrays are made.
+    :param locData: A cleaned region, and its offsets. See getCleanRegion.
+    :param maskThreshold: Points less than or equal to this value are not considered. See getMaskThreshold.
+    :param alpha: The ridge penalty on the slope (Float)
+    :param rowsPerBlock: The number of rows summed at a time (int)
+    :return: m, b - The multiplier and offset, in mx+b (float)
+    """
+    xIndex = np.arange(locData.shape[1], dtype=float)
+
+    # Sum the zeroth, first and second moments of the points above the threshold, weighted by their value.
+    sumW = sumWX = sumWY = sumWXX = sumWXY = 0.0
+    for rowStart in range(0, locData.shape[0], rowsPerBlock):
+        block = locData[rowStart:rowStart + rowsPerBlock]
+        weights = np.where(block > maskThreshold, block, 0).astype(float)
+        yIndex = np.arange(rowStart, rowStart + block.shape[0], dtype=float)
+        columnWeights = weights.sum(axis=0)
+        rowWeights = weights.sum(axis=1)
+        sumW += columnWeights.sum()
+        sumWX += columnWeights @ xIndex
+        sumWY += rowWeights @ yIndex
+        sumWXX += columnWeights @ (xIndex * xIndex)
+        sumWXY += yIndex @ (weights @ xIndex)
+
+    # Weighted means and centered moments, as in the ridge regression with an intercept.
+    xMean = sumWX / sumW
+    yMean = sumWY / sumW
+    varianceX = sumWXX - sumW * xMean * xMean
+    covarianceXY = sumWXY - sumW * xMean * yMean
+
+    m = covarianceXY / (varianceX + alpha)
+    b = yMean - m * xMean
+
+    #Adjust for offsets
+    b = b + yOffset - m * xOffset
+
+    return m, b
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def findWeightedCenter(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax = np.nan, maskWeight = 2):
+    """
+    Given a 2d numpy array and some bounds, finds the weighted center of the bounded region.
+    :param data: 2d numpy array, such as a greyscale image file (Numerical array)
+    :param xmin: Left x-axis bound (int)
+    :param xmax: Right x-axis bound (int)
+    :param ymin: Bottom y-axis bound (int)
+    :param ymax: Top y-axis bound (int)
+    :param maskWeight: Points less than maskWeight * average data value will not be considered. Set to 0 to weight everything (Float)
+    :return:
+        xCoord: The x-coordinate of the weighted center of the bound region (Float)
+        yCoord: The y-coordinate of the weighted center of the bound region (Float)
+    """
+    locData, xOffset, yOffset = getCleanRegion(data, xmin, xmax, ymin, ymax)
+    return weightedCenterOfRegion(locData, xOffset, yOffset, getMaskThreshold(locData, maskWeight))
+# -------- FUNCTION DEFINITION --------
+
 # -------- FUNCTION DEFINITION --------
 def getDividingLine(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax = np.nan, maskWeight = 2):
     """
@@ -67,50 +160,52 @@ def getDividingLine(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax = np
         m: The multiplier, in mx+b (float)
         b: The offset, in mx+b (float)
     """
-    # Guard against modifying input data
-    locData = copy.deepcopy(data)
-
-    # Clean input data
-    locData[np.isnan(locData)] = 0
-    locData[np.isinf(locData)] = 0
-
-    # Find offsets in case we only care about a smaller region
-    xOffset = 0
-    yOffset = 0
-    if not math.isnan(xmax) and not math.isnan(xmin):
-        locData = locData[:, int(xmin):int(xmax)]
-        xOffset = xmin
-    if not math.isnan(ymax) and not math.isnan(ymin):
-        locData = locData[int(ymin):int(ymax), :]
-        yOffset = ymin
-
-    #Define masks and weights
-    highExtinctMask = locData > maskWeight * np.sum(locData)/(locData.shape[0]*locData.shape[1])
-    weights = locData[highExtinctMask]
-    coordsHighExtinct = np.argwhere(highExtinctMask)
-
-    #x indexes
-    xInput = coordsHighExtinct[:, 1].reshape(-1, 1)
-
-    #y indexes to predict
-    y = coordsHighExtinct[:, 0]
-
-    # Linear Predictor
-    predictor = Ridge(alpha=0.1)
-    predictor.fit(xInput, y, weights)
-
-    # Generate predictions
-    xOutput = np.array([xInput.min(), xInput.max()]).reshape(-1, 1).astype(float)
-    yOutput = predictor.predict(xOutput).astype(float)
+    locData, xOffset, yOffset = getCleanRegion(data, xmin, xmax, ymin, ymax)
+    return dividingLineOfRegion(locData, xOffset, yOffset, getMaskThreshold(locData, maskWeight))
+# -------- FUNCTION DEFINITION --------
 
-    #Adjust for offsets
-    xOutput += xOffset #Notes on +=: In numpy, let A be a numpy array, and B be a number. Then A += B adds b to every value in the array A.
-    yOutput += yOffset
+# -------- FUNCTION DEFINITION --------
+def getCloudGeometry(data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax = np.nan, maskWeight = 2):
+    """
+    Finds the weighted center of the cloud, the line through it which divides it into two equally-weighted regions, and
+    the perpendicular line through the center, cleaning and masking the bounded region only once.
+    :param data: 2d numpy array, such as a greyscale image file (Numerical array)
+    :param xmin: Left x-axis bound (int)
+    :param xmax: Right x-axis bound (int)
+    :param ymin: Bottom y-axis bound (int)
+    :param ymax: Top y-axis bound (int)
+    :param maskWeight: Points less than maskWeight * average data value will not be considered. Set to 0 to weight everything (Float)
+    :return: A dictionary of GEOMETRY_COLUMNS: value (Float).
+    """
+    locData, xOffset, yOffset = getCleanRegion(data, xmin, xmax, ymin, ymax)
+    maskThreshold = getMaskThreshold(locData, maskWeight)
+    cloudCenterX, cloudCenterY = weightedCenterOfRegion(locData, xOffset, yOffset, maskThreshold)
+    m, b = dividingLineOfRegion(locData, xOffset, yOffset, maskThreshold)
+    mPerp, bPerp = getPerpendicularLine(cloudCenterX, cloudCenterY, m)
+    return dict(zip(GEOMETRY_COLUMNS, [cloudCenterX, cloudCenterY, m, b, mPerp, bPerp]))
+# -------- FUNCTION DEFINITION --------
 
-    m = (yOutput[1]-yOutput[0])/(xOutput[1]-xOutput[0])
-    b = (xOutput[0]*yOutput[1] - xOutput[1]*yOutput[0])/(xOutput[0]-xOutput[1])
+# -------- FUNCTION DEFINITION --------
+def loadCloudGeometry(geometryFile, data, xmin = np.nan, xmax = np.nan, ymin = np.nan, ymax = np.nan, maskWeight = 2, sep = '\t'):
+    """
+    Loads the cloud geometry of getCloudGeometry from a file, finding and saving it first if the file was made for a
+    different map, region or mask weight.
+    :param geometryFile: Path to the cloud geometry table, such as the quadrant division data.
+    :param sep: The separator of the table.
+    See getCloudGeometry for the other parameters.
+    :return: A dictionary of GEOMETRY_COLUMNS: value.
+    """
+    key = hashValues(data, (xmin, xmax, ymin, ymax), maskWeight, GEOMETRY_VERSION)
+    if os.path.isfile(geometryFile):
+        geometryData = pd.read_csv(geometryFile, sep=sep, float_precision='round_trip')
+        if GEOMETRY_KEY in geometryData.columns and len(geometryData) > 0 and geometryData[GEOMETRY_KEY][0] == key:
+            return {column: geometryData[column][0] for column in GEOMETRY_COLUMNS}
 
-    return m, b
+    geometry = getCloudGeometry(data, xmin, xmax, ymin, ymax, maskWeight)
+    geometryData = pd.DataFrame({column: [value] for column, value in geometry.items()}, columns=GEOMETRY_COLUMNS)
+    geometryData[GEOMETRY_KEY] = [key]
+    geometryData.to_csv(geometryFile, index=False, sep=sep)
+    return geometry
 # -------- FUNCTION DEFINITION --------
 
 # -------- FUNCTION DEFINITION --------
@@ -159,11 +254,98 @@ def IsNearHighExt(px, py, data, NDelt, highExtinctionThreshold):
     # ---- Find the extinction range for the given point.
 
     # ---- Select the relevant data range and check if any point is greater than the threshold.
-    locData = copy.deepcopy(data[ind_ymin:ind_ymax, ind_xmin:ind_xmax])
-    mask = locData > highExtinctionThreshold
-    if np.sum(mask) > 0:
-        return True
-    return False
+    return bool(np.any(data[ind_ymin:ind_ymax, ind_xmin:ind_xmax] > highExtinctionThreshold))
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def getHighExtDistances(data, highExtinctionThreshold):
+    """
+    Finds how far every pixel is from the nearest point of high extinction, in the chessboard (Chebyshev) metric.
+    A point is within NDelt of a point of high extinction, as checked by IsNearHighExt, exactly when this distance is at
+    most NDelt, so near/far decisions for any number of points and any NDelt are single lookups into the result.
+    :param data: The extinction dataset in question
+    :param highExtinctionThreshold: The threshold beyond which a point is considered to be high extinction.
+    :return: A 2d numpy array of the distance, in pixels, of every pixel to the nearest point of high extinction.
+        Infinite everywhere if there is no point of high extinction.
+    """
+    highExtMask = data > highExtinctionThreshold
+    if not np.any(highExtMask):
+        return np.full(data.shape, np.inf)
+    return ndimage.distance_transform_cdt(~highExtMask, metric='chessboard').astype(float)
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def IsNearHighExtArray(px, py, highExtDistances, NDelt):
+    """
+    Checks to see if each of many points is near a point of high extinction. Vectorized form of IsNearHighExt.
+    :param px: Numpy array of the x locations of the points, within the dataset
+    :param py: Numpy array of the y locations of the points, within the dataset
+    :param highExtDistances: The distance of every pixel to the nearest point of high extinction. See getHighExtDistances.
+    :param NDelt: Number of pixels above, below, left and right of the point to check, in a square box.
+    :return: Boolean numpy array, True where the point is near a point of high extinction.
+    """
+    return highExtDistances[np.asarray(py, dtype=int), np.asarray(px, dtype=int)] <= NDelt
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def getHighExtBoxMaxima(data, NDelt):
+    """
+    Finds the highest extinction within the box around every pixel. A point is near a point of high extinction, as
+    checked by IsNearHighExt, for every high extinction threshold below this value, so the check can be repeated for any
+    number of thresholds without looking at the data again.
+    :param data: The extinction dataset in question
+    :param NDelt: Number of pixels above, below, left and right of the point to check, in a square box.
+    :return: A 2d numpy array of the highest finite value in the box around every pixel. -inf if there is none.
+    """
+    finiteData = np.where(np.isnan(data), -np.inf, data)
+    return ndimage.maximum_filter(finiteData, size=2 * int(NDelt) + 1, mode='constant', cval=-np.inf)
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def getQuadrantLabels(X, Y, m, b, m2, b2):
+    '''
+    Given a set of points, finds the quadrant each is in, as divided by two lines.
+    :param X: The x coordinates of the points. A numpy array or pandas Series.
+    :param Y: The y coordinates of the points. A numpy array or pandas Series.
+    :param m: The slope of the first line
+    :param b: The y offset of the first line.
+    :param m2: The slope of the second line.
+    :param b2: The y offset of the second line.
+    :return: A numpy array of the quadrant of each point: 1 if above both lines, 2 if above only the first, 3 if above
+        only the second and 4 if above neither.
+    '''
+    aboveLine1 = isPointAboveLine(np.asarray(X), np.asarray(Y), m, b)
+    aboveLine2 = isPointAboveLine(np.asarray(X), np.asarray(Y), m2, b2)
+    return 1 + 2 * (~aboveLine1).astype(int) + (~aboveLine2).astype(int)
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def groupQuadrants(ind, quadrants):
+    '''
+    Given a set of points and their quadrant labels, sorts them into quadrants.
+    :param ind: The indexes of the points.
+    :param quadrants: A pandas Series of the quadrant of the points, indexed like ind. See getQuadrantLabels.
+    :return: Q1, Q2, Q3, Q4 - Four lists which contain the indexes sorted into the four quadrants, in the order of ind.
+    '''
+    ind = list(ind)
+    labels = quadrants.loc[ind].to_numpy()
+    return tuple(np.asarray(ind)[labels == quadrant].tolist() for quadrant in range(1, 5))
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def getQuadrantWeights(membership, quadrants):
+    '''
+    Finds the weights which give each quadrant equal weight, for many sets of points at once.
+    :param membership: Boolean numpy array (number of sets x number of points); True where a point is in a set.
+    :param quadrants: A numpy array of the quadrant of each point. See getQuadrantLabels.
+    :return: A numpy array of the shape of membership; one over the number of points of the set in the quadrant of
+        the point, or 0 where the point is not in the set.
+    '''
+    membership = np.atleast_2d(np.asarray(membership, dtype=bool))
+    quadrants = np.asarray(quadrants, dtype=int)
+    quadrantCounts = membership.astype(int) @ (quadrants[:, np.newaxis] == np.arange(5)[np.newaxis, :])
+    with np.errstate(divide='ignore'):
+        return np.where(membership, 1.0 / quadrantCounts[:, quadrants], 0.0)
 # -------- FUNCTION DEFINITION --------
 
 # -------- FUNCTION DEFINITION --------
@@ -179,26 +361,9 @@ def sortQuadrants(ind, X, Y, m, b, m2, b2):
     :param b2: The y offset of the second line.
     :return: Q1, Q2, Q3, Q4 - Four lists which contain the indexes sorted into the four quadrants.
     '''
-    Q1 = []
-    Q2 = []
-    Q3 = []
-    Q4 = []
-    for i in ind:
-        px = X[i]
-        py = Y[i]
-        # ---- Sort into quadrant
-        aboveLine1 = isPointAboveLine(px, py, m, b)
-        aboveLine2 = isPointAboveLine(px, py, m2, b2)
-
-        if aboveLine1 and aboveLine2:
-            Q1.append(i)
-        elif aboveLine1 and not aboveLine2:
-            Q2.append(i)
-        elif not aboveLine1 and aboveLine2:
-            Q3.append(i)
-        elif not aboveLine1 and not aboveLine2:
-            Q4.append(i)
-    return Q1, Q2, Q3, Q4
+    ind = list(ind)
+    labels = getQuadrantLabels(np.asarray(X.loc[ind]), np.asarray(Y.loc[ind]), m, b, m2, b2)
+    return groupQuadrants(ind, pd.Series(labels, index=ind))
 # -------- FUNCTION DEFINITION --------
 
 # -------- FUNCTION DEFINITION --------
@@ -215,7 +380,44 @@ def averageBox(px, py, data, NDelt):
     ind_xmin, ind_xmax, ind_ymin, ind_ymax = getBoxBound(px, py, data, NDelt)
     # ---- Find the box range for the given point.
 
-    # ---- Select the relevant data range and check if any point is greater than the threshold.
-    locData = copy.deepcopy(data[ind_ymin:ind_ymax, ind_xmin:ind_xmax])
-    return np.average(locData)
+    # ---- Select the relevant data range and average it.
+    return np.average(data[ind_ymin:ind_ymax, ind_xmin:ind_xmax])
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def getRejectionFlags(isNearHighExt, isFarHighExt, isAnomalousRM, maxRefPoints):
+    """
+    Combines the filter criteria of the potential reference points into rejection flags.
+    :param isNearHighExt: Boolean numpy array, True for points rejected as near a region of high extinction.
+    :param isFarHighExt: Boolean numpy array, True for points rejected as far from any region of high extinction.
+    :param isAnomalousRM: Boolean numpy array, True for points rejected as having an anomalous rotation measure.
+    :param maxRefPoints: The maximum number of points which may remain. Points are taken in the order given, which
+        should be that of increasing extinction; the points after that are rejected for the maximum fraction.
+    :return: Numpy array of the rejection flags of the points. See REJECTION_FLAGS.
+    """
+    flags = REJECTED_NEAR_HIGH_EXT * np.asarray(isNearHighExt, dtype=int) \
+        | REJECTED_FAR_HIGH_EXT * np.asarray(isFarHighExt, dtype=int) \
+        | REJECTED_ANOMALOUS_RM * np.asarray(isAnomalousRM, dtype=int)
+    isRemaining = flags == 0
+    flags[isRemaining & (np.cumsum(isRemaining) > maxRefPoints)] |= REJECTED_MAX_FRACTION
+    return flags
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def getRemainingRefPoints(refPoints):
+    """
+    :param refPoints: A table of potential reference points with the REJECTION_FLAGS column.
+    :return: The points which are not rejected, in the same order, indexed from 0.
+    """
+    return refPoints.loc[refPoints[REJECTION_FLAGS] == 0].reset_index(drop=True)
+# -------- FUNCTION DEFINITION --------
+
+# -------- FUNCTION DEFINITION --------
+def getRejectedRefPoints(refPoints, flags=REJECTED_NEAR_HIGH_EXT | REJECTED_FAR_HIGH_EXT | REJECTED_ANOMALOUS_RM):
+    """
+    :param refPoints: A table of potential reference points with the REJECTION_FLAGS column.
+    :param flags: The rejection flags to select. Points with any of them set are returned.
+    :return: The points rejected for any of the flags, in the same order.
+    """
+    return refPoints.loc[(refPoints[REJECTION_FLAGS] & flags) != 0]
 # -------- FUNCTION DEFINITION --------
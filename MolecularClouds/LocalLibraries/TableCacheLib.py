@@ -0,0 +1,118 @@
+'''
+This module contains a size-bounded disk cache of numeric tables, keyed by a hash of everything a table was made from.
+
+- Every table is kept as one .npz file named by its key, written through a temporary file so a table is either fully
+    written or not there at all.
+- Reading a table marks it as the most recently used, by updating the modification time of its file. When the cache
+    grows past its size limit, the least recently used tables are removed first.
+- A cache with a size limit of 0 is disabled; nothing is read from or written to it.
+'''
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from .MatchStoreLib import hashValues
+
+TABLE_EXTENSION = '.npz'
+
+
+def hashTable(table):
+    '''
+    Hashes the contents of a pandas table, including its column names and index, for use in a key.
+    :param table: A pandas DataFrame.
+    :return: A hex digest. String.
+    '''
+    return hashValues([str(column) for column in table.columns],
+                      pd.util.hash_pandas_object(table, index=True).to_numpy())
+
+
+def hashFile(path):
+    '''
+    Hashes the contents of a file, for use in a key.
+    :param path: Path to the file.
+    :return: A hex digest. String.
+    '''
+    with open(path, 'rb') as hashedFile:
+        return hashValues(np.frombuffer(hashedFile.read(), dtype=np.uint8))
+
+
+class TableCache:
+    def __init__(self, directory, maxBytes):
+        '''
+        Opens the table cache in a directory. The directory is only created once a table is stored.
+        :param directory: The directory of the cache.
+        :param maxBytes: The most disk space the cached tables may take, in bytes. 0 disables the cache.
+        '''
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.numHits = 0
+        self.numMisses = 0
+
+    @property
+    def enabled(self):
+        return self.maxBytes > 0
+
+    def _tablePath(self, key):
+        return os.path.join(self.directory, key + TABLE_EXTENSION)
+
+    def get(self, key):
+        '''
+        Loads a cached table, and marks it as the most recently used.
+        :param key: The key of the table. See hashValues.
+        :return: The pandas DataFrame stored under the key, or None if there is none.
+        '''
+        path = self._tablePath(key)
+        if not self.enabled or not os.path.isfile(path):
+            self.numMisses += 1
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as tableFile:
+                table = pd.DataFrame(tableFile['values'], columns=list(tableFile['columns']), index=tableFile['index'])
+        except (OSError, ValueError, KeyError):
+            # An unreadable table is treated as missing, and is replaced when the table is stored again.
+            self.numMisses += 1
+            return None
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+        self.numHits += 1
+        return table
+
+    def put(self, key, table):
+        '''
+        Stores a numeric table under a key, then removes the least recently used tables until the cache fits its limit.
+        :param key: The key of the table. See hashValues.
+        :param table: A pandas DataFrame of numbers.
+        '''
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._tablePath(key)
+        tempPath = path + '.tmp'
+        # A text index is stored as fixed width strings, since object arrays cannot be loaded without pickling.
+        index = table.index.to_numpy()
+        index = index.astype(str) if index.dtype == object else index
+        with open(tempPath, 'wb') as tableFile:
+            np.savez(tableFile, values=table.to_numpy(dtype=float), columns=np.array([str(column) for column in table.columns]),
+                     index=index)
+        os.replace(tempPath, path)
+        self.evict()
+
+    def evict(self):
+        '''
+        Removes the least recently used tables until the cached tables take no more than the size limit.
+        '''
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(TABLE_EXTENSION):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+        totalBytes = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if totalBytes <= self.maxBytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            totalBytes -= size
@@ -0,0 +1,131 @@
+'''
+This module contains functions to evaluate the reference point selection for many extinction thresholds at once.
+
+- The matched points are sorted by extinction once, so the potential reference points of any threshold are a prefix of
+    that order.
+- Whether a point is near (or far from) high extinction is decided by the highest extinction in its box, found once per
+    box size, so no threshold needs to look at the extinction map again.
+- The reference values are those of all the remaining points, as when the optimal number of reference points is not
+    searched for; they show how the choice of threshold moves the result before the full analysis is run.
+'''
+import numpy as np
+import pandas as pd
+
+from . import RefJudgeLib as rjl
+
+# Columns of the arrays describing the matched points, sorted by extinction.
+POINT_COLUMNS = ['Extinction_Value', 'Rotation_Measure(rad/m2)', 'RM_Err(rad/m2)', 'Near_Box_Max', 'Far_Box_Max', 'Quadrant']
+
+SWEEP_COLUMNS = ['Extinction Threshold', 'High Extinction Threshold',
+                 'Number of Potential Reference Points', 'Number Near High Extinction', 'Number Far From High Extinction',
+                 'Number Anomalous', 'Number Beyond Max Fraction', 'Number of Remaining Points',
+                 'Q1 Points', 'Q2 Points', 'Q3 Points', 'Q4 Points', 'Undersampled Quadrants',
+                 'Reference Extinction', 'Reference RM', 'Reference RM AvgErr', 'Reference RM Std']
+
+
+def getSweepPoints(matchedData, nearBoxMaxima, farBoxMaxima, quadrants):
+    '''
+    Collects the arrays describing the matched points, sorted by extinction.
+    :param matchedData: The matched rm and extinction table.
+    :param nearBoxMaxima: The highest extinction within the near box around every pixel. See rjl.getHighExtBoxMaxima.
+    :param farBoxMaxima: The highest extinction within the far box around every pixel. See rjl.getHighExtBoxMaxima.
+    :param quadrants: Numpy array of the quadrant (1 to 4) of each matched point.
+    :return: A dictionary of POINT_COLUMNS: numpy array.
+    '''
+    order = np.argsort(matchedData['Extinction_Value'].to_numpy(), kind='stable')
+    px = matchedData['Extinction_Index_x'].to_numpy()[order]
+    py = matchedData['Extinction_Index_y'].to_numpy()[order]
+    return {'Extinction_Value': matchedData['Extinction_Value'].to_numpy(dtype=float)[order],
+            'Rotation_Measure(rad/m2)': matchedData['Rotation_Measure(rad/m2)'].to_numpy(dtype=float)[order],
+            'RM_Err(rad/m2)': matchedData['RM_Err(rad/m2)'].to_numpy(dtype=float)[order],
+            'Near_Box_Max': nearBoxMaxima[py, px].astype(float),
+            'Far_Box_Max': farBoxMaxima[py, px].astype(float),
+            'Quadrant': np.asarray(quadrants, dtype=int)[order]}
+
+
+def getReferenceValues(extinction, rm, rmErr, quadrants, weightingScheme):
+    '''
+    Finds the reference values of a set of reference points, as 03b does.
+    :param extinction: Numpy array of the extinction of the points.
+    :param rm: Numpy array of the rotation measure of the points.
+    :param rmErr: Numpy array of the rotation measure error of the points.
+    :param quadrants: Numpy array of the quadrant of the points.
+    :param weightingScheme: 'Quadrant' to give each quadrant equal weight, otherwise every point has equal weight.
+    :return: refExtinction, refRM, refRMAvgErr, refRMStd
+    '''
+    numPoints = len(rm)
+    if numPoints == 0:
+        return np.nan, np.nan, np.nan, np.nan
+    if weightingScheme == 'Quadrant':
+        weights = 1.0 / np.bincount(quadrants, minlength=5)[quadrants]
+        refRMStd = np.sqrt(np.cov(rm, aweights=weights)) / np.sqrt(numPoints) if numPoints > 1 else np.nan
+        return np.average(extinction, weights=weights), np.average(rm, weights=weights), \
+            np.average(rmErr, weights=weights), refRMStd
+    refRMStd = np.std(rm, ddof=1) / np.sqrt(numPoints) if numPoints > 1 else np.nan
+    return np.mean(extinction), np.mean(rm), np.mean(rmErr), refRMStd
+
+
+def evaluateThreshold(points, threshold, settings):
+    '''
+    Filters the potential reference points of one extinction threshold as 03a does, and finds their reference values.
+    :param points: A dictionary of POINT_COLUMNS: numpy array. See getSweepPoints.
+    :param threshold: The extinction threshold.
+    :param settings: A dictionary of the filter settings: highExtinctionThreshMultiplier, useNearExtinctionRemove,
+        useFarExtinctionRemove, anomalousIQRNum, useAnomalousRemove, maxRefPoints, weightingScheme and
+        minPointsPerQuadrant.
+    :return: A dictionary of SWEEP_COLUMNS: value.
+    '''
+    highExtinctionThreshold = settings['highExtinctionThreshMultiplier'] * threshold
+    numPotential = int(np.searchsorted(points['Extinction_Value'], threshold, side='right'))
+    rm = points['Rotation_Measure(rad/m2)'][:numPotential]
+
+    # ---- The criteria of 03a, for the potential reference points of this threshold.
+    isNearHighExt = points['Near_Box_Max'][:numPotential] > highExtinctionThreshold
+    isFarHighExt = ~(points['Far_Box_Max'][:numPotential] > highExtinctionThreshold)
+    isAnomalousRM = np.zeros(numPotential, dtype=bool)
+    if numPotential > 0:
+        rmMedian = np.median(rm)
+        rmIQR = np.percentile(rm, 75) - np.percentile(rm, 25)
+        isAnomalousRM = (rm < rmMedian - settings['anomalousIQRNum'] * rmIQR) | (rm > rmMedian + settings['anomalousIQRNum'] * rmIQR)
+    flags = rjl.getRejectionFlags(isNearHighExt & settings['useNearExtinctionRemove'],
+                                  isFarHighExt & settings['useFarExtinctionRemove'],
+                                  isAnomalousRM & settings['useAnomalousRemove'],
+                                  settings['maxRefPoints'])
+    isRemaining = flags == 0
+    # ---- The criteria of 03a.
+
+    quadrants = points['Quadrant'][:numPotential][isRemaining]
+    quadrantCounts = np.bincount(quadrants, minlength=5)[1:5]
+    refExtinction, refRM, refRMAvgErr, refRMStd = getReferenceValues(points['Extinction_Value'][:numPotential][isRemaining],
+                                                                     rm[isRemaining],
+                                                                     points['RM_Err(rad/m2)'][:numPotential][isRemaining],
+                                                                     quadrants, settings['weightingScheme'])
+    return {'Extinction Threshold': threshold,
+            'High Extinction Threshold': highExtinctionThreshold,
+            'Number of Potential Reference Points': numPotential,
+            'Number Near High Extinction': int(np.sum((flags & rjl.REJECTED_NEAR_HIGH_EXT) != 0)),
+            'Number Far From High Extinction': int(np.sum((flags & rjl.REJECTED_FAR_HIGH_EXT) != 0)),
+            'Number Anomalous': int(np.sum((flags & rjl.REJECTED_ANOMALOUS_RM) != 0)),
+            'Number Beyond Max Fraction': int(np.sum((flags & rjl.REJECTED_MAX_FRACTION) != 0)),
+            'Number of Remaining Points': int(np.sum(isRemaining)),
+            'Q1 Points': quadrantCounts[0],
+            'Q2 Points': quadrantCounts[1],
+            'Q3 Points': quadrantCounts[2],
+            'Q4 Points': quadrantCounts[3],
+            'Undersampled Quadrants': int(np.sum(quadrantCounts < settings['minPointsPerQuadrant'])),
+            'Reference Extinction': refExtinction,
+            'Reference RM': refRM,
+            'Reference RM AvgErr': refRMAvgErr,
+            'Reference RM Std': refRMStd}
+
+
+def sweepThresholds(points, thresholds, settings):
+    '''
+    Evaluates the reference point selection for each of a list of extinction thresholds.
+    :param points: A dictionary of POINT_COLUMNS: numpy array. See getSweepPoints.
+    :param thresholds: A list of extinction thresholds.
+    :param settings: A dictionary of the filter settings. See evaluateThreshold.
+    :return: A pandas DataFrame with one row of SWEEP_COLUMNS per threshold, in the order given.
+    '''
+    rows = [evaluateThreshold(points, threshold, settings) for threshold in thresholds]
+    return pd.DataFrame(rows, columns=SWEEP_COLUMNS)
@@ -16,6 +16,7 @@ useFillExtinct = configStartSettings['Judgement - Extinction Map'].getboolean('U
 doInterpExtinct = configStartSettings['Judgement - Extinction Map'].getboolean('Interpolate Negative Extinction Values')
 interpRegion = configStartSettings['Judgement - Extinction Map'].get('Interpolate Area')
 interpMethod = configStartSettings['Judgement - Extinction Map'].get('Interpolation Method')
+interpBorderWidth = configStartSettings['Judgement - Extinction Map'].getint('Interpolation Border Width')
 
 offDiskLatitude = configStartSettings['Judgement - Off Points Av Threshold'].getfloat('Off-Disk Latitude')
 avgExtMultiplier = configStartSettings['Judgement - Off Points Av Threshold'].getboolean('Multiply with Average Extinction')
@@ -35,6 +36,9 @@ useanomalousIQRNumRemove = configStartSettings['Judgement - Anomalous Off RM Val
 UseOptRefPoints = configStartSettings['Judgement - Optimal Reference Points'].getboolean('Find Optimal Reference Points')
 minRefPoints = configStartSettings['Judgement - Optimal Reference Points'].getint('Minimum Reference Points to be Selected')
 maxFracPointNum = configStartSettings['Judgement - Optimal Reference Points'].getfloat('Max Fraction Reference Points')
+stabilityThresholdMode = configStartSettings['Judgement - Optimal Reference Points'].get('Stability Threshold Mode')
+numStabilityThresholds = configStartSettings['Judgement - Optimal Reference Points'].getint('Number of Stability Thresholds')
+refPointSearch = configStartSettings['Judgement - Optimal Reference Points'].get('Reference Point Search')
 
 useQuadrantEnforce = configStartSettings['Judgement - Cloud Quadrant Sampling'].getboolean('Use Minimum Quadrant Sampling')
 minPointsPerQuadrant = configStartSettings['Judgement - Cloud Quadrant Sampling'].getint('Minimum Points Per Quadrant')
@@ -45,9 +49,15 @@ onPtsExtMultipleThreshold = configStartSettings['Judgement - On Point Extinction
 negScaledExtOption = configStartSettings['Judgement - Magnetic Field Calculations'].get("Negative Scaled Extinction Data")
 
 useUncertaintyNans = configStartSettings['Judgement - Uncertainty Calculations'].getboolean("Use Nans in Uncertainty Calculations")
+useBootstrap = configStartSettings['Judgement - Uncertainty Calculations'].getboolean("Use Bootstrap Reference Point Uncertainty")
+numBootstrapSamples = configStartSettings['Judgement - Uncertainty Calculations'].getint("Number of Bootstrap Samples")
+bootstrapConfidence = configStartSettings['Judgement - Uncertainty Calculations'].getfloat("Bootstrap Confidence Interval")
+bootstrapSeed = configStartSettings['Judgement - Uncertainty Calculations'].getint("Bootstrap Seed")
 
 useUserRefPtsJudgement = configStartSettings['Judgement - User Judgement'].getboolean('Use Manual User Selection of Reference Points')
 
+sweepThresholds = [float(value) for value in configStartSettings['Judgement - Threshold Sweep'].get('Extinction Thresholds').split(',') if value.strip()]
+
 # Plotting Options
 textFix = configStartSettings['Plotting Options'].getboolean('Adjust Text Positions')
 
@@ -62,6 +72,11 @@ tempPlotMaxExtinct = configStartSettings['Plotting Options'].getfloat('Temperatu
 barPlotMaxOccupancyWidth = configStartSettings['Plotting Options'].getfloat('Bar Plot Max All Bars Occupancy Width (1.0 stops at the next tick)')
 barPlotIndividualBarWidthMultiplier = configStartSettings['Plotting Options'].getfloat('Bar Plot Single Bar Width Multiplier (>1.0 allows bars to overlap)')
 
+# Performance Options
+numWorkers = configStartSettings['Performance Options'].getint('Number of Worker Processes')
+matchChunkSize = configStartSettings['Performance Options'].getint('RM Matching Chunk Size')
+trendCacheSizeMB = configStartSettings['Performance Options'].getfloat('Stability Trend Cache Size (MB)')
+
 # Data Presentation
 dataSeparator = configStartSettings['Data Presentation'].get('Separator')
 dataSeparator = bytes(dataSeparator, "utf-8").decode("unicode_escape")
@@ -88,22 +103,22 @@ dir_finalData = configDirectoryAndNames['Output Directories'].get('Final Data')
 # Output Files
 file_rmMapping = configDirectoryAndNames['Output Files - Point Matching'].get('RM Map')
 file_RMExtinctionMatch = configDirectoryAndNames['Output Files - Point Matching'].get('Matched RM-Extinction')
+file_RMExtinctionMatchStore = configDirectoryAndNames['Output Files - Point Matching'].get('Matched RM-Extinction Store')
+file_RMExtinctionMatchChanges = configDirectoryAndNames['Output Files - Point Matching'].get('Matched RM-Extinction Changes')
 
 file_RegionThreshData = configDirectoryAndNames['Output Files - Point Filtering'].get('Region Threshold Data')
-file_RMExtinctionNearRej = configDirectoryAndNames['Output Files - Point Filtering'].get('Rejected Near High-Extinction RM-Extinction')
-file_RMExtinctionFarRej = configDirectoryAndNames['Output Files - Point Filtering'].get('Rejected Far High-Extinction RM-Extinction')
-file_RMExtinctionAnomRej = configDirectoryAndNames['Output Files - Point Filtering'].get('Rejected Anomalous RM-Extinction')
-file_RMExtinctionRej = configDirectoryAndNames['Output Files - Point Filtering'].get('Rejected RM-Extinction')
-file_RMExtinctionFiltered = configDirectoryAndNames['Output Files - Point Filtering'].get('Filtered RM-Extinction')
 
 file_allPotRefPoints = configDirectoryAndNames['Output Files - Reference Points'].get('All Potential Reference Points')
 file_StabilityTrendRefPoints = configDirectoryAndNames['Output Files - Reference Points'].get('Stability Trend Reference Points')
+file_StabilityTrendCache = configDirectoryAndNames['Output Files - Reference Points'].get('Stability Trend Cache')
 file_QuadDivData = configDirectoryAndNames['Output Files - Reference Points'].get('Quadrant Division Data')
 file_OptRefStabPlot = configDirectoryAndNames['Output Files - Reference Points'].get('Optimal Reference Points Stability Plot')
 file_SelRefStabPlot = configDirectoryAndNames['Output Files - Reference Points'].get('Chosen Reference Points Stability Plot')
 file_QuadRefPlot = configDirectoryAndNames['Output Files - Reference Points'].get('Potential Reference Points Quadrant Plot')
 file_selRefPoints = configDirectoryAndNames['Output Files - Reference Points'].get('Selected Reference Points')
 file_refData = configDirectoryAndNames['Output Files - Reference Points'].get('Reference Data')
+file_refInfluence = configDirectoryAndNames['Output Files - Reference Points'].get('Reference Point Influence')
+file_ThresholdSweepData = configDirectoryAndNames['Output Files - Reference Points'].get('Threshold Sweep Data')
 
 plotName_AllMatchedRMPtsPlot = configDirectoryAndNames['Output Files - Reference Point Plot Titles'].get('All Matched RM-Extinction Points')
 plotName_AllPotRefPtsPlot = configDirectoryAndNames['Output Files - Reference Point Plot Titles'].get('All Potential Reference Points')
@@ -136,6 +151,7 @@ file_BLOSTempUncertaintyPlot = configDirectoryAndNames['Output Files - BLOS Unce
 file_BLOSPointData = configDirectoryAndNames['Output Files - BLOS Final'].get('BLOS Point Data')
 file_BLOSPointFig = configDirectoryAndNames['Output Files - BLOS Final'].get('BLOS Point Figure')
 file_BLOSUncertainty = configDirectoryAndNames['Output Files - BLOS Final'].get('BLOS Uncertainties')
+file_BLOSBootstrap = configDirectoryAndNames['Output Files - BLOS Final'].get('BLOS Bootstrap Intervals')
 
 file_logscript01 = configDirectoryAndNames['Output Files - Logs'].get('01')
 file_logscript02a = configDirectoryAndNames['Output Files - Logs'].get('02a')
@@ -143,6 +159,7 @@ file_logscript02b = configDirectoryAndNames['Output Files - Logs'].get('02b')
 file_logscript03a = configDirectoryAndNames['Output Files - Logs'].get('03a')
 file_logscript03b = configDirectoryAndNames['Output Files - Logs'].get('03b')
 file_logscript03c = configDirectoryAndNames['Output Files - Logs'].get('03c')
+file_logscript03d = configDirectoryAndNames['Output Files - Logs'].get('03d')
 file_logscript04 = configDirectoryAndNames['Output Files - Logs'].get('04')
 file_logscript05a = configDirectoryAndNames['Output Files - Logs'].get('05a')
 file_logscript05b = configDirectoryAndNames['Output Files - Logs'].get('05b')
@@ -182,18 +199,16 @@ CloudIntermediateDataDir = os.path.join(CloudOutputDir, dir_intermediateData)
 CloudFinalDataDir = os.path.join(CloudOutputDir, dir_finalData)
 
 MatchedRMExtinctionFile = os.path.join(CloudFinalDataDir, file_RMExtinctionMatch)
+MatchedRMExtinctionStoreDir = os.path.join(CloudIntermediateDataDir, file_RMExtinctionMatchStore)
+MatchedRMExtinctionChangesFile = os.path.join(CloudIntermediateDataDir, file_RMExtinctionMatchChanges)
 AllPotRefPointFile = os.path.join(CloudFinalDataDir, file_allPotRefPoints)
 
-FilteredRefPointsFile = os.path.join(CloudIntermediateDataDir, file_RMExtinctionFiltered)
 ExtinctionCoordDataFile = os.path.join(CloudIntermediateDataDir, file_RegionThreshData)
 
-NearExtinctRefPointFile = os.path.join(CloudIntermediateDataDir, file_RMExtinctionNearRej)
-FarExtinctRefPointFile = os.path.join(CloudIntermediateDataDir, file_RMExtinctionFarRej)
-AnomRefPointFile = os.path.join(CloudIntermediateDataDir, file_RMExtinctionAnomRej)
-RejRefPointFile = os.path.join(CloudIntermediateDataDir, file_RMExtinctionRej)
-
 ChosenRefPointFile = os.path.join(CloudFinalDataDir, file_selRefPoints) #Matched RM-Extinction points chosen as reference points - point data
 ChosenRefDataFile = os.path.join(CloudFinalDataDir, file_refData) #Matched RM-Extinction points chosen as reference points - summary statistics such as average extinction, RM, etc.
+RefPointInfluenceFile = os.path.join(CloudFinalDataDir, file_refInfluence) #How much the reference values and BLOS values change when each chosen reference point is left out.
+ThresholdSweepDataFile = os.path.join(CloudIntermediateDataDir, file_ThresholdSweepData) #Reference point filtering and reference values evaluated for a list of extinction thresholds.
 
 AllPotRefPtsPlotFile = os.path.join(CloudPlotsDir, file_AllPotRefPtsPlot)
 NearHighExtRejPlotFile = os.path.join(CloudPlotsDir, file_NearHighExtRejPlot)
@@ -206,10 +221,12 @@ AllRefAndRejPlotFile = os.path.join(CloudPlotsDir, file_AllRefAndRejPlot)
 ExtinctionPlotFile = os.path.join(CloudPlotsDir, file_ExtRefPlot)
 
 StabilityTrendDataTablePath = os.path.join(CloudIntermediateDataDir, file_StabilityTrendRefPoints)
+StabilityTrendCacheDir = os.path.join(CloudIntermediateDataDir, file_StabilityTrendCache)
 QuadDivDataFile = os.path.join(CloudIntermediateDataDir, file_QuadDivData)
 
 BLOSPointsFile = os.path.join(CloudFinalDataDir, file_BLOSPointData)
 BLOSUncertaintyFile = os.path.join(CloudFinalDataDir, file_BLOSUncertainty)
+BLOSBootstrapFile = os.path.join(CloudFinalDataDir, file_BLOSBootstrap)
 
 MatchedRMExtinctionPlotFile = os.path.join(CloudPlotsDir, file_AllMatchedRMPtsPlot)
 QuadrantDivisionPlotFile = os.path.join(CloudPlotsDir, file_QuadRefPlot)
@@ -228,6 +245,7 @@ Script02bFile = os.path.join(CloudLogsDir, file_logscript02b)
 Script03aFile = os.path.join(CloudLogsDir, file_logscript03a)
 Script03bFile = os.path.join(CloudLogsDir, file_logscript03b)
 Script03cFile = os.path.join(CloudLogsDir, file_logscript03c)
+Script03dFile = os.path.join(CloudLogsDir, file_logscript03d)
 Script04File = os.path.join(CloudLogsDir, file_logscript04)
 Script05aFile = os.path.join(CloudLogsDir, file_logscript05a)
 Script05bFile = os.path.join(CloudLogsDir, file_logscript05b)